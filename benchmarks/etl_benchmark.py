@@ -0,0 +1,141 @@
+# Run from the repo root: python benchmarks/etl_benchmark.py [--races 300]
+# Times each ETL stage on synthetic data, then loads it all end to end, against
+# mongomock by default or a throwaway mongod with --mongo-uri. Results are written
+# as JSON, and compared with --baseline to catch regressions before deploying.
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "src"))
+
+import argparse
+import json
+import platform
+from datetime import UTC, datetime
+
+import mongomock
+import pymongo
+from mongomock.collection import BulkOperationBuilder
+from prefect.logging import disable_run_logger
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def use_database(uri: str | None) -> str:
+    """Point the shared Mongo client at the benchmark database, before it is imported"""
+    if uri:
+        client_class = pymongo.MongoClient
+
+        def connect(*args, **kwargs):
+            return client_class(uri, **kwargs)
+
+        pymongo.MongoClient = connect  # type: ignore[misc, assignment]
+        return uri
+
+    # pymongo 4.9+ passes sort to every update, which mongomock does not yet accept
+    add_update = BulkOperationBuilder.add_update
+
+    def add_update_without_sort(self, *args, sort=None, **kwargs):
+        return add_update(self, *args, **kwargs)
+
+    BulkOperationBuilder.add_update = add_update_without_sort  # type: ignore[method-assign]
+    pymongo.MongoClient = mongomock.MongoClient  # type: ignore[misc]
+    return "mongomock"
+
+
+def run(args: argparse.Namespace, database: str) -> dict:
+    import etl_stages
+    from synthetic import SyntheticData
+
+    from helpers.metrics import metrics
+
+    data = SyntheticData(horses=args.horses, seed=args.seed)
+    metrics.reset()
+
+    with disable_run_logger():
+        # mongomock cannot evaluate the partial index filters, nor needs indexes
+        etl_stages.reset_database(data, indexes=database != "mongomock")
+        inputs = etl_stages.time_transforms(data, args.races, args.ratings, args.pages)
+        etl_stages.time_racecourse_lookups(inputs["races"])
+        etl_stages.load_end_to_end(inputs)
+        etl_stages.time_horse_lookups(data)
+
+    return {
+        "benchmark": "etl",
+        "database": "mongomock" if database == "mongomock" else "mongod",
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {
+            "races": args.races,
+            "ratings": args.ratings,
+            "pages": args.pages,
+            "horses": args.horses,
+            "seed": args.seed,
+        },
+        "counts": etl_stages.collection_counts(),
+        "metrics": metrics.summary("etl_benchmark"),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Stages whose throughput fell by more than tolerance since the baseline"""
+    regressions = []
+    before = baseline["metrics"]["stages"]
+    for stage, after in results["metrics"]["stages"].items():
+        if stage not in before or not before[stage]["items_per_second"]:
+            continue
+
+        change = after["items_per_second"] / before[stage]["items_per_second"] - 1
+        print(f"{stage:32} {after['items_per_second']:>10} items/s {change:+.0%}")
+        if change < -tolerance:
+            regressions.append(stage)
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--races", type=int, default=300, help="races per API source")
+    parser.add_argument("--ratings", type=int, default=1000, help="BHA rating rows")
+    parser.add_argument("--pages", type=int, default=20, help="formdata pages")
+    parser.add_argument("--horses", type=int, default=2000, help="horses in the pool")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--mongo-uri",
+        help="a throwaway mongod, whose handykapp database is dropped; "
+        "mongomock if not given",
+    )
+    parser.add_argument("--output", type=Path, help="where to write the JSON results")
+    parser.add_argument("--baseline", type=Path, help="earlier results to compare")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="fail when a stage's throughput drops by more than this fraction",
+    )
+    args = parser.parse_args()
+
+    results = run(args, use_database(args.mongo_uri))
+
+    output = args.output or RESULTS_DIR / (
+        f"etl_{results['database']}_{datetime.now(UTC):%Y%m%dT%H%M%S}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Wrote {output}")
+
+    for stage, timings in results["metrics"]["stages"].items():
+        print(
+            f"{stage:32} {timings['calls']:>7} calls {timings['seconds']:>9.3f}s "
+            f"(self {timings['self_seconds']:.3f}s) {timings['items_per_second']} items/s"
+        )
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if regressions := compare(results, baseline, args.tolerance):
+            print(f"Throughput regressed for: {', '.join(regressions)}")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+# The ETL stages timed by etl_benchmark.py. Import only once the database is chosen,
+# as the clients connect on import
+import datetime
+
+import petl  # type: ignore
+from synthetic import SyntheticData
+
+from clients import mongo_client as client
+from clients.mongo_client import (
+    get_horse,
+    get_racecourse_id,
+    horse_cache,
+    refresh_racecourses,
+)
+from helpers.metrics import metrics
+from loaders.bha_loader import transform_ratings_table
+from loaders.main_loader import spec_database
+from models import PreMongoHorse, PreMongoRace
+from processors.formdata_processors.page_processor import page_processor
+from processors.ratings_processor import ratings_processor
+from processors.record_processor import record_processor
+from transformers.formdata_transformer import create_run
+from transformers.rapid_horseracing_transformer import transform_results
+from transformers.theracingapi_transformer import transform_races
+
+db = client.handykapp
+
+RATINGS_DATE = datetime.date(2024, 1, 1)
+
+
+def reset_database(data: SyntheticData, *, indexes: bool = True) -> None:
+    client.drop_database("handykapp")
+    if indexes:
+        spec_database.fn()
+    db.racecourses.insert_many(data.racecourses())
+    refresh_racecourses()
+    horse_cache.clear()
+
+
+def time_transforms(
+    data: SyntheticData, races: int, ratings: int, pages: int
+) -> dict[str, list]:
+    """Transform every source, returning the inputs and races the later stages use"""
+    rapid_records = data.rapid_records(races)
+    racecards = data.theracingapi_racecards(races)
+    ratings_csv = data.bha_ratings_csv(ratings)
+    formdata_pages = data.formdata_pages(pages)
+
+    # The transformers record their own timings
+    rapid_races = [
+        race for record in rapid_records for race in transform_results(record)
+    ]
+    racecard_races = [race for record in racecards for race in transform_races(record)]
+    list(
+        transform_ratings_table(
+            petl.fromcsv(petl.MemorySource(ratings_csv)), RATINGS_DATE
+        )
+    )
+
+    run_lines = [
+        data.formdata_run_line(horse).split(" ")
+        for horse in data.field(min(races, 500))
+    ]
+    with metrics.time("transform.formdata_run", items=len(run_lines)):
+        for words in run_lines:
+            create_run(words)
+
+    return {
+        "rapid_records": rapid_records,
+        "racecards": racecards,
+        "ratings_csv": [ratings_csv],
+        "formdata_pages": formdata_pages,
+        "races": [(race, "rapid") for race in rapid_races]
+        + [(race, "theracingapi") for race in racecard_races],
+    }
+
+
+def time_racecourse_lookups(races: list[tuple[PreMongoRace, str]]) -> None:
+    refresh_racecourses()
+    for race, source in races:
+        with metrics.time("get_racecourse_id"):
+            get_racecourse_id(race.to_course_details(), race.datetime, source)
+
+
+def time_horse_lookups(data: SyntheticData) -> None:
+    """Look every horse up twice, first against an empty cache"""
+    horses = [
+        PreMongoHorse(name=horse.name.upper(), country=horse.country, year=horse.year)
+        for horse in data.horses
+    ]
+    horse_cache.clear()
+    for stage in ("get_horse.cold", "get_horse.warm"):
+        for horse in horses:
+            with metrics.time(stage):
+                get_horse(horse)
+
+
+def load_end_to_end(inputs: dict[str, list]) -> None:
+    """Load every source in turn, as nuclear_reload does, through the real processors"""
+    with metrics.time("end_to_end.rapid", items=len(inputs["rapid_records"])):
+        r = record_processor()
+        next(r)
+        for record in inputs["rapid_records"]:
+            r.send((record, transform_results, f"{record.id_race}.json", "rapid"))
+        r.close()
+
+    with metrics.time("end_to_end.theracingapi", items=len(inputs["racecards"])):
+        r = record_processor()
+        next(r)
+        for record in inputs["racecards"]:
+            r.send((record, transform_races, f"{record.date}.json", "theracingapi"))
+        r.close()
+
+    [ratings_csv] = inputs["ratings_csv"]
+    with metrics.time("end_to_end.bha", items=ratings_csv.count(b"\n")):
+        r = ratings_processor()
+        next(r)
+        table = petl.fromcsv(petl.MemorySource(ratings_csv))
+        for horse in transform_ratings_table(table, RATINGS_DATE):
+            r.send(horse)
+        r.close()
+
+    with metrics.time("end_to_end.formdata", items=len(inputs["formdata_pages"])):
+        p = page_processor()
+        next(p)
+        for page in inputs["formdata_pages"]:
+            p.send(page)
+        p.close()
+
+
+def collection_counts() -> dict[str, int]:
+    return {
+        name: db[name].count_documents({})
+        for name in ("racecourses", "races", "horses", "people")
+    }
@@ -0,0 +1,162 @@
+# Run from the repo root: python benchmarks/formdata_run_benchmark.py
+# Compares create_run with the version that re-indexed its word list per field
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "src"))
+
+import timeit
+
+import pendulum
+from prefect import get_run_logger
+from prefect.logging import disable_run_logger
+from synthetic import SyntheticData
+
+from models import FormdataRun
+from transformers.formdata_transformer import (
+    create_run,
+    extract_dist_going,
+    extract_middle_details,
+    extract_prize,
+    extract_rating,
+    extract_weight,
+    tokenize_run_line,
+)
+
+RUN_LINES = [
+    line.split(" ")
+    for line in (
+        "10Jun23 2CG 1156 Asc 8 9-13 JFanning 3 1.5 115 6G 120",
+        "10Jun23 2CG1156 Asc 8 9-13t3RyanSexton 3 1.5 115 6G 120 ",
+        "10Jun23 3H 4500 Asc 8 10-0 JFanning 2p3*1.5 115 6G 120",
+        "10Jun23 3H 4500 Asc 8 10-0 tJFanning 2p31.5 115 6G 120",
+        "10Jun23 2CG 1156 Asc 8 9-13 JFanning p p19 6G -",
+    )
+]
+
+
+def previous_create_run(words: list[str]) -> FormdataRun | None:
+    logger = get_run_logger()
+    try:
+        # Handle extra empty string at end of some lines
+        words = words if words[-1] != "" else words[:-1]
+
+        # Handle cases where words are insufficiently split
+        words = " ".join(words).split(" ")
+
+        # Handle odd case of Phoenix Dawn (missing data)
+        if len(words) == 10 and words[6:] == ["b", "RHavlin", "p", "p12"]:
+            words = [*words[:9], "", "p12", "16d", "p12"]
+
+        # Handle odd case of Arctic Mountain (incorrect data - says placed when dsq)
+        if len(words) == 12 and words[7] == "14p940.0":
+            words = [*words[:7], "14d", "40.0", *words[8:]]
+
+        # Split overlong prize money
+        if len(words[1]) > 5:
+            racetype, prize = extract_prize(words[1]) or ("", "")
+            words[1] = racetype
+            words.insert(2, prize)
+
+        # Split conjoined weight
+        if (len(words[5]) > 5 and words[5][0].isdigit() and "-" in words[5][:3]) or (
+            len(words[5]) == 5 and not words[5][-1].isdigit()
+        ):
+            weight, jockey = extract_weight(words[5]) or ("", "")
+            words[5] = weight
+            words.insert(6, jockey)
+
+        # Split conjoined finishing distance
+        for i, word in enumerate(words[7:10]):
+            if "p" in word and ("*" in word or "." in word):
+                position, beaten_distance = (
+                    word.split("*") if "*" in word else (word[:3], word[3:])
+                )
+                words[7 + i] = position
+                words.insert(8 + i, f"-{beaten_distance}")
+
+        # Join non-finishing jump_details
+        indices_to_join = []
+        for i, word in enumerate(words[-5:-1]):
+            if word in ["-", "n", "o"] and words[-5 + i + 1] in ["b", "c", "h"]:
+                indices_to_join.append(-5 + i)
+
+        for index in indices_to_join:
+            words = (
+                words[:index]
+                + ["".join(words[index : index + 2])]
+                + (words[index + 2 :] if index < -3 else [])
+            )
+
+        # Join jockey details to be processed separately
+        flat_non_finisher = any(
+            letter in words[-4] for letter in ["b", "f", "n", "p", "u"]
+        )
+        joined_middle = "".join(
+            words[6:-3] if flat_non_finisher and words[-4] != "alone" else words[6:-4]
+        )
+        middle_details = extract_middle_details(joined_middle)
+
+        if not middle_details:
+            raise ValueError(f"Insufficient detail in middle of run: {middle_details}")
+
+        (dist, going) = extract_dist_going(words[-2]) or (None, None)
+
+        if not dist or not going:
+            raise ValueError("Insufficient detail in distance or going")
+
+        run = FormdataRun(
+            date=pendulum.from_format(words[0], "DDMMMYY").date().format("YYYY-MM-DD"),
+            race_type=words[1],
+            win_prize=words[2],
+            course=words[3],
+            number_of_runners=int(words[4]),
+            weight=words[5],
+            headgear=middle_details["headgear"],
+            allowance=middle_details["allowance"],
+            jockey=middle_details["jockey"],
+            position=middle_details["position"],
+            beaten_distance=float(words[-4].replace("*", "-"))
+            if "*" in words[-4]
+            else float(words[-4])
+            if "." in words[-4] and words[-4] != "w.o."
+            else None,
+            time_rating=extract_rating(words[-3]),
+            distance=dist,
+            going=going,
+            form_rating=extract_rating(words[-1]),
+        )
+    except Exception as e:
+        logger.error(f"Error creating run from {words}: {e}")
+        run = None
+
+    return run
+
+
+def benchmark(func, lines: list[list[str]], number: int) -> float:
+    """Best time per line in microseconds"""
+    timings = timeit.repeat(
+        lambda: [func(list(words)) for words in lines], number=number, repeat=5
+    )
+    return min(timings) / (number * len(lines)) * 1_000_000
+
+
+if __name__ == "__main__":
+    data = SyntheticData(horses=500)
+    generated = [data.formdata_run_line(horse).split(" ") for horse in data.horses * 2]
+
+    with disable_run_logger():
+        for name, lines, number in (
+            ("awkward lines", RUN_LINES, 2000),
+            ("generated lines", generated, 10),
+        ):
+            for words in lines:
+                assert create_run(list(words)) == previous_create_run(list(words))
+
+            tokenize = benchmark(tokenize_run_line, lines, number)
+            fast = benchmark(create_run, lines, number)
+            slow = benchmark(previous_create_run, lines, number)
+            print(
+                f"{name}: create_run {fast:.1f}us vs {slow:.1f}us previously "
+                f"({slow / fast:.1f}x), of which tokenize_run_line {tokenize:.1f}us"
+            )
@@ -0,0 +1,315 @@
+# Synthetic but realistic source data for the benchmarks, seeded so runs compare
+import random
+from dataclasses import dataclass
+
+import pendulum
+
+from models import RapidRecord, RapidRunner, TheRacingApiRacecard, TheRacingApiRunner
+
+SYLLABLES = [
+    "ar",
+    "bel",
+    "cor",
+    "dan",
+    "el",
+    "fa",
+    "gol",
+    "har",
+    "is",
+    "jin",
+    "ka",
+    "lor",
+    "mar",
+    "nor",
+    "os",
+    "per",
+    "quin",
+    "ros",
+    "sa",
+    "tor",
+    "ul",
+    "val",
+    "win",
+    "yar",
+    "zen",
+]
+FIRST_NAMES = [
+    "Adam",
+    "Ben",
+    "Callum",
+    "Daniel",
+    "Emma",
+    "Frankie",
+    "Georgia",
+    "Hollie",
+    "Jack",
+    "Kieran",
+    "Luke",
+    "Megan",
+    "Oisin",
+    "Paul",
+    "Rossa",
+    "Sean",
+    "Tom",
+    "William",
+]
+COUNTRIES = ("GB", "GB", "GB", "IRE", "IRE", "FR", "USA")
+TURF_GOINGS = ("Good", "Good To Firm", "Good To Soft", "Soft", "Heavy")
+DISTANCES = (("5f", 5.0), ("6f", 6.0), ("7f", 7.0), ("1m", 8.0), ("1m2f", 10.0))
+
+# name, formal name, surface, racing research code
+RACECOURSES = (
+    ("Ascot", "Ascot", "Turf", "Asc"),
+    ("Chester", "Chester", "Turf", "Chs"),
+    ("Doncaster", "Doncaster", "Turf", "Don"),
+    ("Haydock", "Haydock Park", "Turf", "Hay"),
+    ("Kempton", "Kempton Park", "Polytrack", "Kem"),
+    ("Lingfield", "Lingfield Park", "Polytrack", "Lin"),
+    ("Newcastle", "Newcastle", "Tapeta", "New"),
+    ("Sandown", "Sandown Park", "Turf", "San"),
+    ("Wolverhampton", "Wolverhampton", "Tapeta", "Wol"),
+    ("York", "York", "Turf", "Yor"),
+)
+
+
+@dataclass(frozen=True)
+class SyntheticHorse:
+    name: str
+    country: str
+    year: int
+    sex: str  # gelding, filly or colt
+    sire: str
+    dam: str
+    damsire: str
+
+
+class SyntheticData:
+    """A pool of horses and people that every source draws its runners from"""
+
+    def __init__(self, *, horses: int = 2000, people: int = 300, seed: int = 1):
+        self.rng = random.Random(seed)
+        sires = self.unique_names(max(horses // 20, 10))
+        dams = self.unique_names(max(horses // 4, 10))
+        self.horses = [
+            SyntheticHorse(
+                name=name,
+                country=self.rng.choice(COUNTRIES),
+                year=self.rng.randint(2015, 2020),
+                sex=self.rng.choice(("gelding", "filly", "colt")),
+                sire=self.rng.choice(sires),
+                dam=self.rng.choice(dams),
+                damsire=self.rng.choice(sires),
+            )
+            for name in self.unique_names(horses)
+        ]
+        self.rapid_ids = {horse: str(200000 + i) for i, horse in enumerate(self.horses)}
+        self.people = [
+            f"{self.rng.choice(FIRST_NAMES)} {name}"
+            for name in self.unique_names(people, syllables=(2, 2))
+        ]
+
+    def unique_names(
+        self, count: int, syllables: tuple[int, int] = (2, 4)
+    ) -> list[str]:
+        names: set[str] = set()
+        while len(names) < count:
+            name = "".join(
+                self.rng.choice(SYLLABLES) for _ in range(self.rng.randint(*syllables))
+            )
+            names.add(name.title())
+        return sorted(names)
+
+    def field(self, size: int) -> list[SyntheticHorse]:
+        return self.rng.sample(self.horses, size)
+
+    def person(self) -> str:
+        return self.rng.choice(self.people)
+
+    def race_time(self, day: int) -> pendulum.DateTime:
+        return pendulum.datetime(2023, 1, 1).add(
+            days=day, hours=self.rng.randint(13, 20), minutes=self.rng.choice((0, 30))
+        )
+
+    def racecourses(self) -> list[dict]:
+        return [
+            {
+                "name": name,
+                "formal_name": formal_name,
+                "surface": surface,
+                "code": "Flat",
+                "obstacle": None,
+                "country": "GB",
+                "references": {"racing_research": rr_code},
+            }
+            for name, formal_name, surface, rr_code in RACECOURSES
+        ]
+
+    def rapid_records(self, count: int) -> list[RapidRecord]:
+        records = []
+        for i in range(count):
+            course, _, surface, _ = self.rng.choice(RACECOURSES)
+            off = self.race_time(i // 30)
+            distance, _ = self.rng.choice(DISTANCES)
+            field = self.field(self.rng.randint(6, 14))
+            records.append(
+                RapidRecord(
+                    id_race=str(100000 + i),
+                    course=course,
+                    date=off.format("YYYY-MM-DD HH:mm:ss"),
+                    title=f"{course.upper()} {self.rng.choice(('HANDICAP', 'MAIDEN STAKES', 'NOVICE STAKES'))} (5)",
+                    distance=distance,
+                    age="3",
+                    going="Standard"
+                    if surface != "Turf"
+                    else self.rng.choice(TURF_GOINGS),
+                    finished=True,
+                    canceled=False,
+                    finish_time="",
+                    prize=f"£{self.rng.randint(2, 40) * 500}",
+                    **{"class": str(self.rng.randint(1, 6))},
+                    horses=[
+                        RapidRunner.model_validate(
+                            {
+                                "horse": f"{horse.name}({horse.country})",
+                                "id_horse": self.rapid_ids[horse],
+                                "jockey": self.person(),
+                                "trainer": self.person(),
+                                "age": str(off.year - horse.year),
+                                "weight": f"{self.rng.randint(8, 9)}-{self.rng.randint(0, 13)}",
+                                "number": str(number),
+                                "last_ran_days_ago": str(self.rng.randint(7, 90)),
+                                "non_runner": "0",
+                                "form": "1-2-3",
+                                "position": str(number),
+                                "distance_beaten": self.rng.choice(
+                                    ("nk", "1/2", "1 1/2", "3")
+                                ),
+                                "owner": f"{self.person()} Racing",
+                                "sire": horse.sire.upper(),
+                                "dam": f"{horse.dam.upper()}(FR)",
+                                "OR": str(self.rng.randint(50, 100)),
+                                "sp": str(self.rng.randint(2, 33)),
+                                "odds": [],
+                            }
+                        )
+                        for number, horse in enumerate(field, start=1)
+                    ],
+                )
+            )
+        return records
+
+    def theracingapi_racecards(self, count: int) -> list[TheRacingApiRacecard]:
+        racecards = []
+        for i in range(count):
+            course, _, surface, _ = self.rng.choice(RACECOURSES)
+            off = self.race_time(200 + i // 30)
+            _, furlongs = self.rng.choice(DISTANCES)
+            field = self.field(self.rng.randint(6, 14))
+            racecards.append(
+                TheRacingApiRacecard(
+                    course=f"{course} (AW)" if surface != "Turf" else course,
+                    date=off.to_date_string(),
+                    off_time=off.format("h:mm"),
+                    race_name=f"{self.person()} Memorial Handicap",
+                    distance_f=furlongs,
+                    region="GB",
+                    pattern="",
+                    race_class=f"Class {self.rng.randint(1, 6)}",
+                    type="Flat",
+                    age_band="3yo+",
+                    rating_band="0-75",
+                    prize=f"£{self.rng.randint(2, 40) * 500:,}",
+                    field_size=len(field),
+                    going="Standard"
+                    if surface != "Turf"
+                    else self.rng.choice(TURF_GOINGS),
+                    surface="AW" if surface != "Turf" else "Turf",
+                    runners=[
+                        TheRacingApiRunner.model_validate(
+                            {
+                                "horse": horse.name,
+                                "age": str(off.year - horse.year),
+                                "sex": horse.sex,
+                                "sex_code": horse.sex[0].upper(),
+                                "colour": self.rng.choice(("b", "br", "ch", "gr")),
+                                "region": horse.country,
+                                "dam": horse.dam,
+                                "sire": horse.sire,
+                                "damsire": horse.damsire,
+                                "trainer": self.person(),
+                                "owner": f"{self.person()} Racing",
+                                "number": str(number),
+                                "draw": str(number),
+                                "headgear": self.rng.choice(("", "", "b", "p", "t")),
+                                "lbs": str(self.rng.randint(115, 141)),
+                                "ofr": str(self.rng.randint(50, 100)),
+                                "jockey": self.person(),
+                                "last_run": str(self.rng.randint(7, 90)),
+                                "form": "476601",
+                            }
+                        )
+                        for number, horse in enumerate(field, start=1)
+                    ],
+                )
+            )
+        return racecards
+
+    def bha_ratings_csv(self, count: int) -> bytes:
+        """A ratings CSV as the BHA publishes it, for transform_ratings_table"""
+        sexes = {"gelding": "GELDING", "filly": "FILLY", "colt": "COLT"}
+        rows = [
+            "Name,Year,Sex,Sire,Dam,Trainer,Flat rating,Diff Flat,Flat Clltrl,"
+            "AWT rating,Diff AWT,AWT Clltrl,Chase rating,Diff Chase,Chase Clltrl,"
+            "Hurdle rating,Diff Hurdle,Hurdle Clltrl"
+        ]
+        for horse in self.rng.sample(self.horses, min(count, len(self.horses))):
+            flat = self.rng.randint(40, 110)
+            rows.append(
+                f"{horse.name.upper()} ({horse.country}),{horse.year},{sexes[horse.sex]},"
+                f"{horse.sire.upper()} (GB),{horse.dam.upper()} (FR),{self.person()},"
+                f"{flat},,,{flat - self.rng.randint(0, 5)},,,,,,,,"
+            )
+        return "\n".join(rows).encode()
+
+    def formdata_pages(
+        self, count: int, horses_per_page: int = 8
+    ) -> list[tuple[str, pendulum.Date]]:
+        """Page texts as extracted from a formdata PDF, one word or field per line"""
+        date = pendulum.date(2024, 1, 1)
+        pages = []
+        for _ in range(count):
+            lines = ["FORMDATA FLAT 2024", "Horse", "Trainer", "Prize"]
+            for horse in self.rng.sample(self.horses, horses_per_page):
+                lines += [
+                    f"{horse.name.upper()} ({horse.country})",
+                    str(date.year - horse.year),
+                    self.person(),
+                    f"F{self.rng.randint(1, 5)}",
+                    f"£{self.rng.randint(0, 50000)}",
+                ]
+                for _ in range(self.rng.randint(1, 4)):
+                    lines += self.formdata_run_line(horse).split(" ")
+            pages.append(("\n".join(lines), date))
+        return pages
+
+    def formdata_run_line(self, horse: SyntheticHorse) -> str:
+        run_date = pendulum.date(2023, 1, 1).add(days=self.rng.randint(0, 300))
+        _, _, _, rr_code = self.rng.choice(RACECOURSES)
+        runners = self.rng.randint(6, 16)
+        jockey = self.person().split(" ")
+        return " ".join(
+            (
+                run_date.format("DMMMYY"),
+                f"{self.rng.randint(2, 6)}CG",
+                str(self.rng.randint(1000, 9999)),
+                rr_code,
+                str(runners),
+                f"{self.rng.randint(8, 9)}-{self.rng.randint(0, 13)}",
+                f"{jockey[0][0]}{jockey[1]}",
+                str(self.rng.randint(1, runners)),
+                self.rng.choice(("0.5", "1.5", "3")),
+                str(self.rng.randint(60, 120)),
+                f"{self.rng.randint(5, 12)}G",
+                str(self.rng.randint(60, 120)),
+            )
+        )
@@ -0,0 +1,455 @@
+# Run from the repo root: python benchmarks/transform_benchmark.py
+# Compares the per-row transforms with the one-row petl pipelines they replaced
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "src"))
+
+import datetime
+import operator
+import timeit
+from collections.abc import Callable
+
+import pendulum
+import petl  # type: ignore
+from horsetalk import (  # type: ignore
+    CoatColour,
+    Country,
+    Gender,
+    Headgear,
+    Horse,
+    HorseAge,
+    Horselength,
+    RaceWeight,
+    Sex,
+)
+from peak_utility.listish import compact
+from pydantic import BaseModel
+
+from helpers import horse_name_to_pre_mongo_horse
+from models import (
+    BHAPerfFigsRecord,
+    BHARatingsRecord,
+    FormdataRunner,
+    PreMongoHorse,
+    PreMongoRunner,
+    RapidRunner,
+    TheRacingApiRunner,
+)
+from transformers import (
+    bha_transformer,
+    formdata_transformer,
+    rapid_horseracing_transformer,
+    theracingapi_transformer,
+)
+from transformers.bha_transformer import (
+    PreMongoHorseWithHistoricRatings,
+    transform_historic_rating,
+)
+from transformers.formdata_transformer import adjust_rr_name
+from transformers.rapid_horseracing_transformer import standardise_name
+
+RACE_DATE = pendulum.datetime(2023, 10, 3)
+
+FORMDATA_RUNNER = FormdataRunner(
+    name="AADDEEY",
+    country="GB",
+    year=2018,
+    weight="10-0",
+    jockey="D Tudhope",
+    position="2p3",
+    beaten_distance=2.0,
+    time_rating=80,
+    form_rating=80,
+)
+
+RAPID_RUNNER = RapidRunner(
+    horse="Dobbin(IRE)",
+    id_horse="123456",
+    jockey="A Jockey",
+    trainer="A Trainer",
+    age=3,
+    weight="10-0",
+    number=1,
+    last_ran_days_ago=1,
+    non_runner=False,
+    form="1-2-3",
+    position="1",
+    distance_beaten="1 1/2",
+    owner="A Owner",
+    sire="THE SIRE",
+    dam="THE DAM(FR)",
+    OR="",
+    sp="8",
+)
+
+THERACINGAPI_RUNNER = TheRacingApiRunner(
+    horse="Hortzadar",
+    age=8,
+    sex="gelding",
+    sex_code="G",
+    colour="b",
+    region="GB",
+    dam="Clouds Of Magellan",
+    sire="Sepoy",
+    damsire="Dynaformer",
+    trainer="David Omeara",
+    owner="Akela Thoroughbreds Limited",
+    number="1",
+    draw=4,
+    headgear="",
+    lbs=141,
+    ofr=76,
+    jockey="Mark Winn(3)",
+    last_run="12",
+    form="476601",
+)
+
+PERF_FIGS_RECORD = BHAPerfFigsRecord(
+    date=datetime.date(2020, 1, 1),
+    racehorse="A DAY TO DREAM (IRE)",
+    yof=2020,
+    sex="GELDING",
+    trainer="Ollie Pears",
+    latest="T:55",
+    two_runs_ago="A:x",
+    three_runs_ago="H:101",
+    four_runs_ago="-",
+    five_runs_ago="-",
+    six_runs_ago="-",
+)
+
+RATINGS_RECORD = BHARatingsRecord(
+    date=datetime.date(2020, 1, 1),
+    name="A DAY TO DREAM (IRE)",
+    year=2020,
+    sex="GELDING",
+    sire="ADAAY (IRE)",
+    dam="TARA TOO (IRE)",
+    trainer="Ollie Pears",
+    flat_rating=49,
+    diff_flat=None,
+    flat_clltrl=None,
+    awt_rating=None,
+    diff_awt=None,
+    awt_clltrl=None,
+    chase_rating=None,
+    diff_chase=None,
+    chase_clltrl=None,
+    hurdle_rating=None,
+    diff_hurdle=None,
+    hurdle_clltrl=None,
+)
+
+
+def petl_formdata_horse(runner: FormdataRunner) -> PreMongoRunner:
+    data = petl.fromdicts([runner.model_dump()])
+    transformed_horse = (
+        petl.convert(
+            data,
+            {
+                "weight": lambda x: RaceWeight(x).lb,
+                "beaten_distance": lambda x: float(Horselength(x)) if x else None,
+                "jockey": lambda x: adjust_rr_name(x),
+            },
+        )
+        .rename(
+            {
+                "weight": "lbs_carried",
+            }
+        )
+        .addfield("finishing_position", lambda rec: rec["position"].split("p")[0])
+        .addfield(
+            "official_position",
+            lambda rec: (
+                rec["position"].split("p")[1]
+                if "p" in rec["position"]
+                else rec["finishing_position"]
+            ),
+        )
+        .cutout("position", "time_rating", "form_rating")
+        .dicts()[0]
+    )
+    return PreMongoRunner(**transformed_horse)
+
+
+def petl_rapid_horse(
+    runner: RapidRunner,
+    race_date: pendulum.DateTime = pendulum.now(),
+    finishing_time: str | None = None,
+) -> PreMongoRunner:
+    data = petl.fromdicts([runner.model_dump()])
+    transformed_horse = (
+        petl.rename(
+            data,
+            {
+                "id_horse": "rapid_id",
+                "weight": "lbs_carried",
+                "last_ran_days_ago": "days_since_prev_run",
+                "number": "saddlecloth",
+                "OR": "official_rating",
+                "distance_beaten": "beaten_distance",
+                "position": "finishing_position",
+            },
+        )
+        .convert(
+            {
+                "age": int,
+                "days_since_prev_run": int,
+                "official_rating": int,
+                "non_runner": lambda x: bool(int(x)),
+                "lbs_carried": lambda x: RaceWeight(x).lb,
+                "sp": lambda x: x or None,
+                "sire": lambda x: horse_name_to_pre_mongo_horse(
+                    x, sex="M", default_country="GB"
+                ),
+                "dam": lambda x: horse_name_to_pre_mongo_horse(
+                    x, sex="F", default_country="GB"
+                ),
+                "beaten_distance": lambda x: float(Horselength(x)) if x else None,
+                "jockey": lambda x: standardise_name(x),
+                "trainer": lambda x: standardise_name(x),
+            }
+        )
+        .addfield(
+            "country", lambda rec: (Horse(rec["horse"]).country or Country.GB).name
+        )
+        .addfield("name", lambda rec: Horse(rec["horse"]).name.upper())
+        .addfield(
+            "year",
+            lambda rec: (
+                HorseAge(
+                    rec["age"],
+                    context_date=race_date,
+                    hemisphere=Country[rec["country"]].hemisphere,  # type: ignore[attr-defined]
+                )._official_dob.year
+            ),
+        )
+        .addfield(
+            "finishing_time",
+            lambda rec: finishing_time if rec["finishing_position"] == 1 else None,
+        )
+        .addfield("official_position", operator.itemgetter("finishing_position"))
+        .cutout("horse", "age")
+        .dicts()[0]
+    )
+    return PreMongoRunner(**transformed_horse)
+
+
+def petl_theracingapi_horse(
+    runner: TheRacingApiRunner, race_date: pendulum.DateTime = pendulum.now()
+) -> PreMongoRunner:
+    data = petl.fromdicts([runner.model_dump()])
+
+    transformed_horse = (
+        petl.rename(
+            data,
+            {
+                "horse": "name",
+                "region": "country",
+                "number": "saddlecloth",
+                "lbs": "lbs_carried",
+                "ofr": "official_rating",
+            },
+        )
+        .addfield(
+            "year",
+            lambda rec: (
+                HorseAge(
+                    rec["age"],
+                    context_date=race_date,
+                    hemisphere=Country[rec["country"]].hemisphere,  # type: ignore[attr-defined]
+                )._official_dob.year
+            ),
+            index=3,
+        )
+        .addfield(
+            "allowance",
+            lambda rec: (
+                int(rec["jockey"].split("(")[1].split(")")[0])
+                if "(" in rec["jockey"]
+                else 0
+            ),
+        )
+        .addfield(
+            "gelded_from",
+            lambda rec: (
+                (race_date - pendulum.duration(days=1)).date
+                if (x := Gender[rec["sex"]]) == Sex.MALE and x.has_testes  # type: ignore[misc]
+                else None
+            ),
+        )
+        .convert(
+            {
+                "name": lambda x: x.upper(),
+                "sex": lambda x: Gender[x].sex.name[0],  # type: ignore
+                "age": int,
+                "colour": lambda x: CoatColour[x].name.title(),  # type: ignore
+                "sire": lambda x: horse_name_to_pre_mongo_horse(x, sex="M"),
+                "damsire": lambda x: horse_name_to_pre_mongo_horse(x, sex="M"),
+                "saddlecloth": int,
+                "draw": int,
+                "lbs_carried": int,
+                "headgear": lambda x: Headgear[x].name.title() if x else None,  # type: ignore
+                "official_rating": int,
+                "jockey": lambda x: x.split("(")[0].strip(),
+                "trainer": lambda x: x.split(", ")[0].strip(),
+            }
+        )
+        .convert(
+            "dam",
+            lambda x, rec: horse_name_to_pre_mongo_horse(
+                x, sex="F", sire=rec["damsire"]
+            ),
+            pass_row=True,
+        )
+        .cutout("sex_code", "last_run", "form", "age")
+        .dicts()[0]
+    )
+    return PreMongoRunner(**transformed_horse)
+
+
+def petl_perf_figs(record: BHAPerfFigsRecord) -> PreMongoHorseWithHistoricRatings:
+    data = petl.fromdicts([record.model_dump()])
+
+    used_fields = (
+        "date",
+        "racehorse",
+        "yof",
+        "sex",
+        "latest",
+        "two_runs_ago",
+        "three_runs_ago",
+        "four_runs_ago",
+        "five_runs_ago",
+        "six_runs_ago",
+    )
+    transformed_record = (
+        petl.cut(data, used_fields)
+        .rename({"yof": "year", "racehorse": "name"})
+        .addfield(
+            "country", lambda rec: x.name if (x := Horse(rec["name"]).country) else None
+        )
+        .addfield(
+            "historic_ratings",
+            lambda rec: compact(
+                [
+                    transform_historic_rating(rec["latest"], 0, rec["date"]),
+                    transform_historic_rating(rec["two_runs_ago"], 1, rec["date"]),
+                    transform_historic_rating(rec["three_runs_ago"], 2, rec["date"]),
+                    transform_historic_rating(rec["four_runs_ago"], 3, rec["date"]),
+                    transform_historic_rating(rec["five_runs_ago"], 4, rec["date"]),
+                    transform_historic_rating(rec["six_runs_ago"], 5, rec["date"]),
+                ]
+            ),
+        )
+        .convert(
+            {
+                "sex": lambda x: Gender[x].sex.name[0],  # type: ignore[misc]
+                "name": lambda x: Horse(x).name,
+            }
+        )  # type: ignore
+        .dicts()[0]
+    )
+    return PreMongoHorseWithHistoricRatings(**transformed_record)
+
+
+def petl_ratings(record: BHARatingsRecord) -> PreMongoHorse:
+    data = petl.fromdicts([record.model_dump()])
+
+    used_fields = (
+        "date",
+        "name",
+        "year",
+        "sex",
+        "sire",
+        "dam",
+        "trainer",
+        "flat_rating",
+        "awt_rating",
+        "chase_rating",
+        "hurdle_rating",
+    )
+    rating_types = ["flat", "aw", "chase", "hurdle"]
+    transformed_record = (
+        petl.cut(data, used_fields)
+        .rename({x: x.replace("_rating", "").lower() for x in used_fields})
+        .rename({"awt": "aw"})
+        .convert({"year": int, "flat": int, "aw": int, "chase": int, "hurdle": int})
+        .addfield(
+            "country", lambda rec: x.name if (x := Horse(rec["name"]).country) else None
+        )
+        .addfield(
+            "gelded_from",
+            lambda rec: (
+                pendulum.instance(rec["date"]) if rec["sex"] == "GELDING" else None
+            ),
+        )
+        .convert(
+            {
+                "sex": lambda x: Gender[x].sex.name[0],  # type: ignore[misc]
+                "name": lambda x: Horse(x).name,
+                "sire": lambda x: horse_name_to_pre_mongo_horse(
+                    x, sex="M", default_country="GB"
+                ),
+                "dam": lambda x: horse_name_to_pre_mongo_horse(
+                    x, sex="F", default_country="GB"
+                ),
+            }
+        )  # type: ignore
+        .addfield("ratings", lambda rec: {rtg: rec[rtg] for rtg in rating_types})
+        .cutout(*rating_types)
+        .dicts()[0]
+    )
+    return PreMongoHorse(**transformed_record)
+
+
+CASES: list[tuple[str, Callable[..., BaseModel], Callable[..., BaseModel], tuple]] = [
+    (
+        "formdata transform_horse",
+        formdata_transformer.transform_horse,
+        petl_formdata_horse,
+        (FORMDATA_RUNNER,),
+    ),
+    (
+        "rapid transform_horse",
+        rapid_horseracing_transformer.transform_horse,
+        petl_rapid_horse,
+        (RAPID_RUNNER, RACE_DATE),
+    ),
+    (
+        "theracingapi transform_horse",
+        theracingapi_transformer.transform_horse,
+        petl_theracingapi_horse,
+        (THERACINGAPI_RUNNER, RACE_DATE),
+    ),
+    (
+        "bha transform_perf_figs",
+        bha_transformer.transform_perf_figs,
+        petl_perf_figs,
+        (PERF_FIGS_RECORD,),
+    ),
+    (
+        "bha transform_ratings",
+        bha_transformer.transform_ratings,
+        petl_ratings,
+        (RATINGS_RECORD,),
+    ),
+]
+
+
+def best_time(func, args, number: int) -> float:
+    """Best time per call in microseconds"""
+    return (
+        min(timeit.repeat(lambda: func(*args), number=number, repeat=5))
+        / number
+        * 1_000_000
+    )
+
+
+if __name__ == "__main__":
+    for name, func, petl_func, args in CASES:
+        assert func(*args).model_dump() == petl_func(*args).model_dump(), name
+        fast = best_time(func, args, 2000)
+        slow = best_time(petl_func, args, 2000)
+        print(f"{name}: {fast:.1f}us vs {slow:.1f}us with petl ({slow / fast:.1f}x)")
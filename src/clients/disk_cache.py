@@ -0,0 +1,136 @@
+import hashlib
+import os
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+
+# Beside each cached version, the LastModified it was listed with
+MODIFIED_SUFFIX = ".modified"
+
+
+class DiskCache:
+    """Object contents on disk, stored per key and version (ETag or LastModified)"""
+
+    def __init__(self, directory: str | Path, max_bytes: int, *, offline=False):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._size = 0
+        # Size of each cached file, least recently used first, read from disk once
+        self._index: OrderedDict[Path, int] | None = None
+        self._lock = Lock()  # Spaces downloads may be fetched on several threads
+
+    def _key_dir(self, key: str) -> Path:
+        return self.directory / key
+
+    def _path(self, key: str, version: str) -> Path:
+        return self._key_dir(key) / hashlib.sha256(version.encode()).hexdigest()
+
+    def _files(self) -> list[Path]:
+        # Versions have no suffix, unlike temporary and LastModified files
+        return [
+            path
+            for path in self.directory.rglob("*")
+            if path.is_file() and not path.suffix
+        ]
+
+    def _latest(self, key: str) -> Path | None:
+        if not self._key_dir(key).is_dir():
+            return None
+        versions = [path for path in self._key_dir(key).iterdir() if not path.suffix]
+        return max(versions, key=lambda x: x.stat().st_mtime) if versions else None
+
+    def _load_index(self) -> OrderedDict[Path, int]:
+        if self._index is None:
+            # Modification times give the order of use in earlier runs
+            stats = sorted(
+                ((path, path.stat()) for path in self._files()),
+                key=lambda x: x[1].st_mtime,
+            )
+            self._index = OrderedDict((path, stat.st_size) for path, stat in stats)
+            self._size = sum(self._index.values())
+        return self._index
+
+    def _record(self, path: Path, size: int) -> None:
+        index = self._load_index()
+        self._size += size - index.pop(path, 0)
+        index[path] = size
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            self._load_index()
+            return self._size
+
+    def get(self, key: str, version: str | None) -> bytes | None:
+        """Cached contents for this version of key, or any version when offline"""
+        path: Path | None = None
+        if version is not None:
+            path = self._path(key, version)
+        elif self.offline:
+            path = self._latest(key)
+
+        if not path:
+            return None
+
+        try:
+            os.utime(path)
+            content = path.read_bytes()
+        except FileNotFoundError:  # Never cached, or evicted by another thread
+            return None
+
+        with self._lock:
+            if path in self._load_index() or path.is_file():
+                self._record(path, len(content))
+        return content
+
+    def put(
+        self,
+        key: str,
+        version: str,
+        content: bytes,
+        last_modified: datetime | None = None,
+    ) -> None:
+        path = self._path(key, version)
+
+        with self._lock:
+            # Write then rename, so readers never see a partial file
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            temp_path.write_bytes(content)
+            temp_path.replace(path)
+            if last_modified:
+                path.with_suffix(MODIFIED_SUFFIX).write_text(last_modified.isoformat())
+
+            self._record(path, len(content))
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        index = self._load_index()
+        while index and self._size > self.max_bytes:
+            path, size = index.popitem(last=False)
+            self._size -= size
+            path.unlink(missing_ok=True)
+            path.with_suffix(MODIFIED_SUFFIX).unlink(missing_ok=True)
+            if not any(path.parent.iterdir()):
+                path.parent.rmdir()
+
+    def keys(self, prefix: str) -> list[str]:
+        """Cached keys starting with prefix, in the order a bucket listing gives them"""
+        with self._lock:
+            keys = {
+                path.parent.relative_to(self.directory).as_posix()
+                for path in self._load_index()
+            }
+        return sorted(key for key in keys if key.startswith(prefix))
+
+    def get_last_modified(self, key: str) -> datetime | None:
+        """LastModified of the latest cached version of key, if it was recorded"""
+        path = self._latest(key)
+        try:
+            modified = path.with_suffix(MODIFIED_SUFFIX).read_text() if path else None
+        except FileNotFoundError:
+            return None
+        return datetime.fromisoformat(modified) if modified else None
@@ -1,41 +1,109 @@
+from collections import Counter, OrderedDict
+from collections.abc import Iterable
 from datetime import datetime
-from functools import cache, wraps
-from typing import Literal
+from functools import cache
+from time import monotonic
+from typing import Any, Literal
 
-import pendulum
 from peak_utility.listish import compact
 from pymongo import MongoClient
 
+from helpers.metrics import metrics, mongo_listener
 from models import PreMongoHorse, PreMongoRaceCourseDetails
 
-mongo_client = MongoClient("mongodb://localhost:27017/")  # type: ignore
+mongo_client = MongoClient(  # type: ignore
+    "mongodb://localhost:27017/", event_listeners=[mongo_listener]
+)
 
 
 db = mongo_client.handykapp
 
+horse_lookup_counts: Counter[str] = Counter()
 
-def cache_if_found(maxsize=None):
-    def decorator(func):
-        cache = {}
 
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            key = (args, tuple(sorted(kwargs.items())))
-            if key in cache:
-                return cache[key]
-            result = func(*args, **kwargs)
-            if result is not None:  # Only cache when we find something
-                cache[key] = result
-                # Limit cache size
-                if maxsize and len(cache) > maxsize:
-                    # Remove oldest 1000 entries
-                    for _ in range(1000):
-                        cache.pop(next(iter(cache)))
-            return result
+type HorseCacheKey = tuple[str, str | None, int | None, str | None]
 
-        return wrapper
 
-    return decorator
+class HorseCache:
+    """Bounded LRU cache of horse documents that were found, with optional expiry"""
+
+    def __init__(self, maxsize: int = 50000, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats: Counter[str] = Counter()
+        self._entries: OrderedDict[HorseCacheKey, tuple[float, dict]] = OrderedDict()
+        self._keys_by_id: dict[Any, set[HorseCacheKey]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(horse: PreMongoHorse) -> HorseCacheKey:
+        return (horse.name.strip().upper(), horse.country, horse.year, horse.sex)
+
+    def get(self, horse: PreMongoHorse) -> dict | None:
+        key = self.make_key(horse)
+        entry = self._entries.get(key)
+
+        if entry and self.ttl is not None and monotonic() - entry[0] > self.ttl:
+            self._remove(key)
+            self.stats["expirations"] += 1
+            entry = None
+
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[1]
+
+    def put(self, horse: PreMongoHorse, result: dict) -> None:
+        key = self.make_key(horse)
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = (monotonic(), result)
+        self._keys_by_id.setdefault(result["_id"], set()).add(key)
+
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+
+    def invalidate(self, horse_ids: Iterable[Any]) -> None:
+        """Drop every entry for the given horse ids, e.g. after they have been written"""
+        for horse_id in horse_ids:
+            for key in self._keys_by_id.pop(horse_id, set()):
+                del self._entries[key]
+                self.stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._keys_by_id.clear()
+
+    def describe(self) -> str:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        hit_rate = self.stats["hits"] / lookups if lookups else 0
+        return (
+            f"Horse cache hit rate {hit_rate:.1%} ({self.stats['hits']}/{lookups}), "
+            f"{self.stats['evictions']} evicted, {self.stats['expirations']} expired, "
+            f"{self.stats['invalidations']} invalidated"
+        )
+
+    def _remove(self, key: HorseCacheKey) -> None:
+        _, result = self._entries.pop(key)
+        keys = self._keys_by_id.get(result["_id"], set())
+        keys.discard(key)
+        if not keys:
+            self._keys_by_id.pop(result["_id"], None)
+
+
+# Shared by every processor that resolves horses
+horse_cache = HorseCache()
+metrics.register_cache("horses", lambda: horse_cache.stats)
+
+# Keeps $in queries well inside the 16MB command limit
+HORSE_NAMES_PER_QUERY = 5000
 
 
 def create_apostrophe_regex(name: str) -> str:
@@ -50,42 +118,138 @@ def create_apostrophe_regex(name: str) -> str:
 def update_horse_name_if_needed(horse: PreMongoHorse, result: dict) -> None:
     if "'" in horse.name and "'" not in result["name"]:
         db.horses.update_one({"_id": result["_id"]}, {"$set": {"name": horse.name}})
+        horse_cache.invalidate([result["_id"]])
         result["name"] = horse.name
 
 
-@cache_if_found(maxsize=50000)
-def get_horse(horse: PreMongoHorse) -> dict | None:
+def make_horse_search(horse: PreMongoHorse) -> dict:
+    return {"name": horse.name, "country": horse.country, "year": horse.year}
+
+
+def make_horse_sex_search(horse: PreMongoHorse) -> dict:
+    return compact(make_horse_search(horse)) | {"name": horse.name, "sex": horse.sex}
+
+
+def make_horse_regex_search(horse: PreMongoHorse) -> dict:
+    return make_horse_search(horse) | {
+        "name": {
+            "$regex": f"^{create_apostrophe_regex(horse.name)}$",
+            "$options": "i",
+        }
+    }
+
+
+def find_horse_by_regex(horse: PreMongoHorse) -> dict | None:
+    result = db.horses.find_one(make_horse_regex_search(horse))
+
+    if result:
+        update_horse_name_if_needed(horse, result)
+        horse_lookup_counts["regex"] += 1
+    else:
+        horse_lookup_counts["unresolved"] += 1
+
+    return result
+
+
+def find_horse(horse: PreMongoHorse) -> dict | None:
     search = db.horses.find_one
-    base = {"name": horse.name, "country": horse.country, "year": horse.year}
 
-    result = search(base)
+    result = search(make_horse_search(horse))
     if result:
+        horse_lookup_counts["exact"] += 1
         return result
 
-    result = search(compact(base) | {"name": horse.name, "sex": horse.sex})
+    result = search(make_horse_sex_search(horse))
     if result:
+        horse_lookup_counts["sex"] += 1
         return result
 
-    result = search(
-        base
-        | {
-            "name": {
-                "$regex": f"^{create_apostrophe_regex(horse.name)}$",
-                "$options": "i",
-            }
-        }
-    )
+    return find_horse_by_regex(horse)
 
-    if result:
-        update_horse_name_if_needed(horse, result)
 
+def get_horse(horse: PreMongoHorse) -> dict | None:
+    if result := horse_cache.get(horse):
+        return result
+
+    result = find_horse(horse)
+    if result:  # Only cache when we find something
+        horse_cache.put(horse, result)
     return result
 
 
+def find_horses_matching(searches: list[dict]) -> list[dict | None]:
+    """First horse matching each search, fetched by name in a few $in queries"""
+    if not searches:
+        return []
+
+    names = list(dict.fromkeys(search["name"] for search in searches))
+    docs_by_name: dict[str, list[dict]] = {}
+    for start in range(0, len(names), HORSE_NAMES_PER_QUERY):
+        query = {"name": {"$in": names[start : start + HORSE_NAMES_PER_QUERY]}}
+        for doc in db.horses.find(query):
+            docs_by_name.setdefault(doc["name"], []).append(doc)
+
+    return [
+        next(
+            (
+                doc
+                for doc in docs_by_name.get(search["name"], [])
+                if all(doc.get(k) == v for k, v in search.items())
+            ),
+            None,
+        )
+        for search in searches
+    ]
+
+
+def get_horses(horses: list[PreMongoHorse]) -> list[dict | None]:
+    """Resolve a window of horses in one query per strategy, preserving order"""
+    results: list[dict | None] = [horse_cache.get(horse) for horse in horses]
+    uncached = outstanding = [i for i, result in enumerate(results) if result is None]
+
+    for strategy, make_search in (
+        ("exact", make_horse_search),
+        ("sex", make_horse_sex_search),
+    ):
+        found = find_horses_matching([make_search(horses[i]) for i in outstanding])
+        for i, result in zip(outstanding, found, strict=True):
+            if result:
+                results[i] = result
+                horse_lookup_counts[strategy] += 1
+        outstanding = [i for i in outstanding if results[i] is None]
+
+    # A batch of case-insensitive regexes can't use an index, so the few horses
+    # left after the exact and sex passes are looked up one at a time
+    for i in outstanding:
+        results[i] = find_horse_by_regex(horses[i])
+
+    for i in uncached:
+        if result := results[i]:
+            horse_cache.put(horses[i], result)
+
+    return results
+
+
+def get_watermark(source: str) -> dict:
+    """How far incremental loading of a source has got"""
+    return db.watermarks.find_one({"_id": source}) or {}
+
+
+def update_watermark(source: str, **fields) -> None:
+    db.watermarks.update_one({"_id": source}, {"$set": fields}, upsert=True)
+
+
+def get_latest_race_datetime() -> datetime | None:
+    race = db.races.find_one({}, {"datetime": 1}, sort=[("datetime", -1)])
+    return race["datetime"] if race else None
+
+
 type NewmarketRacecourse = Literal["Newmarket July", "Newmarket Rowley"]
 
+type RacecourseKey = tuple[str, str | None, str | None, str | None]
 
-def apply_newmarket_workaround(date: pendulum.DateTime) -> NewmarketRacecourse:
+
+def apply_newmarket_workaround(date: datetime) -> NewmarketRacecourse:
     return "Newmarket July" if date.month in (6, 7, 8) else "Newmarket Rowley"
 
 
@@ -123,39 +287,49 @@ def get_all_racecourses():
 
 
 @cache
+def get_racecourse_index() -> dict[RacecourseKey, tuple[int, str]]:
+    """Racecourse ids keyed by lowercased name or formal name, surface, code and obstacle"""
+    index: dict[RacecourseKey, tuple[int, str]] = {}
+    for position, racecourse in enumerate(get_all_racecourses()):
+        for name in (racecourse["name"], racecourse["formal_name"]):
+            key = (
+                name.lower(),
+                racecourse.get("surface"),
+                racecourse.get("code"),
+                racecourse.get("obstacle"),
+            )
+            # Earlier racecourses take precedence, as they did in a linear scan
+            index.setdefault(key, (position, racecourse["_id"]))
+    return index
+
+
+def refresh_racecourses() -> None:
+    get_all_racecourses.cache_clear()
+    get_racecourse_index.cache_clear()
+    rr_code_to_course_dict.cache_clear()
+
+
+def get_surface_options(surface: str | None) -> list[str]:
+    if surface in ("AW", "All Weather"):
+        return ["Tapeta", "Polytrack"]
+    return [surface] if surface else ["Tapeta", "Polytrack", "Sand", "Turf"]
+
+
 def get_racecourse_id(
     race: PreMongoRaceCourseDetails, datetime: datetime, source: str
 ) -> str | None:
     if source == "racing_research":
         return rr_code_to_course_dict().get((race.course, race.surface))
 
-    racecourses = get_all_racecourses()
-    surface_options = (
-        ["Tapeta", "Polytrack"]
-        if race.surface == "AW" or race.surface == "All Weather"
-        else [race.surface]
-        if race.surface
-        else ["Tapeta", "Polytrack", "Sand", "Turf"]
-    )
     course_name = race.course.lower().replace("(", "").replace(")", "").strip()
     if course_name == "newmarket":
-        course_name = apply_newmarket_workaround(
-            pendulum.parse(str(datetime))  # type: ignore[arg-type]
-        ).lower()
+        course_name = apply_newmarket_workaround(datetime).lower()
 
-    for racecourse in racecourses:
-        if (
-            (
-                racecourse["name"].lower() == course_name
-                or racecourse["formal_name"].lower() == course_name
-            )
-            and racecourse.get("surface") in surface_options
-            and racecourse.get("code") == race.code
-            and (
-                racecourse.get("obstacle") == race.obstacle
-                or (racecourse.get("obstacle") is None and race.obstacle is None)
-            )
-        ):
-            return racecourse["_id"]
+    index = get_racecourse_index()
+    matches = [
+        match
+        for surface in get_surface_options(race.surface)
+        if (match := index.get((course_name, surface, race.code, race.obstacle)))
+    ]
 
-    return None
+    return min(matches)[1] if matches else None
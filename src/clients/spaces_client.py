@@ -1,14 +1,38 @@
 import csv
 import json
-from typing import Any
+import os
+import tomllib
+from collections import OrderedDict, deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, ClassVar
 
 import boto3  # type: ignore
 from botocore.client import BaseClient
 from prefect.blocks.system import Secret
 
+from helpers.metrics import metrics
+
+from .disk_cache import DiskCache
+from .storage_backends import LocalBackend, S3Backend, StorageBackend
+
+SETTINGS_FILE = Path("settings.toml")
+settings = (
+    tomllib.loads(SETTINGS_FILE.read_text()).get("spaces", {})
+    if SETTINGS_FILE.exists()
+    else {}
+)
+
+# Listings are read soon after they are made, so only the latest are kept
+LISTED_MAX = 10_000
+
 
 class SpacesClient:
     _client: BaseClient | None = None
+    _backend: StorageBackend | None = None
+    _cache: DiskCache | None = None
+    _listed: ClassVar[OrderedDict[str, dict]] = OrderedDict()  # Of recent keys
     BUCKET_NAME = "peaky76"
 
     @classmethod
@@ -31,35 +55,105 @@ class SpacesClient:
         return cls._client
 
     @classmethod
-    def get_files(cls, dirname, modified_after=None):
-        continuation_token = ""
-        client = cls.get()
-        while True:
-            # NOSONAR - ExpectedBucketOwner is AWS S3 specific, not supported by DigitalOcean Spaces
-            response = client.list_objects_v2(
-                Bucket=cls.BUCKET_NAME,
-                Prefix=dirname,
-                ContinuationToken=continuation_token,
+    def get_backend(cls) -> StorageBackend:
+        """Spaces, unless SPACES_BACKEND or [spaces] backend selects a local directory"""
+        if cls._backend is None:
+            backend = os.environ.get(
+                "SPACES_BACKEND", settings.get("backend", "spaces")
             )
-            files = response.get("Contents", [])
-            continuation_token = response.get("NextContinuationToken")
+            if backend == "local":
+                cls._backend = LocalBackend(
+                    os.environ.get("SPACES_LOCAL_DIR", settings.get("local_dir", ""))
+                )
+            elif backend == "spaces":
+                cls._backend = S3Backend(lambda: cls.get(), cls.BUCKET_NAME)
+            else:
+                raise ValueError(f"Unknown storage backend: {backend}")
+        return cls._backend
 
-            def within_date(x):
-                return modified_after is None or x.get("LastModified") > modified_after
+    @classmethod
+    def get_cache(cls) -> DiskCache | None:
+        """The local download cache, if SPACES_CACHE_DIR or [spaces] cache_dir is set"""
+        directory = os.environ.get("SPACES_CACHE_DIR", settings.get("cache_dir"))
+        if cls._cache is None and directory and cls.get_backend().remote:
+            cls._cache = DiskCache(
+                directory,
+                int(settings.get("cache_max_mb", 4096)) * 1024 * 1024,
+                offline=os.environ.get(
+                    "SPACES_CACHE_ONLY", str(settings.get("cache_only", False))
+                ).lower()
+                in ("1", "true"),
+            )
+        return cls._cache
 
-            yield from [
-                key
-                for file in files
-                if "." in (key := file.get("Key")) and within_date(file)
-            ]
-            if not response.get("IsTruncated"):
-                break
+    @classmethod
+    def get_last_modified(cls, key: str):
+        return cls._listed.get(key, {}).get("LastModified")
+
+    @classmethod
+    def get_version(cls, key: str) -> str | None:
+        """ETag, or failing that LastModified, of a key as last listed"""
+        listed = cls._listed.get(key, {})
+        version = listed.get("ETag") or listed.get("LastModified")
+        return str(version) if version else None
+
+    @classmethod
+    def _record_listing(cls, file: dict) -> None:
+        cls._listed[file["Key"]] = file
+        cls._listed.move_to_end(file["Key"])
+        while len(cls._listed) > LISTED_MAX:
+            cls._listed.popitem(last=False)
+
+    @classmethod
+    def _list_objects(cls, dirname, start_after=None) -> Iterator[dict[str, Any]]:
+        cache = cls.get_cache()
+        if cache and cache.offline:
+            for key in cache.keys(dirname):
+                if not start_after or key > start_after:
+                    yield {"Key": key, "LastModified": cache.get_last_modified(key)}
+        else:
+            yield from cls.get_backend().list_objects(dirname, start_after)
+
+    @classmethod
+    def get_files(
+        cls, dirname, modified_after=None, start_after=None, *, modified_since=None
+    ):
+        """Keys under dirname, optionally only those modified after or since a time"""
+
+        def within_date(x):
+            # Keys cached without a LastModified can't be ruled out
+            if (modified := x.get("LastModified")) is None:
+                return True
+            return (modified_after is None or modified > modified_after) and (
+                modified_since is None or modified >= modified_since
+            )
+
+        for file in cls._list_objects(dirname, start_after):
+            if "." in (key := file.get("Key")) and within_date(file):
+                cls._record_listing(file)
+                yield key
 
     @classmethod
     def stream_file(cls, file_path):
-        client = cls.get()
-        obj = client.get_object(Bucket=cls.BUCKET_NAME, Key=file_path)
-        return obj["Body"].read()
+        cache = cls.get_cache()
+        version = cls.get_version(file_path)
+
+        if cache:
+            # Offline, whichever version was cached last will do
+            content = cache.get(file_path, None if cache.offline else version)
+            metrics.record_cache("spaces_disk", hit=content is not None)
+            if content is not None:
+                return content
+            if cache.offline:
+                raise FileNotFoundError(f"{file_path} is not in the local cache")
+
+        with metrics.time("spaces.get_object"):
+            content = cls.get_backend().get_object(file_path)
+
+        if cache and version:
+            cache.put(file_path, version, content, cls.get_last_modified(file_path))
+
+        return content
 
     @classmethod
     def read_file(cls, file_path):
@@ -68,17 +162,53 @@ class SpacesClient:
             "csv": lambda x: list(csv.reader(x.splitlines())),
             "json": lambda x: json.loads(x),
         }
-        stream = cls.stream_file(file_path).decode("utf-8")
+        stream = str(cls.stream_file(file_path), "utf-8")
         return output[file_type](stream)
 
+    @classmethod
+    def iter_files(
+        cls,
+        dirname: str,
+        *,
+        concurrency: int = 8,
+        decode: bool = True,
+        modified_after=None,
+        modified_since=None,
+        start_after: str | None = None,
+        key_filter: Callable[[str], bool] | None = None,
+    ) -> Iterator[tuple[str, Any]]:
+        """Yield (key, contents) in listing order, keeping up to `concurrency` downloads in flight"""
+        fetch = cls.read_file if decode else cls.stream_file
+        keys = (
+            key
+            for key in cls.get_files(
+                dirname, modified_after, start_after, modified_since=modified_since
+            )
+            if key_filter is None or key_filter(key)
+        )
+        # Set up shared state before the worker threads use it
+        if cls.get_backend().remote:
+            cls.get()
+        cls.get_cache()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            in_flight: deque = deque()
+            for key in keys:
+                in_flight.append((key, executor.submit(fetch, key)))
+                if len(in_flight) >= concurrency:
+                    key, future = in_flight.popleft()
+                    yield key, future.result()
+
+            while in_flight:
+                key, future = in_flight.popleft()
+                yield key, future.result()
+
     @classmethod
     def write_file(cls, content, filename):
-        client = cls.get()
         if isinstance(content, str):
             content = content.encode("utf-8")
-        client.put_object(
-            Bucket=cls.BUCKET_NAME, Key=filename, Body=content, ACL="private"
-        )
+        with metrics.time("spaces.put_object"):
+            cls.get_backend().put_object(filename, content)
 
     @classmethod
     def edit_json_file(cls, filename, edit_func):
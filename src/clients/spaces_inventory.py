@@ -0,0 +1,75 @@
+import json
+from collections.abc import Callable, Iterable
+
+from .spaces_client import SpacesClient
+
+
+class SpacesInventory:
+    """The keys under a prefix, kept in a manifest so each run only lists keys added since.
+
+    Listing resumes after the last key listed, so keys written out of key order must
+    be recorded with add before the manifest is saved.
+    """
+
+    def __init__(self, prefix: str, manifest: str, parse: Callable[[str], str]):
+        self.prefix = prefix
+        self.manifest = manifest
+        self.parse = parse
+        self.keys: set[str] = set()
+        self.items: set[str] = set()
+        # Keys added since the manifest was saved, whether listed or written
+        self.added: list[str] = []
+        self.last_key: str | None = None
+        self.changed = False
+        # Whether there was no manifest, so the listing had to seed it
+        self.seeded = False
+
+    @classmethod
+    def load(
+        cls, prefix: str, manifest: str, parse: Callable[[str], str]
+    ) -> "SpacesInventory":
+        inventory = cls(prefix, manifest, parse)
+        inventory.seeded = True
+        if manifest in SpacesClient.get_files(manifest):
+            saved = SpacesClient.read_file(manifest)
+            if saved["prefix"] == prefix:
+                inventory.keys = set(saved["keys"])
+                inventory.items = {parse(key) for key in inventory.keys}
+                inventory.last_key = saved["last_key"]
+                inventory.seeded = False
+
+        inventory.refresh()
+        if inventory.seeded:
+            # Keys already there are not new, just not yet in a manifest
+            inventory.added = []
+        return inventory
+
+    def refresh(self) -> None:
+        for key in SpacesClient.get_files(self.prefix, start_after=self.last_key):
+            self.add(key)
+            self.last_key = key
+            self.changed = True
+
+    def add(self, key: str) -> None:
+        if key not in self.keys:
+            self.keys.add(key)
+            self.items.add(self.parse(key))
+            self.added.append(key)
+            self.changed = True
+
+    def missing(self, wanted: Iterable[str]) -> list[str]:
+        """The wanted items, in order, that no key in the inventory is for"""
+        return [item for item in wanted if item not in self.items]
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+
+        content = {
+            "prefix": self.prefix,
+            "last_key": self.last_key,
+            "keys": sorted(self.keys),
+        }
+        SpacesClient.write_file(json.dumps(content), self.manifest)
+        self.added = []
+        self.changed = False
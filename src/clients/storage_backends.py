@@ -0,0 +1,109 @@
+import glob
+import mmap
+from collections.abc import Callable, Iterator
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, Protocol
+
+from botocore.client import BaseClient
+
+# Local objects at least this big are memory-mapped rather than read
+MMAP_THRESHOLD = 1024 * 1024
+
+
+class StorageBackend(Protocol):
+    remote: bool
+
+    def list_objects(
+        self, dirname: str, start_after: str | None = None
+    ) -> Iterator[dict[str, Any]]: ...
+
+    def get_object(self, key: str) -> bytes | memoryview: ...
+
+    def put_object(self, key: str, content: bytes) -> None: ...
+
+
+class S3Backend:
+    """DigitalOcean Spaces, or any other S3 compatible endpoint"""
+
+    remote = True
+
+    def __init__(self, get_client: Callable[[], BaseClient], bucket: str):
+        self.get_client = get_client
+        self.bucket = bucket
+
+    def list_objects(
+        self, dirname: str, start_after: str | None = None
+    ) -> Iterator[dict[str, Any]]:
+        continuation_token = ""
+        client = self.get_client()
+        # S3 skips keys up to and including StartAfter without listing them
+        extra_args = {"StartAfter": start_after} if start_after else {}
+        while True:
+            # NOSONAR - ExpectedBucketOwner is AWS S3 specific, not supported by DigitalOcean Spaces
+            response = client.list_objects_v2(
+                Bucket=self.bucket,
+                Prefix=dirname,
+                ContinuationToken=continuation_token,
+                **extra_args,
+            )
+            yield from response.get("Contents", [])
+            continuation_token = response.get("NextContinuationToken")
+            if not response.get("IsTruncated"):
+                break
+
+    def get_object(self, key: str) -> bytes:
+        obj = self.get_client().get_object(Bucket=self.bucket, Key=key)
+        return obj["Body"].read()
+
+    def put_object(self, key: str, content: bytes) -> None:
+        self.get_client().put_object(
+            Bucket=self.bucket, Key=key, Body=content, ACL="private"
+        )
+
+
+class LocalBackend:
+    """A directory laid out like the bucket, for replaying loads at disk speed"""
+
+    remote = False
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+
+    def list_objects(
+        self, dirname: str, start_after: str | None = None
+    ) -> Iterator[dict[str, Any]]:
+        # Only walk the entries the prefix matches, not their siblings
+        parent, _, name = dirname.rpartition("/")
+        base = self.root / parent
+        matches = base.glob(f"{glob.escape(name)}*") if base.is_dir() else []
+        paths = {
+            path.relative_to(self.root).as_posix(): path
+            for match in matches
+            for path in (match.rglob("*") if match.is_dir() else [match])
+            if path.is_file()
+        }
+
+        # Listed in key order, as S3 does
+        for key in sorted(paths):
+            if not start_after or key > start_after:
+                stat = paths[key].stat()
+                yield {
+                    "Key": key,
+                    "LastModified": datetime.fromtimestamp(stat.st_mtime, tz=UTC),
+                    "Size": stat.st_size,
+                }
+
+    def get_object(self, key: str) -> bytes | memoryview:
+        path = self.root / key
+        if path.stat().st_size < MMAP_THRESHOLD:
+            return path.read_bytes()
+
+        with path.open("rb") as f:
+            # The view keeps the mapping open after the file is closed
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def put_object(self, key: str, content: bytes) -> None:
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
@@ -10,6 +10,7 @@ from prefect import flow, task
 
 from clients import SpacesClient
 from helpers import fetch_content, get_last_occurrence_of
+from helpers.metrics import report_metrics
 
 with Path("settings.toml").open("rb") as f:
     settings = tomllib.load(f)
@@ -36,6 +37,7 @@ def save(file, content):
 
 
 @flow
+@report_metrics
 def bha_extractor():
     for file in FILES:
         content = fetch(file)
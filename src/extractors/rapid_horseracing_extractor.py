@@ -4,16 +4,19 @@ from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
+import asyncio
 import json
-from time import sleep
+import tomllib
 
 import pendulum
-import tomllib
-from prefect import flow, task
+from prefect import flow, get_run_logger, task
 from prefect.blocks.system import Secret
 
 from clients import SpacesClient
+from clients.spaces_inventory import SpacesInventory
 from helpers import fetch_content
+from helpers.metrics import report_metrics
+from helpers.rate_limiter import RateLimiter
 
 with Path("settings.toml").open("rb") as f:
     settings = tomllib.load(f)
@@ -25,12 +28,56 @@ DESTINATION = settings["rapid_horseracing"]["spaces_dir"]
 RACECARDS_DESTINATION = f"{DESTINATION}racecards/"
 RESULTS_DESTINATION = f"{DESTINATION}results/"
 LIMITS = settings["rapid_horseracing"]["limits"]
+TO_DO_LIST = f"{DESTINATION}results_to_do_list.json"
+# Requests made today, so that runs on the same day share the daily limit
+REQUESTS_USED = f"{DESTINATION}requests_used.json"
+# Outside the racecards and results prefixes, which the loaders list
+RACECARDS_MANIFEST = f"{DESTINATION}manifests/racecards.json"
+RESULTS_MANIFEST = f"{DESTINATION}manifests/results.json"
 
 
 def get_file_date(filename):
     return filename.split(".")[0][-8:]
 
 
+def get_race_id(filename):
+    return filename.split(".")[0].split("_")[-1]
+
+
+def get_racecards_filename(date):  # date - YYYY-MM-DD
+    date_str = date.replace("-", "")
+    return f"{RACECARDS_DESTINATION}rapid_api_racecards_{date_str}.json"
+
+
+def get_result_filename(race_id):
+    return f"{RESULTS_DESTINATION}rapid_api_result_{race_id}.json"
+
+
+def load_racecards_inventory():
+    return SpacesInventory.load(
+        RACECARDS_DESTINATION, RACECARDS_MANIFEST, get_file_date
+    )
+
+
+def load_results_inventory():
+    return SpacesInventory.load(RESULTS_DESTINATION, RESULTS_MANIFEST, get_race_id)
+
+
+def load_requests_used():
+    """Requests already made to the API today, by earlier runs"""
+    if REQUESTS_USED not in SpacesClient.get_files(REQUESTS_USED):
+        return 0
+    saved = SpacesClient.read_file(REQUESTS_USED)
+    if saved["date"] != pendulum.today("UTC").to_date_string():
+        return 0
+    return saved["count"]
+
+
+def save_requests_used(count):
+    content = {"date": pendulum.today("UTC").to_date_string(), "count": count}
+    SpacesClient.write_file(json.dumps(content), REQUESTS_USED)
+
+
 def get_headers(url):
     return {
         "x-rapidapi-host": url.split("//")[1].split("/")[0],
@@ -39,8 +86,7 @@ def get_headers(url):
 
 
 @task(tags=["Rapid"])
-def get_unfetched_race_ids(last_checked):
-    racecard_files = list(SpacesClient.get_files(RACECARDS_DESTINATION, last_checked))
+def get_unfetched_race_ids(racecard_files):
     return [
         race["id_race"]
         for file in racecard_files
@@ -48,14 +94,26 @@ def get_unfetched_race_ids(last_checked):
     ]
 
 
-@task(tags=["Rapid"], task_run_name="extract_result_{race_id}")
-def extract_result(race_id):
-    source = f"{SOURCE}race/{race_id}"
+async def extract_results(race_ids, limiter, fetched, source=SOURCE):
+    """Fetch results as fast as the limiter allows, adding each race_id to fetched once uploaded"""
+    logger = get_run_logger()
     headers = get_headers(source)
 
-    content = fetch_content(source, headers=headers)
-    filename = f"{RESULTS_DESTINATION}rapid_api_result_{race_id}.json"
-    SpacesClient.write_file(content, filename)
+    async def extract(race_id):
+        await limiter.acquire()
+        try:
+            content = await asyncio.to_thread(
+                fetch_content, f"{source}race/{race_id}", headers=headers
+            )
+            await asyncio.to_thread(
+                SpacesClient.write_file, content, get_result_filename(race_id)
+            )
+        except Exception as e:
+            logger.warning(f"Unable to extract result {race_id}: {e}")
+        else:
+            fetched.append(race_id)
+
+    await asyncio.gather(*(extract(race_id) for race_id in race_ids))
 
 
 @task(tags=["Rapid"], task_run_name="extract_racecards_{date}")
@@ -65,72 +123,104 @@ def extract_racecards(date):  # date - YYYY-MM-DD
     headers = get_headers(source)
 
     content = fetch_content(source, params, headers)
-    date_str = date.replace("-", "")
-    filename = f"{RACECARDS_DESTINATION}rapid_api_racecards_{date_str}.json"
-    SpacesClient.write_file(content, filename)
+    SpacesClient.write_file(content, get_racecards_filename(date))
 
 
 @task(tags=["Rapid"])
-def get_next_racecard_date():
-    start_date = pendulum.parse("2020-01-01")
-    end_date = pendulum.now()
-    test_date = start_date
-
-    files = list(SpacesClient.get_files(RACECARDS_DESTINATION))
-    file_date_strs = [get_file_date(filename) for filename in files]
-    file_dates = [pendulum.from_format(x, "YYYYMMDD") for x in file_date_strs]
-
-    while test_date <= end_date:
-        if test_date not in file_dates:
-            return test_date.format("YYYY-MM-DD")
-        test_date += pendulum.duration(days=1)
-
-    return None
+def get_next_racecard_date(racecards=None):
+    if racecards is None:
+        racecards = load_racecards_inventory()
+    dates = pendulum.interval(pendulum.date(2020, 1, 1), pendulum.now().date())
+    missing = racecards.missing(date.format("YYYYMMDD") for date in dates)
+    if not missing:
+        return None
+
+    return pendulum.from_format(missing[0], "YYYYMMDD").format("YYYY-MM-DD")
+
+
+def list_racecards_since_last_check():
+    """Racecards stored since the to do list was last updated"""
+    last_checked = SpacesClient.read_file(TO_DO_LIST)["last_checked"]
+    return list(
+        SpacesClient.get_files(
+            RACECARDS_DESTINATION,
+            pendulum.parse(last_checked) if last_checked else None,
+        )
+    )
 
 
 @flow
-def update_results_to_do_list():
-    filename = f"{DESTINATION}results_to_do_list.json"
-    current_status = SpacesClient.read_file(filename)
-    last_checked = (
-        pendulum.parse(current_status["last_checked"])
-        if current_status["last_checked"]
-        else None
-    )
+def update_results_to_do_list(new_racecard_files):
+    current_status = SpacesClient.read_file(TO_DO_LIST)
 
-    result_files = list(SpacesClient.get_files(RESULTS_DESTINATION))
-    new_race_ids = get_unfetched_race_ids(last_checked)
-    done_race_ids = [filename.split(".")[0].split("_")[-1] for filename in result_files]
-    to_do_race_ids = current_status["results_to_do"] + new_race_ids
+    results = load_results_inventory()
+    new_race_ids = get_unfetched_race_ids(new_racecard_files)
+    # Racecards read before a crash that stopped their manifest being saved are read again
+    to_do_race_ids = list(dict.fromkeys(current_status["results_to_do"] + new_race_ids))
 
     content = json.dumps(
         {
             "last_checked": str(pendulum.now()),
-            "results_to_do": [
-                race_id for race_id in to_do_race_ids if race_id not in done_race_ids
-            ],
-            "results_done": done_race_ids,
+            "results_to_do": results.missing(to_do_race_ids),
+            "results_done": sorted(results.items),
         }
     )
-    SpacesClient.write_file(content, filename)
+    SpacesClient.write_file(content, TO_DO_LIST)
+    results.save()
+
+
+def mark_results_done(race_ids):
+    """Move fetched results from to do to done, so the next run resumes after them"""
+    current_status = SpacesClient.read_file(TO_DO_LIST)
+    done = set(race_ids)
+    current_status["results_to_do"] = [
+        race_id for race_id in current_status["results_to_do"] if race_id not in done
+    ]
+    current_status["results_done"] += race_ids
+    SpacesClient.write_file(json.dumps(current_status), TO_DO_LIST)
+
+    # Race ids are not fetched in key order, so the listing would not pick them up
+    results = load_results_inventory()
+    for race_id in race_ids:
+        results.add(get_result_filename(race_id))
+    results.save()
 
 
 @flow
+@report_metrics
 def rapid_horseracing_extractor():
     # Add another day"s racing to the racecards folder
-    date = get_next_racecard_date()
-    extract_racecards(date)
-
-    # Update the list of results to fetch
-    update_results_to_do_list()
-
-    # Fetch a number of results within the limits presented
-    races_batch = SpacesClient.read_file(f"{DESTINATION}results_to_do_list.json")[
-        "results_to_do"
-    ][: LIMITS["day"] - 2]
-    for race_id in races_batch:
-        extract_result(race_id)
-        sleep(90)
+    used = load_requests_used()
+    racecards = load_racecards_inventory()
+    date = get_next_racecard_date(racecards)
+    if date:
+        extract_racecards(date)
+        used += 1
+        # Earlier gaps are filled after later dates, so record it for the listing
+        racecards.add(get_racecards_filename(date))
+
+    # Update the list of results to fetch from the racecards added since the last run,
+    # only then saving the manifest so that none are missed if this fails
+    # Without a manifest, go by when the to do list was last updated, as before
+    update_results_to_do_list(
+        list_racecards_since_last_check() if racecards.seeded else racecards.added
+    )
+    racecards.save()
+
+    # Fetch as many results as today's limit has left, keeping one in reserve
+    races_batch = SpacesClient.read_file(TO_DO_LIST)["results_to_do"][
+        : max(LIMITS["day"] - used - 1, 0)
+    ]
+    limiter = RateLimiter(LIMITS, used=1 if date else 0)  # the racecards request
+    fetched = []
+    try:
+        asyncio.run(extract_results(races_batch, limiter, fetched))
+    finally:
+        # Results uploaded before a crash that skips this are fetched again, unless
+        # they sort after the last key listed
+        if fetched:
+            mark_results_done(fetched)
+        save_requests_used(used + limiter.acquired)
 
 
 if __name__ == "__main__":
@@ -12,6 +12,7 @@ from prefect.blocks.system import Secret
 
 from clients import SpacesClient
 from helpers import fetch_content
+from helpers.metrics import report_metrics
 
 with Path("settings.toml").open("rb") as f:
     settings = tomllib.load(f)
@@ -48,6 +49,7 @@ def extract_racecards(day="tomorrow", region_codes=["gb", "ire"]):
 
 
 @flow
+@report_metrics
 def theracingapi_racecards_extractor():
     extract_racecards()
 
@@ -1,4 +1,5 @@
 from .helpers import (
+    convert_fields,
     fetch_content,
     get_last_occurrence_of,
     get_operations,
@@ -8,6 +9,7 @@ from .helpers import (
 )
 
 __all__ = [
+    "convert_fields",
     "fetch_content",
     "get_last_occurrence_of",
     "get_operations",
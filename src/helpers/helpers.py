@@ -1,4 +1,5 @@
-from typing import Literal
+from collections.abc import Callable
+from typing import Any, Literal
 
 import pendulum
 from horsetalk import Horse
@@ -9,7 +10,21 @@ from requests import get
 
 from models import MongoHorse, MongoOperation, PreMongoHorse
 
+from .metrics import metrics
 
+
+def convert_fields(row: dict, converters: dict[str, Callable[[Any], Any]]) -> dict:
+    """Convert a row's fields in place, leaving None where a conversion fails, as petl does"""
+    for field, converter in converters.items():
+        value = row[field]
+        try:
+            row[field] = converter(value)
+        except Exception:
+            row[field] = None
+    return row
+
+
+@metrics.timed("fetch_content")
 def fetch_content(url, params=None, headers=None):
     response = get(url, params=params, headers=headers)
     response.raise_for_status()
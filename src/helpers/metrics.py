@@ -0,0 +1,321 @@
+import json
+import logging
+import os
+import threading
+import tomllib
+from collections import Counter, defaultdict
+from collections.abc import Callable, Generator, Mapping
+from contextlib import contextmanager
+from datetime import UTC, datetime
+from functools import wraps
+from pathlib import Path
+from time import monotonic, perf_counter
+from typing import Any
+
+import psutil
+from prefect import get_run_logger
+from prefect.artifacts import create_markdown_artifact
+from pymongo import monitoring
+
+SETTINGS_FILE = Path("settings.toml")
+settings = (
+    tomllib.loads(SETTINGS_FILE.read_text()).get("metrics", {})
+    if SETTINGS_FILE.exists()
+    else {}
+)
+
+MEMORY_SAMPLE_INTERVAL = 1.0  # Seconds between RSS samples
+
+
+class Metrics:
+    """Timings, throughput, Mongo round trips, cache hit rates and peak memory for a run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._caches: dict[str, Callable[[], Mapping[str, int]]] = {}
+        self._depth = 0
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = monotonic()
+            self.started_at = datetime.now(UTC)
+            self.stages: dict[str, defaultdict[str, float]] = {}
+            self.mongo: dict[str, defaultdict[str, float]] = {}
+            self.cache_counts: dict[str, Counter[str]] = {}
+            # Registered caches outlive a run, so only count from here on
+            self._cache_baselines = {
+                name: Counter(get_stats()) for name, get_stats in self._caches.items()
+            }
+            self.peak_rss = 0
+            self._last_sample = 0.0
+        self.sample_memory(force=True)
+
+    def sample_memory(self, *, force: bool = False) -> None:
+        now = monotonic()
+        if force or now - self._last_sample >= MEMORY_SAMPLE_INTERVAL:
+            self._last_sample = now
+            rss = psutil.Process(os.getpid()).memory_info().rss
+            self.peak_rss = max(self.peak_rss, rss)
+
+    @contextmanager
+    def time(self, stage: str, items: int = 1) -> Generator[None]:
+        """Time a stage, also recording its time net of any stages nested in it"""
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(0.0)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+
+            with self._lock:
+                counts = self.stages.setdefault(stage, defaultdict(float))
+                counts["calls"] += 1
+                counts["items"] += items
+                counts["seconds"] += elapsed
+                counts["self_seconds"] += elapsed - nested
+
+            self.sample_memory()
+
+    def take_stages(self) -> dict[str, dict[str, float]]:
+        """Remove and return the stage timings so far, e.g. to send from a worker process"""
+        with self._lock:
+            stages = {stage: dict(counts) for stage, counts in self.stages.items()}
+            self.stages = {}
+        return stages
+
+    def merge_stages(self, stages: Mapping[str, Mapping[str, float]]) -> None:
+        """Add stage timings taken elsewhere, e.g. in a worker process"""
+        with self._lock:
+            for stage, counts in stages.items():
+                merged = self.stages.setdefault(stage, defaultdict(float))
+                for key, value in counts.items():
+                    merged[key] += value
+
+    def timed[**P, R](self, stage: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+        def decorator(func: Callable[P, R]) -> Callable[P, R]:
+            @wraps(func)
+            def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+                with self.time(stage):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def record_mongo(
+        self, collection: str, operation: str, seconds: float, *, failed=False
+    ) -> None:
+        with self._lock:
+            counts = self.mongo.setdefault(
+                f"{collection}.{operation}", defaultdict(float)
+            )
+            counts["count"] += 1
+            counts["failures"] += failed
+            counts["seconds"] += seconds
+
+    def record_cache(self, name: str, *, hit: bool) -> None:
+        with self._lock:
+            self.cache_counts.setdefault(name, Counter())[
+                "hits" if hit else "misses"
+            ] += 1
+
+    def register_cache(
+        self, name: str, get_stats: Callable[[], Mapping[str, int]]
+    ) -> None:
+        """Report a cache that keeps its own hits and misses"""
+        self._caches[name] = get_stats
+
+    def summary(self, name: str) -> dict:
+        self.sample_memory(force=True)
+        caches = {
+            name: Counter(get_stats()) - self._cache_baselines.get(name, Counter())
+            for name, get_stats in self._caches.items()
+        }
+        caches |= self.cache_counts
+
+        return {
+            "name": name,
+            "started_at": self.started_at.isoformat(),
+            "wall_seconds": round(monotonic() - self.started, 3),
+            "peak_rss_mb": round(self.peak_rss / 1024**2, 1),
+            "stages": {
+                stage: {
+                    "calls": int(counts["calls"]),
+                    "items": int(counts["items"]),
+                    "seconds": round(counts["seconds"], 3),
+                    "self_seconds": round(counts["self_seconds"], 3),
+                    "items_per_second": round(counts["items"] / counts["seconds"], 1)
+                    if counts["seconds"]
+                    else None,
+                }
+                for stage, counts in sorted(self.stages.items())
+            },
+            "mongo": {
+                op: {
+                    "count": int(counts["count"]),
+                    "failures": int(counts["failures"]),
+                    "seconds": round(counts["seconds"], 3),
+                    "mean_ms": round(counts["seconds"] / counts["count"] * 1000, 2),
+                }
+                for op, counts in sorted(self.mongo.items())
+            },
+            "caches": {
+                cache: {
+                    "hits": stats.get("hits", 0),
+                    "misses": stats.get("misses", 0),
+                    "hit_rate": round(stats.get("hits", 0) / lookups, 3)
+                    if (lookups := stats.get("hits", 0) + stats.get("misses", 0))
+                    else None,
+                }
+                for cache, stats in sorted(caches.items())
+            },
+        }
+
+    def emit(self, name: str) -> dict:
+        """Write the summary to the metrics directory and as a Prefect artifact"""
+        logger = get_run_logger()
+        summary = self.summary(name)
+
+        directory = Path(os.environ.get("METRICS_DIR", settings.get("dir", "metrics")))
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{name}_{self.started_at:%Y%m%dT%H%M%S}.json"
+        path.write_text(json.dumps(summary, indent=2))
+        logger.info(f"Wrote metrics to {path}")
+
+        create_markdown_artifact(
+            summary_to_markdown(summary),
+            key=f"{name.replace('_', '-')}-metrics",
+            description=f"Stage timings and throughput for {name}",
+        )
+        return summary
+
+    @contextmanager
+    def collect(self, name: str) -> Generator["Metrics"]:
+        """Collect metrics for a run, emitting them at the end unless nested in another run"""
+        if self._depth == 0:
+            self.reset()
+        self._depth += 1
+        try:
+            yield self
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                try:
+                    self.emit(name)
+                except Exception as e:
+                    # Never fail a finished run over its metrics
+                    logging.getLogger(__name__).warning(f"Could not emit metrics: {e}")
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times each Mongo round trip, by collection and command"""
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self._collections: dict[tuple[Any, int], str] = {}
+
+    @staticmethod
+    def get_collection(event: monitoring.CommandStartedEvent) -> str:
+        key = "collection" if event.command_name == "getMore" else event.command_name
+        collection = event.command.get(key)
+        return collection if isinstance(collection, str) else event.database_name
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        self._collections[event.connection_id, event.request_id] = self.get_collection(
+            event
+        )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        self.metrics.record_mongo(
+            collection, event.command_name, event.duration_micros / 1_000_000
+        )
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        self.metrics.record_mongo(
+            collection,
+            event.command_name,
+            event.duration_micros / 1_000_000,
+            failed=True,
+        )
+
+
+def summary_to_markdown(summary: dict) -> str:
+    lines = [
+        f"# Metrics for {summary['name']}",
+        "",
+        f"Wall time {summary['wall_seconds']}s, peak RSS {summary['peak_rss_mb']}MB",
+    ]
+    for section in ("stages", "mongo", "caches"):
+        rows = summary[section]
+        if not rows:
+            continue
+        columns = list(next(iter(rows.values())))
+        lines += [
+            "",
+            f"## {section.title()}",
+            "",
+            f"| {section[:-1]} | {' | '.join(columns)} |",
+            f"|---|{'---|' * len(columns)}",
+            *(
+                f"| {name} | {' | '.join(str(row[c]) for c in columns)} |"
+                for name, row in rows.items()
+            ),
+        ]
+    return "\n".join(lines)
+
+
+def instrument_processor[**P, Y, T](
+    stage: str,
+) -> Callable[[Callable[P, Generator[Y, T, None]]], Callable[P, Generator[Y, T, None]]]:
+    """Time each item a generator processor handles, including the processors it feeds"""
+
+    def decorator(
+        processor: Callable[P, Generator[Y, T, None]],
+    ) -> Callable[P, Generator[Y, T, None]]:
+        @wraps(processor)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> Generator[Y, T, None]:
+            return time_processor(stage, processor(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
+
+
+def time_processor[Y, T](
+    stage: str, processor: Generator[Y, T, None]
+) -> Generator[Y, T, None]:
+    with metrics.time(stage, items=0):
+        result = next(processor)
+
+    try:
+        while True:
+            item = yield result
+            with metrics.time(stage):
+                result = processor.send(item)
+    except GeneratorExit:
+        with metrics.time(stage, items=0):
+            processor.close()
+
+
+def report_metrics[**P, R](flow_fn: Callable[P, R]) -> Callable[P, R]:
+    """Collect metrics while a flow runs, emitting them when it finishes"""
+
+    @wraps(flow_fn)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        with metrics.collect(flow_fn.__name__):
+            return flow_fn(*args, **kwargs)
+
+    return wrapper
+
+
+# Shared by everything that reports on a run
+metrics = Metrics()
+mongo_listener = MongoCommandListener(metrics)
@@ -0,0 +1,49 @@
+import asyncio
+from collections import deque
+from collections.abc import Awaitable, Callable, Mapping
+from time import monotonic
+
+# The periods API limits in settings.toml are given over
+PERIODS = {"second": 1, "minute": 60, "hour": 60 * 60, "day": 24 * 60 * 60}
+
+
+class RateLimiter:
+    """Holds each request until no limit's period holds as many requests as it allows"""
+
+    def __init__(
+        self,
+        limits: Mapping[str, int],
+        *,
+        used: int = 0,
+        clock: Callable[[], float] = monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ):
+        self.clock = clock
+        self.sleep = sleep
+        now = clock()
+        # Times of the latest requests within each period, oldest first
+        self.windows = [
+            (PERIODS[period], limit, deque([now] * used, maxlen=limit))
+            for period, limit in limits.items()
+        ]
+        self.acquired = 0  # Requests let through, not counting those already used
+        self._lock = asyncio.Lock()
+
+    def wait_time(self) -> float:
+        """Seconds until a request would keep within every limit"""
+        now = self.clock()
+        return max(
+            (times[0] + period - now if len(times) == limit else 0.0)
+            for period, limit, times in self.windows
+        )
+
+    async def acquire(self) -> None:
+        # Requests are let through one at a time, in the order they arrive
+        async with self._lock:
+            while (wait := self.wait_time()) > 0:
+                await self.sleep(wait)
+
+            now = self.clock()
+            for _, _, times in self.windows:
+                times.append(now)  # Dropping the oldest once the limit is reached
+            self.acquired += 1
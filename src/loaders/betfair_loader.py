@@ -6,11 +6,13 @@ sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 from prefect import flow, get_run_logger
 
+from helpers.metrics import report_metrics
 from processors.betfair_processor import betfair_processor
 from transformers.betfair_transformer import betfair_transformer
 
 
 @flow
+@report_metrics
 def load_betfair_horserace_pnl():
     logger = get_run_logger()
     logger.info("Starting betfair loader")
@@ -5,18 +5,22 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 import datetime
+from collections.abc import Iterator
 
 import pendulum
 import petl
 import tomllib
 from peak_utility.number import Numbertext
 from prefect import flow, get_run_logger, task
+from pydantic import TypeAdapter, ValidationError
 
 from clients import SpacesClient
 from clients import mongo_client as client
+from helpers.metrics import report_metrics
+from models import PreMongoHorse
 from models.bha_ratings_record import BHARatingsRecord
 from processors.ratings_processor import ratings_processor
-from transformers.bha_transformer import transform_ratings
+from transformers.bha_transformer import transform_ratings_records
 
 db = client.handykapp
 
@@ -51,11 +55,53 @@ def convert_header_to_field_name(header: str) -> str:
     return result
 
 
-def csv_row_to_dict(header_row, data_row):
-    return dict(zip(header_row, data_row))
+def validate_with(adapter: TypeAdapter):
+    def validate(value):
+        try:
+            return adapter.validate_python(value)
+        except ValidationError as e:
+            return e
+
+    return validate
+
+
+# Validators for each column, returning the error in place of an invalid value
+RATINGS_VALIDATORS = {
+    field: validate_with(TypeAdapter(info.rebuild_annotation()))
+    for field, info in BHARatingsRecord.model_fields.items()
+}
+
+
+def transform_ratings_table(data, date: datetime.date) -> Iterator[PreMongoHorse]:
+    """Validate and transform a whole ratings table, a column at a time"""
+    logger = get_run_logger()
+    header = [convert_header_to_field_name(col) for col in petl.header(data)]
+
+    def is_valid(rec) -> bool:
+        errors = [value for value in rec if isinstance(value, ValidationError)]
+        for error in errors:
+            logger.error(f"Unable to create BHA record from row: {error}")
+        return not errors
+
+    records = (
+        petl.setheader(data, header)
+        .addfield("date", date)
+        .convert(RATINGS_VALIDATORS)
+        .select(is_valid)
+    )
+
+    for row in transform_ratings_records(records).dicts():
+        try:
+            horse = PreMongoHorse(**row)
+        except Exception as e:
+            logger.error(f"Unable to transform BHA ratings for {row['name']}: {e}")
+            continue
+
+        yield horse
 
 
 @flow
+@report_metrics
 def load_bha_data():
     logger = get_run_logger()
     logger.info("Starting BHA loader")
@@ -71,25 +117,12 @@ def load_bha_data():
     pendulum_date = pendulum.from_format(date_str, "YYYYMMDD")
     date = datetime.date(pendulum_date.year, pendulum_date.month, pendulum_date.day)
 
-    rows = list(data)
-    logger.info(f"Total rows in CSV: {len(rows)}")
-
-    header = [convert_header_to_field_name(col) for col in rows[0]]
-
-    for data_row in rows[1:]:
-        row_dict = csv_row_to_dict(header, data_row)
-        try:
-            record = BHARatingsRecord(**row_dict, date=date)
-        except (ValueError, TypeError) as e:
-            logger.error(f"Unable to create BHA record from row: {e}")
-            continue
-
-        try:
-            transformed_ratings = transform_ratings(record)
-            r.send(transformed_ratings)
-        except Exception as e:
-            logger.error(f"Unable to process BHA ratings for {record.name}: {e}")
+    row_count = 0
+    for horse in transform_ratings_table(data, date):
+        r.send(horse)
+        row_count += 1
 
+    logger.info(f"Transformed {row_count} rows from CSV")
     r.close()
 
 
@@ -11,6 +11,7 @@ import tomllib
 from prefect import flow, get_run_logger
 
 from clients import mongo_client as client
+from helpers.metrics import report_metrics
 from processors.formdata_processors import file_processor
 from transformers.formdata_transformer import get_formdatas
 
@@ -23,14 +24,15 @@ db = client.handykapp
 
 
 @flow
-def load_formdata():
+@report_metrics
+def load_formdata(*, extract_processes=0):
     logger = get_run_logger()
     logger.info("Starting formdata loader")
 
     db.formdata.drop()
     logger.info("Dropped formdata collection")
 
-    f = file_processor()
+    f = file_processor(workers=extract_processes)
     next(f)
 
     files = get_formdatas(code=RacingCode.FLAT, after_year=22, for_refresh=True)
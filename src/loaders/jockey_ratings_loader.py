@@ -6,17 +6,19 @@ sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 from prefect import flow, get_run_logger
 
+from helpers.metrics import report_metrics
 from models import PreMongoPerson
 from processors.person_processor import person_processor
 from transformers.jockey_ratings_transformer import transform_jockey_ratings
 
 
 @flow
+@report_metrics
 def load_jockey_ratings():
     logger = get_run_logger()
     logger.info("Starting jockey rating loader")
 
-    p = person_processor()
+    p = person_processor(preload_source="rr")
     next(p)
 
     for jockey, rating in transform_jockey_ratings().items():
@@ -9,6 +9,7 @@ from prefect import flow, task
 from pymongo import ASCENDING as ASC
 
 from clients import mongo_client as client
+from helpers.metrics import report_metrics
 
 from .bha_loader import load_bha_data
 from .formdata_loader import load_formdata
@@ -59,16 +60,29 @@ def spec_database():
     db.racecourses.create_index("name")
     db.races.create_index([("racecourse", ASC), ("datetime", ASC)], unique=True)
     db.races.create_index("runners.horse")
+    db.races.create_index("datetime")
+    db.betfair.create_index(
+        [
+            ("racecourse", ASC),
+            ("race_datetime", ASC),
+            ("places", ASC),
+            ("race_description", ASC),
+        ],
+        unique=True,
+    )
 
 
 @flow
-def nuclear_reload():
+@report_metrics
+def nuclear_reload(*, transform_processes=0):
     drop_database()
     spec_database()
     load_racecourses()
     switch_date = pendulum.parse("2023-03-11").date()
-    load_rapid_horseracing_entries(until_date=switch_date)
-    load_theracingapi_data()
+    load_rapid_horseracing_entries(
+        until_date=switch_date, transform_processes=transform_processes
+    )
+    load_theracingapi_data(transform_processes=transform_processes)
     load_bha_data()
     load_formdata()
 
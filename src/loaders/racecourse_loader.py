@@ -7,16 +7,20 @@ sys.path.append(str(Path(__file__).resolve().parent.parent))
 from prefect import flow
 
 from clients import mongo_client as client
+from clients.mongo_client import refresh_racecourses
+from helpers.metrics import report_metrics
 from transformers.core_transformer import core_transformer
 
 db = client.handykapp
 
 
 @flow
+@report_metrics
 def load_racecourses():
     db.racecourses.drop()
     racecourses = core_transformer()
     db.racecourses.insert_many(racecourses)
+    refresh_racecourses()
 
 
 if __name__ == "__main__":
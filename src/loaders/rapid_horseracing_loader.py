@@ -4,14 +4,22 @@ from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
+from datetime import datetime
+
 import pendulum
 import tomllib
 from prefect import flow, get_run_logger
 
 from clients import SpacesClient
 from clients import mongo_client as client
+from clients.mongo_client import (
+    get_latest_race_datetime,
+    get_watermark,
+    update_watermark,
+)
+from helpers.metrics import report_metrics
 from models import RapidRecord
-from processors.record_processor import record_processor
+from processors.record_processor import make_record_processor
 from transformers.rapid_horseracing_transformer import (
     transform_results,
     transform_results_as_entries,
@@ -26,51 +34,107 @@ db = client.handykapp
 
 
 @flow
+@report_metrics
 def load_rapid_horseracing_entries(
-    *, until_date: pendulum.Date = pendulum.now().date()
+    *,
+    until_date: pendulum.Date = pendulum.now().date(),
+    transform_processes: int = 0,
+    transform_chunksize: int = 20,
 ):
     logger = get_run_logger()
     logger.info("Starting rapid_horseracing entries loader")
 
-    r = record_processor()
+    r = make_record_processor(transform_processes, transform_chunksize)
     next(r)
 
-    source_location = f"{SOURCE}results"
-    files = SpacesClient.get_files(source_location)
+    # The trailing slash keeps the to do list and manifests out of the listing
+    source_location = f"{SOURCE}results/"
+    files = SpacesClient.iter_files(source_location)
     logger.info(f"Processing files from {source_location}")
 
-    for file in files:
-        if "results_to_do_list.json" not in file:
-            data = SpacesClient.read_file(file)
-            try:
-                record = RapidRecord(**data)
-                if pendulum.parse(record.date).date() >= until_date:  # type: ignore[union-attr]
-                    continue
-                r.send((record, transform_results_as_entries, file, "rapid"))
-            except Exception:
-                logger.error(f"Unable to create a record from {file}")
+    for file, data in files:
+        try:
+            record = RapidRecord(**data)
+            if pendulum.parse(record.date).date() >= until_date:  # type: ignore[union-attr]
+                continue
+            r.send((record, transform_results_as_entries, file, "rapid"))
+        except Exception:
+            logger.error(f"Unable to create a record from {file}")
 
     r.close()
 
 
 @flow
-def load_rapid_horseracing_data():
+def increment_rapid_horseracing_data():
+    logger = get_run_logger()
+    watermark = get_watermark("rapid")
+
+    # Result keys are race ids rather than dates, so use modification times
+    if last_modified := watermark.get("last_modified"):
+        # Mongo hands back naive UTC datetimes, Spaces listings are timezone aware
+        last_modified = pendulum.instance(last_modified, tz="UTC")
+        logger.info(f"Loading results modified since {last_modified}")
+
+    # Results uploaded in the same second as the last load are listed again
+    load_rapid_horseracing_data(
+        modified_since=last_modified,
+        loaded_keys=watermark.get("last_modified_keys", []),
+    )
+
+
+@flow
+@report_metrics
+def load_rapid_horseracing_data(
+    *,
+    modified_since: datetime | None = None,
+    loaded_keys: list[str] | None = None,
+    transform_processes: int = 0,
+    transform_chunksize: int = 20,
+):
     logger = get_run_logger()
     logger.info("Starting rapid_horseracing loader")
 
-    r = record_processor()
+    r = make_record_processor(transform_processes, transform_chunksize)
     next(r)
 
-    files = SpacesClient.get_files(f"{SOURCE}results")
-
-    for file in files:
-        if file != "results_to_do_list.json":
-            data = SpacesClient.read_file(file)
+    skipped_keys = set(loaded_keys or [])
+    files = SpacesClient.iter_files(
+        f"{SOURCE}results/",
+        modified_since=modified_since,
+        key_filter=lambda x: x not in skipped_keys,
+    )
+
+    last_file = None
+    last_modified = modified_since
+    last_modified_keys = list(skipped_keys)
+    for file, data in files:
+        try:
             record = RapidRecord(**data)
             r.send((record, transform_results, file, "rapid"))
+        except Exception:
+            logger.error(f"Unable to create a record from {file}")
+
+        last_file = file
+        file_modified = SpacesClient.get_last_modified(file)
+        if not file_modified:
+            continue
+        if not last_modified or file_modified > last_modified:
+            last_modified = file_modified
+            last_modified_keys = [file]
+        elif file_modified == last_modified:
+            last_modified_keys.append(file)
 
     r.close()
 
+    if last_file:
+        update_watermark(
+            "rapid",
+            last_key=last_file,
+            last_modified=last_modified,
+            last_modified_keys=last_modified_keys,
+            last_race_datetime=get_latest_race_datetime(),
+        )
+
 
 if __name__ == "__main__":
     load_rapid_horseracing_data()
@@ -5,6 +5,8 @@ from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
+from datetime import datetime
+
 import pendulum
 import tomllib
 from pendulum import Date
@@ -12,8 +14,14 @@ from prefect import flow, get_run_logger
 
 from clients import SpacesClient
 from clients import mongo_client as client
+from clients.mongo_client import (
+    get_latest_race_datetime,
+    get_watermark,
+    update_watermark,
+)
+from helpers.metrics import report_metrics
 from models import TheRacingApiRacecard
-from processors.record_processor import record_processor
+from processors.record_processor import make_record_processor
 from transformers.theracingapi_transformer import transform_races
 
 with Path("settings.toml").open("rb") as f:
@@ -27,34 +35,63 @@ db = client.handykapp
 @flow
 def increment_theracingapi_data():
     logger = get_run_logger()
-    logger.info("Querying database for most recent race")
-    races = list(db.races.find().sort("datetime", -1))
-    logger.info(f"{len(races)} races found")
-    if races:
-        most_recent = races[-1]["datetime"]
-        logger.info(f"Most recent race on db is: {pendulum.parse(most_recent)}")
-        load_theracingapi_data(from_date=pendulum.parse(most_recent))
+    watermark = get_watermark("theracingapi")
+
+    if last_key := watermark.get("last_key"):
+        logger.info(f"Last racecards loaded were {last_key}")
+        if last_modified := watermark.get("last_modified"):
+            # Mongo hands back naive UTC datetimes, Spaces listings are timezone aware
+            last_modified = pendulum.instance(last_modified, tz="UTC")
+
+        # List from just before the last key, in case its racecards were refetched
+        load_theracingapi_data(
+            start_after=last_key.rsplit(".", 1)[0],
+            last_key=last_key,
+            last_modified=last_modified,
+        )
+    elif most_recent := get_latest_race_datetime():
+        logger.info(f"Most recent race on db is: {most_recent}")
+        load_theracingapi_data(from_date=pendulum.instance(most_recent).date())
     else:
         logger.info("No races currently in db")
         load_theracingapi_data()
 
 
 @flow
-def load_theracingapi_data(*, from_date: Date | None = None):
+@report_metrics
+def load_theracingapi_data(
+    *,
+    from_date: Date | None = None,
+    start_after: str | None = None,
+    last_key: str | None = None,
+    last_modified: datetime | None = None,
+    transform_processes: int = 0,
+    transform_chunksize: int = 20,
+):
     logger = get_run_logger()
     logger.info("Starting theracingapi loader")
 
-    r = record_processor()
+    r = make_record_processor(transform_processes, transform_chunksize)
     next(r)
     record_count = 0
-    for file in SpacesClient.get_files(f"{SOURCE}racecards"):
-        if from_date:
-            file_date = pendulum.parse(file.split(".")[0][-8:]).date()  # type: ignore[union-attr]
-            if file_date < from_date:
-                continue
 
+    def is_wanted(file):
+        if file == last_key:
+            # Only reload the last racecards loaded if they have changed since
+            modified = SpacesClient.get_last_modified(file)
+            return not (last_modified and modified and modified <= last_modified)
+        if not from_date:
+            return True
+        file_date = pendulum.parse(file.split(".")[0][-8:]).date()  # type: ignore[union-attr]
+        return file_date >= from_date
+
+    files = SpacesClient.iter_files(
+        f"{SOURCE}racecards", start_after=start_after, key_filter=is_wanted
+    )
+    last_file = None
+    for file, contents in files:
+        last_file = file
         logger.info(f"Reading {file}")
-        contents = SpacesClient.read_file(file)
         for dec in contents["racecards"]:
             data = {k: v for k, v in dec.items() if k != "off_dt"}
             try:
@@ -69,6 +106,15 @@ def load_theracingapi_data(*, from_date: Date | None = None):
 
     r.close()
 
+    # Racecard keys sort by date, so later runs can list from here
+    if last_file:
+        update_watermark(
+            "theracingapi",
+            last_key=last_file,
+            last_modified=SpacesClient.get_last_modified(last_file),
+            last_race_datetime=get_latest_race_datetime(),
+        )
+
 
 if __name__ == "__main__":
     increment_theracingapi_data()
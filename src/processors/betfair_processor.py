@@ -1,34 +1,69 @@
+from collections import Counter
+from collections.abc import Generator, Mapping
+from typing import Any
+
 from prefect import get_run_logger
-from pymongo.errors import DuplicateKeyError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 from clients import mongo_client as client
+from helpers.metrics import instrument_processor
+from models.mongo_betfair_horserace_pnl import MongoBetfairHorseracePnl
 
 db = client.handykapp
 
+# Identify a P&L line, as the unique index on the betfair collection does
+PNL_KEY_FIELDS = ("racecourse", "race_datetime", "places", "race_description")
+
+
+def make_pnl_upsert(pnl_line: MongoBetfairHorseracePnl) -> UpdateOne:
+    fields = pnl_line.model_dump(exclude={"id"})
+    key = {field: fields.pop(field) for field in PNL_KEY_FIELDS}
+    return UpdateOne(key, {"$set": fields}, upsert=True)
+
+
+def write_pnl_upserts(operations: list[UpdateOne], logger: Any) -> Counter[str]:
+    """Upsert a batch of P&L lines, counting those added, updated, unchanged and skipped"""
+    result: Mapping[str, Any]
+    try:
+        result = db.betfair.bulk_write(operations, ordered=False).bulk_api_result
+    except BulkWriteError as e:
+        result = e.details
+        for error in result["writeErrors"]:
+            logger.warning(f"Unable to write P&L line {error['op']}: {error['errmsg']}")
+
+    logger.debug(f"Processed {len(operations)} bulk P&L operations")
+    return Counter(
+        added=result["nUpserted"],
+        updated=result["nModified"],
+        unchanged=result["nMatched"] - result["nModified"],
+        skipped=len(result["writeErrors"]),
+    )
+
 
-def betfair_processor():
+@instrument_processor("betfair_processor")
+def betfair_processor(
+    bulk_threshold: int = 1000,
+) -> Generator[None, MongoBetfairHorseracePnl, None]:
     logger = get_run_logger()
     logger.info("Starting betfair processor")
-    updated_count = 0
-    added_count = 0
-    skipped_count = 0
+    counts: Counter[str] = Counter()
+    bulk_operations: list[UpdateOne] = []
 
     try:
         while True:
             pnl_line = yield
-            
-            try:
-                inserted_pnl_line = db.betfair.insert_one(
-                    pnl_line.model_dump()
-                )
-                found_id = inserted_pnl_line.inserted_id
-                logger.debug(f"{pnl_line.racecourse} {pnl_line.race_datetime} P&L added to db. ID: {found_id}")
-                added_count += 1
-            except DuplicateKeyError:
-                logger.warning(f"Duplicate P&L line: {pnl_line.racecourse} {pnl_line.race_datetime}")
-                skipped_count += 1
+            bulk_operations.append(make_pnl_upsert(pnl_line))
+
+            if len(bulk_operations) >= bulk_threshold:
+                counts += write_pnl_upserts(bulk_operations, logger)
+                bulk_operations = []
 
     except GeneratorExit:
+        if bulk_operations:
+            counts += write_pnl_upserts(bulk_operations, logger)
+
         logger.info(
-            f"Finished processing Betfair P&L. Updated {updated_count}, added {added_count}, skipped {skipped_count}"
+            f"Finished processing Betfair P&L. Added {counts['added']}, updated {counts['updated']}, "
+            f"unchanged {counts['unchanged']}, skipped {counts['skipped']}"
         )
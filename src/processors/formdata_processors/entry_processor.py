@@ -2,7 +2,7 @@ from prefect import get_run_logger
 
 # from pymongo import InsertOne, UpdateOne
 from clients import mongo_client as client
-from clients.mongo_client import get_horse
+from clients.mongo_client import get_horse, horse_cache
 from models import PreMongoHorse
 
 # from models.formdata_horse import FormdataHorse
@@ -103,3 +103,5 @@ def entry_processor():
         logger.info(
             f"Completed processing {processed_count} horses into Formdata table. Updated {updated_count} horses in Horses table with results. Skipped {skipped_count} unfound horses."
         )
+        logger.info(horse_cache.describe())
+        rl.close()
@@ -1,13 +1,128 @@
+from collections import deque
+from collections.abc import Generator
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import get_context
+from tempfile import NamedTemporaryFile
+from typing import Any
+
 import fitz  # type: ignore
 from prefect import get_run_logger
 
 from clients import SpacesClient
-from transformers.formdata_transformer import get_formdata_date
+from models import FormdataHorse
+from transformers.formdata_transformer import get_formdata_date, is_horse
+
+from .entry_processor import entry_processor
+from .page_processor import page_processor, split_page_text
+from .word_processor import ErrorLog, FormdataParser
+
+# The lines before the first horse to start in a range of pages, the horses wholly
+# within it, the lines from the last horse to start on (or None if no horse starts),
+# and any errors logged while parsing
+type ParsedPages = tuple[list[str], list[FormdataHorse], list[str] | None, list[str]]
+
+
+def extract_page_texts(path: str, start: int, stop: int) -> list[str]:
+    with fitz.open(path) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+
+def parse_pages(path: str, start: int, stop: int, year: int) -> ParsedPages:
+    """Parse the horses in a range of pages, leaving those that may run over its ends"""
+    words = [
+        word
+        for text in extract_page_texts(path, start, stop)
+        for word in split_page_text(text)
+    ]
+
+    # Pages start with their header, so no header is skipped from an earlier range
+    scanner = FormdataParser(None)
+    starts = [
+        i for i, word in enumerate(words) if not scanner.skip(word) and is_horse(word)
+    ]
+    if not starts:
+        return words, [], None, []
+
+    log = ErrorLog()
+    parser = FormdataParser(log)
+    horses = [
+        horse
+        for word in words[starts[0] : starts[-1] + 1]
+        if (horse := parser.feed(word, year))
+    ]
+    return words[: starts[0]], horses, words[starts[-1] :], log.errors
+
+
+def forward_horses(
+    parsed: ParsedPages,
+    parser: FormdataParser,
+    year: int,
+    entry_gen: Generator[None, FormdataHorse, None],
+    logger: Any,
+) -> FormdataParser:
+    """Send a parsed range's horses on, returning the parser for the lines that follow"""
+    head, horses, tail, errors = parsed
+    for error in errors:
+        logger.error(error)
+
+    # The horse running over from earlier pages is finished by the first to start here
+    for word in head if tail is None else [*head, tail[0]]:
+        if horse := parser.feed(word, year):
+            entry_gen.send(horse)
+
+    if tail is None:
+        return parser
+
+    for horse in horses:
+        entry_gen.send(horse)
+
+    parser = FormdataParser(logger)
+    for word in tail:
+        parser.feed(word, year)
+    return parser
+
+
+def parse_file_in_parallel(
+    file: str,
+    parser: FormdataParser,
+    executor: ProcessPoolExecutor,
+    entry_gen: Generator[None, FormdataHorse, None],
+    logger: Any,
+    *,
+    pages_per_task: int,
+    max_in_flight: int,
+) -> tuple[FormdataParser, int]:
+    """Parse a file a range of pages per task, returning the parser and page count"""
+    year = get_formdata_date(file).year
+
+    with NamedTemporaryFile(suffix=".pdf") as pdf:
+        # Workers open the document themselves rather than being sent its contents
+        pdf.write(SpacesClient.stream_file(file))
+        pdf.flush()
 
-from .page_processor import page_processor
+        with fitz.open(pdf.name) as doc:
+            page_count = doc.page_count
 
+        in_flight: deque[Future] = deque()
+        for start in range(0, page_count, pages_per_task):
+            stop = min(start + pages_per_task, page_count)
+            in_flight.append(executor.submit(parse_pages, pdf.name, start, stop, year))
 
-def file_processor():
+            # Backpressure: only a few ranges' horses are held at once
+            if len(in_flight) >= max_in_flight:
+                parser = forward_horses(
+                    in_flight.popleft().result(), parser, year, entry_gen, logger
+                )
+
+        while in_flight:
+            parser = forward_horses(
+                in_flight.popleft().result(), parser, year, entry_gen, logger
+            )
+
+    return parser, page_count
+
+
+def serial_file_processor():
     logger = get_run_logger()
     logger.info("Starting file processor")
     page_count = 0
@@ -21,11 +136,56 @@ def file_processor():
             logger.info(f"Processing {file}")
 
             date = get_formdata_date(file)
-            doc = fitz.open("pdf", SpacesClient.stream_file(file))
-            for page in doc:
+            for page in fitz.open("pdf", SpacesClient.stream_file(file)):
                 p.send((page, date))
                 page_count += 1
 
     except GeneratorExit:
         logger.info(f"Processed {page_count} pages")
         p.close()
+
+
+def parallel_file_processor(workers: int, pages_per_task: int, max_in_flight: int):
+    logger = get_run_logger()
+    logger.info("Starting file processor")
+    page_count = 0
+
+    # Horses that run over a range boundary are put back together here
+    parser = FormdataParser(logger)
+
+    ep = entry_processor()
+    next(ep)
+
+    # Spawn rather than fork, as the parent has Prefect and Mongo threads running
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=get_context("spawn")
+    ) as executor:
+        try:
+            while True:
+                file = yield
+                logger.info(f"Processing {file}")
+
+                parser, file_page_count = parse_file_in_parallel(
+                    file,
+                    parser,
+                    executor,
+                    ep,
+                    logger,
+                    pages_per_task=pages_per_task,
+                    max_in_flight=max_in_flight,
+                )
+                page_count += file_page_count
+
+        except GeneratorExit:
+            logger.info(f"Processed {page_count} pages")
+            ep.close()
+
+
+def file_processor(
+    *, workers: int = 0, pages_per_task: int = 20, max_in_flight: int = 8
+):
+    """A file processor that parses pages in worker processes if any are requested"""
+    if workers:
+        return parallel_file_processor(workers, pages_per_task, max_in_flight)
+
+    return serial_file_processor()
@@ -3,6 +3,17 @@ from prefect import get_run_logger
 from .word_processor import word_processor
 
 
+def split_page_text(text: str) -> list[str]:
+    # Replace non-ascii characters with apostrophes
+    return (
+        text.replace(f"{chr(10)}{chr(25)}", "'")  # Newline + apostrophe
+        .replace(f"{chr(32)}{chr(25)}", "'")  # Space + apostrophe
+        .replace(chr(25), "'")  # Regular apostrophe
+        .replace(chr(65533), "'")  # Replacement character
+        .split("\n")
+    )
+
+
 def page_processor():
     logger = get_run_logger()
     logger.info("Starting page processor")
@@ -14,16 +25,9 @@ def page_processor():
         while True:
             item = yield
             page, date = item
-            text = page.get_text()
-            # Replace non-ascii characters with apostrophes
-            words = (
-                text.replace(f"{chr(10)}{chr(25)}", "'")  # Newline + apostrophe
-                .replace(f"{chr(32)}{chr(25)}", "'")  # Space + apostrophe
-                .replace(chr(25), "'")  # Regular apostrophe
-                .replace(chr(65533), "'")  # Replacement character
-                .split("\n")
-            )
-            for word in words:
+            # Pages may arrive as text already extracted
+            text = page if isinstance(page, str) else page.get_text()
+            for word in split_page_text(text):
                 w.send((word, date))
 
     except GeneratorExit:
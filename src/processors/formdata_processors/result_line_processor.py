@@ -1,7 +1,10 @@
 from collections.abc import Generator
+from datetime import datetime, timedelta
+from typing import Any
 
 from horsetalk import Going
 from prefect import get_run_logger
+from pymongo import UpdateOne
 
 from clients import mongo_client as client
 from clients.mongo_client import rr_code_to_course_dict
@@ -17,61 +20,75 @@ FORMDATA_AW_GOINGS = {
     "f": "Fast",
 }
 
+type ResultLine = tuple[dict, FormdataRun]
 
-def result_line_processor() -> Generator[None, tuple[dict, FormdataRun], None]:
-    logger = get_run_logger()
-    logger.info("Starting result line processor")
 
-    try:
-        while True:
-            horse, run = yield
-
-            surface = "AW" if run.going.lower() == run.going else "Turf"
-            racecourse_id = rr_code_to_course_dict().get((run.course, surface))
-
-            if not racecourse_id:
-                logger.warning(f"No racecourse found for {run.course} ({surface})")
-                continue
-
-            found_race = db.races.find_one(
-                {
-                    "racecourse": racecourse_id,
-                    "$expr": {
-                        "$eq": [
-                            {
-                                "$dateToString": {
-                                    "format": "%Y-%m-%d",
-                                    "date": "$datetime",
-                                }
-                            },
-                            run.date,
-                        ]
-                    },
-                    "runners.horse": horse["_id"],
-                }
-            )
+def make_day_range(date: str) -> dict:
+    """Match datetimes on a YYYY-MM-DD day in a way the racecourse/datetime index can serve"""
+    day_start = datetime.fromisoformat(date)
+    return {"$gte": day_start, "$lt": day_start + timedelta(days=1)}
 
-            if found_race:
-                race_id = found_race["_id"]
 
-                going_value = (
-                    run.going
-                    if surface == "Turf"
-                    else FORMDATA_AW_GOINGS.get(run.going, "Standard")
-                )
-                going_assessment = str(Going(going_value))
-                db.races.update_one(
-                    {"_id": race_id, "runners.horse": horse.id},
-                    {
-                        "$set": {
-                            "going_assessment": going_assessment,
-                            "runners.$.finishing_position": run.position,
-                            "runners.$.beaten_distance": run.beaten_distance,
-                            "runners.$.ratings.rr_time": run.time_rating,
-                            "runners.$.ratings.rr_form": run.form_rating,
-                        }
-                    },
-                )
+def get_surface(run: FormdataRun) -> str:
+    return "AW" if run.going.lower() == run.going else "Turf"
+
+
+def make_result_update(race_id: Any, horse_id: Any, run: FormdataRun) -> UpdateOne:
+    going_value = (
+        run.going
+        if get_surface(run) == "Turf"
+        else FORMDATA_AW_GOINGS.get(run.going, "Standard")
+    )
+    return UpdateOne(
+        {"_id": race_id, "runners.horse": horse_id},
+        {
+            "$set": {
+                "going_assessment": str(Going(going_value)),
+                "runners.$.finishing_position": run.position,
+                "runners.$.beaten_distance": run.beaten_distance,
+                "runners.$.ratings.rr_time": run.time_rating,
+                "runners.$.ratings.rr_form": run.form_rating,
+            }
+        },
+    )
+
+
+def group_result_lines(
+    lines: list[ResultLine], logger: Any
+) -> dict[tuple[Any, str], list[ResultLine]]:
+    groups: dict[tuple[Any, str], list[ResultLine]] = {}
+    for horse, run in lines:
+        surface = get_surface(run)
+        racecourse_id = rr_code_to_course_dict().get((run.course, surface))
+
+        if not racecourse_id:
+            logger.warning(f"No racecourse found for {run.course} ({surface})")
+            continue
+
+        groups.setdefault((racecourse_id, run.date), []).append((horse, run))
+
+    return groups
+
+
+def resolve_result_lines(lines: list[ResultLine], logger: Any) -> list[UpdateOne]:
+    """Match result lines to races with one query per racecourse and day"""
+    updates = []
+    for (racecourse_id, date), group in group_result_lines(lines, logger).items():
+        races = list(
+            db.races.find(
+                {"racecourse": racecourse_id, "datetime": make_day_range(date)},
+                {"runners.horse": 1},
+            )
+        )
+        race_by_horse = {
+            runner["horse"]: race["_id"]
+            for race in races
+            for runner in race.get("runners", [])
+        }
+
+        for horse, run in group:
+            if race_id := race_by_horse.get(horse["_id"]):
+                updates.append(make_result_update(race_id, horse["_id"], run))
                 logger.debug(
                     f"Added result for {horse['_id']} in race at {run.course} on {run.date}"
                 )
@@ -79,5 +96,54 @@ def result_line_processor() -> Generator[None, tuple[dict, FormdataRun], None]:
                 logger.warning(
                     f"No race found for {horse['_id']} at {run.course} on {run.date}"
                 )
+
+    return updates
+
+
+def write_result_updates(bulk_operations: list[UpdateOne], logger: Any) -> int:
+    result = db.races.bulk_write(bulk_operations, ordered=False)
+    logger.debug(f"Processed {len(bulk_operations)} bulk result operations")
+    return result.matched_count
+
+
+def result_line_processor(
+    batch_size: int = 1000, bulk_threshold: int = 500
+) -> Generator[None, ResultLine, None]:
+    logger = get_run_logger()
+    logger.info("Starting result line processor")
+    matched_count = 0
+    unmatched_count = 0
+    written_count = 0
+
+    lines: list[ResultLine] = []
+    bulk_operations: list[UpdateOne] = []
+
+    try:
+        while True:
+            lines.append((yield))
+
+            # Buffer roughly a page or more of runs before going to the db
+            if len(lines) >= batch_size:
+                updates = resolve_result_lines(lines, logger)
+                matched_count += len(updates)
+                unmatched_count += len(lines) - len(updates)
+                bulk_operations.extend(updates)
+                lines = []
+
+            if len(bulk_operations) >= bulk_threshold:
+                written_count += write_result_updates(bulk_operations, logger)
+                bulk_operations = []
+
     except GeneratorExit:
-        logger.info("Finished processing results.")
+        if lines:
+            updates = resolve_result_lines(lines, logger)
+            matched_count += len(updates)
+            unmatched_count += len(lines) - len(updates)
+            bulk_operations.extend(updates)
+
+        if bulk_operations:
+            written_count += write_result_updates(bulk_operations, logger)
+
+        logger.info(
+            f"Finished processing results. Matched {matched_count}, unmatched {unmatched_count}, written {written_count}"
+        )
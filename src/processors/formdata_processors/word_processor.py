@@ -1,5 +1,8 @@
+from typing import Any
+
 from prefect import get_run_logger
 
+from models import FormdataHorse
 from transformers.formdata_transformer import (
     create_horse,
     create_run,
@@ -10,14 +13,94 @@ from transformers.formdata_transformer import (
 from .entry_processor import entry_processor
 
 
+class ErrorLog:
+    """Stands in for the run logger in worker processes, keeping errors to log later"""
+
+    def __init__(self) -> None:
+        self.errors: list[str] = []
+
+    def error(self, message: str) -> None:
+        self.errors.append(message)
+
+
+class FormdataParser:
+    """Builds horses and their runs from the lines of formdata pages, in order"""
+
+    def __init__(self, logger: Any):
+        self.logger = logger
+        self.horse: FormdataHorse | None = None
+        self.horse_args: list[str] = []
+        self.run_args: list[str] = []
+        self.adding_horses = False
+        self.adding_runs = False
+        self.skip_count = 0
+
+    def skip(self, word: str) -> bool:
+        """Whether the line belongs to a page header"""
+        if "FORMDATA" in word:
+            self.skip_count = 3
+            return True
+
+        if self.skip_count > 0:
+            self.skip_count -= 1
+            return True
+
+        return False
+
+    def feed(self, word: str, year: int) -> FormdataHorse | None:
+        """Take the next line, returning the previous horse once the next one starts"""
+        if self.skip(word):
+            return None
+
+        horse_switch = is_horse(word)
+        run_switch = is_race_date(word)
+
+        # Switch on/off adding horses/runs
+        if horse_switch:
+            self.adding_horses = True
+            self.adding_runs = False
+        elif run_switch:
+            self.adding_horses = False
+            self.adding_runs = True
+        elif "then" in word:
+            self.adding_horses = False
+            self.adding_runs = False
+
+        # Create horses/runs
+        if run_switch and len(self.horse_args):
+            self.horse = create_horse(self.horse_args, year, self.logger)
+            self.horse_args = []
+
+        if (horse_switch or run_switch) and len(self.run_args):
+            run = create_run(self.run_args, self.logger)
+            if not self.horse:
+                self.logger.error("Run created but no horse to add it to")
+            elif run is None:
+                self.logger.error(f"Missing run for {self.horse.name}")
+            else:
+                self.horse.runs.append(run)
+            self.run_args = []
+
+        # Pass on the finished horse
+        finished = None
+        if horse_switch and self.horse:
+            finished = self.horse
+            self.horse = None
+
+        # Add words to horses/runs
+        if self.adding_horses:
+            self.horse_args.append(word)
+        elif self.adding_runs:
+            self.run_args.append(word)
+
+        return finished
+
+
 def word_processor():
     logger = get_run_logger()
     logger.info("Starting word processor")
-    horse = None
-    horse_args = []
-    run_args = []
-    adding_horses = False
-    adding_runs = False
+
+    parser = FormdataParser(logger)
 
     ep = entry_processor()
     next(ep)
@@ -26,53 +109,8 @@ def word_processor():
         while True:
             item = yield
             word, date = item
-            if "FORMDATA" in word:
-                skip_count = 3
-                continue
-
-            if skip_count > 0:
-                skip_count -= 1
-                continue
-
-            horse_switch = is_horse(word)
-            run_switch = is_race_date(word)
-
-            # Switch on/off adding horses/runs
-            if horse_switch:
-                adding_horses = True
-                adding_runs = False
-            elif run_switch:
-                adding_horses = False
-                adding_runs = True
-            elif "then" in word:
-                adding_horses = False
-                adding_runs = False
-
-            # Create horses/runs
-            if run_switch and len(horse_args):
-                horse = create_horse(horse_args, date.year)
-                horse_args = []
-
-            if (horse_switch or run_switch) and len(run_args):
-                run = create_run(run_args)
-                if horse and run is None:
-                    logger.error(f"Missing run for {horse.name}")
-                elif horse:
-                    horse.runs.append(run)
-                else:
-                    logger.error("Run created but no horse to add it to")
-                run_args = []
-
-            # Add horses/runs to db
-            if horse_switch and horse:
+            if horse := parser.feed(word, date.year):
                 ep.send(horse)
-                horse = None
-
-            # Add words to horses/runs
-            if adding_horses:
-                horse_args.append(word)
-            elif adding_runs:
-                run_args.append(word)
 
     except GeneratorExit:
         ep.close()
@@ -1,34 +1,57 @@
+import re
 from collections.abc import Generator
+from typing import Any
 
+from bson import ObjectId
 from peak_utility.listish import compact
 from prefect import get_run_logger
-from pymongo import UpdateOne
-from pymongo.errors import DuplicateKeyError
+from pymongo import InsertOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
 
-from clients.mongo_client import get_horse, mongo_client
+from clients.mongo_client import (
+    create_apostrophe_regex,
+    get_horse,
+    horse_cache,
+    make_horse_sex_search,
+    mongo_client,
+)
 from helpers import get_operations, make_operations_update
+from helpers.metrics import instrument_processor
 from models import MongoHorse, PreMongoHorse
 
 db = mongo_client.handykapp
 
+DUPLICATE_KEY_ERROR = 11000
 
-def make_horse_update_dictionary(horse: PreMongoHorse, db_horse: MongoHorse):
+type HorseKey = tuple[str, str | None, int | None]
+# Each operation carries the horse it writes and the id it writes to
+type HorseOperation = tuple[InsertOne | UpdateOne, PreMongoHorse, ObjectId]
+
+
+def make_horse_key(horse: PreMongoHorse) -> HorseKey:
+    return (horse.name, horse.country, horse.year)
+
+
+def make_name_key(name: str) -> str:
+    # Names the apostrophe regex can match differ only in case and apostrophes
+    return name.upper().replace("'", "")
+
+
+def make_horse_update_dictionary(
+    horse: PreMongoHorse, db_horse: MongoHorse, staging: "HorseStaging"
+):
     return compact(
         {
             "colour": horse.colour,
-            "sire": sire["_id"]
-            if (horse.sire and (sire := get_horse(horse.sire)))
-            else None,
-            "dam": dam["_id"]
-            if (horse.dam and (dam := get_horse(horse.dam)))
-            else None,
+            "sire": staging.get_horse_id(horse.sire) if horse.sire else None,
+            "dam": staging.get_horse_id(horse.dam) if horse.dam else None,
             "operations": make_operations_update(horse, db_horse),
             "ratings": horse.ratings,
         }
     )
 
 
-def make_horse_insert_dictionary(horse: PreMongoHorse):
+def make_horse_insert_dictionary(horse: PreMongoHorse, staging: "HorseStaging"):
     return compact(
         {
             "name": horse.name,
@@ -36,67 +59,213 @@ def make_horse_insert_dictionary(horse: PreMongoHorse):
             "year": horse.year,
             "country": horse.country,
             "colour": horse.colour,
-            "sire": sire["_id"]
-            if (horse.sire and (sire := get_horse(horse.sire)))
-            else None,
-            "dam": dam["_id"]
-            if (horse.dam and (dam := get_horse(horse.dam)))
-            else None,
+            "sire": staging.get_horse_id(horse.sire) if horse.sire else None,
+            "dam": staging.get_horse_id(horse.dam) if horse.dam else None,
             "operations": get_operations(horse),
             "ratings": horse.ratings,
         }
     )
 
 
-def horse_processor() -> Generator[None, PreMongoHorse, None]:
+def relink_parents(
+    replacements: dict[ObjectId, ObjectId | None], horse_ids: list[ObjectId]
+) -> None:
+    """Point horses written in a batch at the ids their parents were stored under"""
+    operations = [
+        UpdateMany(
+            {parent: old_id, "_id": {"$in": horse_ids}},
+            {"$set": {parent: new_id}} if new_id else {"$unset": {parent: ""}},
+        )
+        for old_id, new_id in replacements.items()
+        for parent in ("sire", "dam")
+    ]
+    if operations:
+        db.horses.bulk_write(operations, ordered=False)
+
+
+def bulk_write_horses(
+    operations: list[HorseOperation], logger: Any
+) -> dict[ObjectId, ObjectId | None]:
+    """Write buffered horse operations, returning replacement ids for failed inserts"""
+    replacements: dict[ObjectId, ObjectId | None] = {}
+
+    try:
+        db.horses.bulk_write([op for op, _, _ in operations], ordered=False)
+    except BulkWriteError as e:
+        for error in e.details["writeErrors"]:
+            op, horse, horse_id = operations[error["index"]]
+            is_insert = isinstance(op, InsertOne)
+            if error["code"] == DUPLICATE_KEY_ERROR and is_insert:
+                existing = get_horse(horse)
+                replacements[horse_id] = existing["_id"] if existing else None
+                logger.debug(f"{horse.name} already in db")
+            else:
+                logger.warning(f"Unable to write {horse}: {error['errmsg']}")
+                if is_insert:
+                    replacements[horse_id] = None
+
+    # Cached documents for updated horses no longer reflect what is stored
+    horse_cache.invalidate(
+        horse_id for op, _, horse_id in operations if isinstance(op, UpdateOne)
+    )
+
+    # Parents are only ever staged alongside the horses that refer to them, so
+    # the duplicates found in this batch are the only ones that need relinking
+    relink_parents(replacements, [horse_id for _, _, horse_id in operations])
+
+    logger.debug(
+        f"Processed {len(operations)} bulk horse operations, {len(replacements)} inserts replaced"
+    )
+    return replacements
+
+
+class HorseStaging:
+    """Horse writes buffered during a run, shared by every processor that stages them"""
+
+    def __init__(self, threshold: int = 500):
+        self.threshold = threshold
+        # New horses, keyed so later references resolve to the id they will be given
+        self.inserts: dict[HorseKey, tuple[PreMongoHorse, dict]] = {}
+        self.keys_by_name: dict[str, list[HorseKey]] = {}
+        self.updates: list[HorseOperation] = []
+        # Staged ids that turned out to be duplicates, and the ids stored instead
+        self.replacements: dict[ObjectId, ObjectId | None] = {}
+
+    def __len__(self) -> int:
+        return len(self.inserts) + len(self.updates)
+
+    def find_staged(
+        self, horse: PreMongoHorse, *, exact: bool = False
+    ) -> HorseKey | None:
+        """The staged insert for a horse, matched as get_horse would match it once stored"""
+        if (key := make_horse_key(horse)) in self.inserts:
+            return key
+        if exact:
+            return None
+
+        documents = [
+            (key, self.inserts[key][1])
+            for key in self.keys_by_name.get(make_name_key(horse.name), [])
+        ]
+        sex_search = make_horse_sex_search(horse)
+        for key, document in documents:
+            if all(document.get(k) == v for k, v in sex_search.items()):
+                return key
+
+        name_regex = re.compile(create_apostrophe_regex(horse.name), re.IGNORECASE)
+        for key, document in documents:
+            if (
+                name_regex.fullmatch(document["name"])
+                and document.get("country") == horse.country
+                and document.get("year") == horse.year
+            ):
+                return key
+
+        return None
+
+    def get_horse_id(self, horse: PreMongoHorse) -> ObjectId | None:
+        # An exact match, whether staged or stored, beats a looser one
+        if key := self.find_staged(horse, exact=True):
+            return self.inserts[key][1]["_id"]
+        if found := get_horse(horse):
+            return found["_id"]
+        if key := self.find_staged(horse):
+            return self.inserts[key][1]["_id"]
+        return None
+
+    def stage_update(self, horse: PreMongoHorse, db_horse: Any) -> ObjectId:
+        self.updates.append(
+            (
+                UpdateOne(
+                    {"_id": db_horse["_id"]},
+                    {"$set": make_horse_update_dictionary(horse, db_horse, self)},
+                ),
+                horse,
+                db_horse["_id"],
+            )
+        )
+        return db_horse["_id"]
+
+    def stage_insert(self, horse: PreMongoHorse) -> ObjectId:
+        """Stage a new horse, or update the insert already staged for it"""
+        if key := self.find_staged(horse):
+            staged_horse, document = self.inserts[key]
+            # Only what an update to the stored horse would have set
+            staged = MongoHorse.model_construct(operations=document.get("operations"))
+            update = make_horse_update_dictionary(horse, staged, self)
+            self.inserts[key] = (staged_horse, document | update)
+            return document["_id"]
+
+        document = make_horse_insert_dictionary(horse, self)
+        horse_id = ObjectId()
+        key = make_horse_key(horse)
+        self.inserts[key] = (horse, document | {"_id": horse_id})
+        self.keys_by_name.setdefault(make_name_key(horse.name), []).append(key)
+        return horse_id
+
+    def is_staged(self, horse: PreMongoHorse, *, exact: bool = False) -> bool:
+        return self.find_staged(horse, exact=exact) is not None
+
+    def flush(self, logger: Any) -> dict[ObjectId, ObjectId | None]:
+        """Write every staged horse, returning replacement ids for failed inserts"""
+        if not self:
+            return {}
+
+        operations: list[HorseOperation] = [
+            (InsertOne(document), horse, document["_id"])
+            for horse, document in self.inserts.values()
+        ]
+        operations.extend(self.updates)
+        self.inserts = {}
+        self.keys_by_name = {}
+        self.updates = []
+
+        replacements = bulk_write_horses(operations, logger)
+        self.replacements.update(replacements)
+        return replacements
+
+
+@instrument_processor("horse_processor")
+def horse_processor(staging: HorseStaging) -> Generator[None, PreMongoHorse, None]:
     logger = get_run_logger()
     logger.info("Starting runner processor")
     added_count = 0
     updated_count = 0
     skipped_count = 0
 
-    bulk_operations = []
-    bulk_threshold = 500
-
     try:
         while True:
             horse = yield
 
-            db_horse = get_horse(horse)
-
-            if db_horse:
-                bulk_operations.append(
-                    UpdateOne(
-                        {"_id": db_horse["_id"]},
-                        {"$set": make_horse_update_dictionary(horse, db_horse)},
-                    )
-                )
+            # Staged horses are not in the db yet, so there is nothing to look up
+            if not staging.is_staged(horse, exact=True) and (
+                db_horse := get_horse(horse)
+            ):
+                staging.stage_update(horse, db_horse)
                 logger.debug(f"{horse.name} updated")
                 updated_count += 1
             else:
+                is_staged = staging.is_staged(horse)
                 try:
-                    db.horses.insert_one(make_horse_insert_dictionary(horse))
-                    logger.debug(f"{horse.name} added to db")
-                    added_count += 1
-                except DuplicateKeyError:
-                    logger.warning(f"Duplicate horse: {horse})")
-                    skipped_count += 1
+                    staging.stage_insert(horse)
+                    if is_staged:
+                        logger.debug(f"{horse.name} merged into staged insert")
+                    else:
+                        logger.debug(f"{horse.name} staged for insert")
+                        added_count += 1
                 except ValueError as e:
                     logger.warning(e)
                     skipped_count += 1
 
             # Process bulk operations when threshold reached
-            if bulk_operations and len(bulk_operations) >= bulk_threshold:
-                db.horses.bulk_write(bulk_operations)
-                logger.debug(f"Processed {len(bulk_operations)} bulk horse operations")
-                bulk_operations = []
+            if len(staging) >= staging.threshold:
+                staging.flush(logger)
 
     except GeneratorExit:
         # Process any remaining bulk operations
-        if bulk_operations:
-            db.horses.bulk_write(bulk_operations)
-            logger.debug(f"Processed {len(bulk_operations)} remaining bulk operations")
+        staging.flush(logger)
 
         logger.info(
             f"Finished processing horses. Updated {updated_count}, added {added_count}, skipped {skipped_count}"
         )
+        logger.info(horse_cache.describe())
@@ -1,23 +1,90 @@
-from collections.abc import Generator
+from collections import defaultdict
+from collections.abc import Generator, Iterable
+from functools import cache
 
+from bson import ObjectId
 from nameparser import HumanName  # type: ignore
 from prefect import get_run_logger
+from pymongo import UpdateOne
 from pymongo.errors import DuplicateKeyError
 
 from clients import mongo_client as client
+from helpers.metrics import instrument_processor
 from models import PreMongoPerson, PyObjectId
 
 db = client.handykapp
 
-
-def preload_person_cache(names, source):
-    """Preload cache with people already in database"""
-    cache = {}
-    if not names:
+type PeopleIndexEntry = tuple[int, PyObjectId]
+
+
+@cache
+def parse_name(name: str) -> HumanName:
+    return HumanName(name)
+
+
+class PeopleIndex:
+    """In-memory index of people by last name, bucketed by first name and by initial and title"""
+
+    def __init__(self) -> None:
+        self._count = 0
+        self._by_first: defaultdict[tuple, list[PeopleIndexEntry]] = defaultdict(list)
+        self._by_initial: defaultdict[tuple, list[PeopleIndexEntry]] = defaultdict(list)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @classmethod
+    def load(cls) -> "PeopleIndex":
+        index = cls()
+        for person in db.people.find({}, {"_id": 1, "first": 1, "last": 1, "title": 1}):
+            index.add(
+                person["_id"],
+                person.get("last"),
+                person.get("first"),
+                person.get("title"),
+            )
+        return index
+
+    def add(
+        self,
+        person_id: PyObjectId,
+        last: str | None,
+        first: str | None,
+        title: str | None,
+    ) -> None:
+        # Entries are numbered so that the earliest added person wins, as in the db
+        entry = (self._count, person_id)
+        self._count += 1
+        self._by_first[last, first].append(entry)
+        if first:
+            self._by_initial[last, first[0], title].append(entry)
+
+    def find(self, name_parts: HumanName) -> PyObjectId | None:
+        last, first, title = name_parts.last, name_parts.first, name_parts.title
+        candidates = self._by_first.get((last, first), [])[:1]
+        if first:
+            candidates += self._by_initial.get((last, first[0], title), [])[:1]
+        return min(candidates)[1] if candidates else None
+
+
+type PersonCache = dict[tuple[str, str], PyObjectId]
+
+
+def preload_person_cache(names: Iterable[str] | None, source: str) -> PersonCache:
+    """Preload cache with people already in database, or with all of a source's people if no names given"""
+    cache: PersonCache = {}
+    if names is not None and not names:
         return cache
 
     # Batch query people by names
-    persons = db.people.find({"references." + source: {"$in": list(names)}})
+    persons = db.people.find(
+        {
+            f"references.{source}": {"$exists": True}
+            if names is None
+            else {"$in": list(names)}
+        },
+        {"references": 1},
+    )
     for person in persons:
         source_name = person.get("references", {}).get(source)
         if source_name:
@@ -25,63 +92,60 @@ def preload_person_cache(names, source):
     return cache
 
 
-def person_processor() -> Generator[None, tuple[PreMongoPerson, str], None]:
+@instrument_processor("person_processor")
+def person_processor(
+    person_cache: PersonCache | None = None, *, preload_source: str | None = None
+) -> Generator[PyObjectId | None, tuple[PreMongoPerson, str], None]:
+    """
+    Callers may share person_cache in order to preload a batch of names before any
+    of them is sent. With preload_source, every person already referenced by that
+    source (rapid, theracingapi, racing_research, rr) is cached at startup.
+    """
     logger = get_run_logger()
     logger.info("Starting person processor")
-    person_cache: dict[tuple[str, str], PyObjectId] = {}
-    pending_people = set()
-    batch_size = 50
+    person_cache = {} if person_cache is None else person_cache
+    if preload_source:
+        person_cache.update(preload_person_cache(None, preload_source))
+        logger.info(f"Preloaded {len(person_cache)} people from {preload_source}")
+    people_index = PeopleIndex.load()
+    logger.info(f"Indexed {len(people_index)} people")
+    cache_hits = 0
+    cache_misses = 0
     updated_count = 0
     added_count = 0
     skipped_count = 0
 
+    race_operations = []
+    race_operations_threshold = 500
+
+    found_id = None
+
     try:
         while True:
-            person, source = yield
+            # send() returns the id of the person just processed so callers can embed it
+            person, source = yield found_id
+            found_id = None
             name = person.name
             race_id = person.race_id
             runner_id = person.runner_id
             role = person.role
             ratings = person.ratings or None
 
-            # Add to pending batch
-            pending_people.add(name)
-
-            # When batch gets large enough, preload cache
-            if len(pending_people) >= batch_size:
-                logger.debug(f"Preloading cache with {len(pending_people)} people")
-                person_cache.update(preload_person_cache(pending_people, source))
-                pending_people = set()
-
             cache_key = (name, source)
             if cache_key in person_cache:
                 found_id = person_cache[cache_key]
                 logger.debug(f"Cache hit for {name}")
+                cache_hits += 1
                 if ratings:
                     db.people.update_one(
                         {"_id": found_id},
                         {"$set": {"ratings": ratings}},
                     )
             else:
-                found_person = None
-                name_parts = HumanName(name)
+                cache_misses += 1
+                name_parts = parse_name(name)
 
-                # Only fetch fields we need for matching - much faster
-                possibilities = db.people.find(
-                    {"last": name_parts.last}, {"_id": 1, "first": 1, "title": 1}
-                )
-                for possibility in possibilities:
-                    if name_parts.first == possibility["first"] or (
-                        name_parts.first
-                        and possibility["first"]
-                        and name_parts.first[0] == possibility["first"][0]
-                        and name_parts.title == possibility["title"]
-                    ):
-                        found_person = possibility
-                        break
-
-                if found_person:
-                    found_id = found_person["_id"]
+                if found_id := people_index.find(name_parts):
                     update_data = {f"references.{source}": name} | (
                         {"ratings": ratings} if ratings else {}
                     )
@@ -99,20 +163,47 @@ def person_processor() -> Generator[None, tuple[PreMongoPerson, str], None]:
                             | ({"ratings": ratings} if ratings else {})
                         )
                         found_id = inserted_person.inserted_id
+                        people_index.add(
+                            found_id,
+                            name_parts.last,
+                            name_parts.first,
+                            name_parts.title,
+                        )
                         logger.debug(f"{person} added to db")
                         added_count += 1
                     except DuplicateKeyError:
                         logger.warning(f"Duplicate person: {name}")
                         skipped_count += 1
 
-            # Add person to horse in race
-            if race_id:
-                db.races.update_one(
-                    {"_id": race_id, "runners.horse": runner_id},
-                    {"$set": {f"runners.$.{role}": found_id}},
+                if found_id:
+                    person_cache[cache_key] = found_id
+
+            # Add person to horse in race, for callers that cannot embed the id
+            if race_id and found_id:
+                race_operations.append(
+                    UpdateOne(
+                        {
+                            "_id": ObjectId(race_id),
+                            "runners.horse": ObjectId(runner_id),
+                        },
+                        {"$set": {f"runners.$.{role}": found_id}},
+                    )
                 )
 
+            if len(race_operations) >= race_operations_threshold:
+                db.races.bulk_write(race_operations, ordered=False)
+                logger.debug(f"Processed {len(race_operations)} bulk race operations")
+                race_operations = []
+
     except GeneratorExit:
+        if race_operations:
+            db.races.bulk_write(race_operations, ordered=False)
+            logger.debug(f"Processed {len(race_operations)} remaining bulk operations")
+
         logger.info(
             f"Finished processing people. Updated {updated_count}, added {added_count}, skipped {skipped_count}"
         )
+        if lookups := cache_hits + cache_misses:
+            logger.info(
+                f"Person cache hit rate {cache_hits / lookups:.1%} ({cache_hits}/{lookups})"
+            )
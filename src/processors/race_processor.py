@@ -7,8 +7,9 @@ from pymongo.errors import DuplicateKeyError
 
 from clients import mongo_client as client
 from clients.mongo_client import get_racecourse_id
+from helpers.metrics import instrument_processor
 from models import PreMongoRace
-from processors.horse_processor import horse_processor
+from processors.horse_processor import HorseStaging, horse_processor
 from processors.runner_processor import runner_processor
 
 db = client.handykapp
@@ -33,6 +34,7 @@ def make_update_dictionary(race, racecourse_id) -> dict:
     )
 
 
+@instrument_processor("race_processor")
 def race_processor() -> Generator[None, tuple[PreMongoRace, str], None]:
     logger = get_run_logger()
     logger.info("Starting race processor")
@@ -40,10 +42,13 @@ def race_processor() -> Generator[None, tuple[PreMongoRace, str], None]:
     updated_count = 0
     skipped_count = 0
 
-    h = horse_processor()
+    # Shared so that runners can refer to horses staged as parents, and vice versa
+    staging = HorseStaging()
+
+    h = horse_processor(staging)
     next(h)
 
-    r = runner_processor()
+    r = runner_processor(staging)
     next(r)
 
     try:
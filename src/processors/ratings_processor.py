@@ -1,63 +1,115 @@
 from collections.abc import Generator
+from typing import Any
 
 from prefect import get_run_logger
 from pymongo import UpdateOne
 
 from clients import mongo_client as client
-from clients.mongo_client import get_horse
+from clients.mongo_client import get_horse, get_horses, horse_cache
+from helpers.metrics import instrument_processor
 from models import PreMongoHorse
 
 db = client.handykapp
 
 
-def ratings_processor() -> Generator[None, PreMongoHorse, None]:
+def make_ratings_update(horse_id: Any, horse: PreMongoHorse) -> UpdateOne:
+    return UpdateOne(
+        {"_id": horse_id},
+        {"$set": {"ratings": horse.ratings.model_dump() if horse.ratings else {}}},
+    )
+
+
+def find_rated_horses(horses: list[PreMongoHorse], logger: Any) -> list[dict | None]:
+    """Look up a batch of horses at once, or one at a time if the batch lookup fails"""
+    try:
+        return get_horses(horses)
+    except Exception as e:
+        logger.warning(f"Failed to look up {len(horses)} horses together: {e}")
+
+    horse_docs: list[dict | None] = []
+    for horse in horses:
+        try:
+            horse_docs.append(get_horse(horse))
+        except Exception as e:
+            logger.warning(f"Failed to add ratings to {horse.name}: {e}")
+            horse_docs.append(None)
+    return horse_docs
+
+
+def resolve_ratings(
+    horses: list[PreMongoHorse], logger: Any
+) -> tuple[list[UpdateOne], list[Any]]:
+    """Match a batch of rated horses to the db, returning updates and their horse ids"""
+    updates = []
+    horse_ids = []
+    for horse, horse_doc in zip(horses, find_rated_horses(horses, logger), strict=True):
+        if not horse_doc:
+            logger.debug(f"No horse found for {horse.name}")
+            continue
+
+        # A bad row is skipped rather than losing the rest of the batch
+        try:
+            updates.append(make_ratings_update(horse_doc["_id"], horse))
+        except Exception as e:
+            logger.warning(f"Failed to add ratings to {horse.name}: {e}")
+            continue
+
+        horse_ids.append(horse_doc["_id"])
+
+    return updates, horse_ids
+
+
+def write_ratings_updates(
+    bulk_operations: list[UpdateOne], horse_ids: list[Any], logger: Any
+) -> None:
+    db.horses.bulk_write(bulk_operations, ordered=False)
+    horse_cache.invalidate(horse_ids)
+    logger.debug(f"Processed {len(bulk_operations)} bulk horse operations")
+
+
+@instrument_processor("ratings_processor")
+def ratings_processor(
+    batch_size: int = 1000, bulk_threshold: int = 5000
+) -> Generator[None, PreMongoHorse, None]:
     logger = get_run_logger()
     logger.info("Starting ratings processor")
     updated_count = 0
     skipped_count = 0
 
-    bulk_operations = []
-    bulk_threshold = 50
+    horses: list[PreMongoHorse] = []
+    bulk_operations: list[UpdateOne] = []
+    bulk_horse_ids: list[Any] = []
 
     try:
         while True:
-            horse = yield
-
-            try:
-                horse_doc = get_horse(horse)
-
-                if not horse_doc:
-                    skipped_count += 1
-                    continue
-
-                bulk_operations.append(
-                    UpdateOne(
-                        {"_id": horse_doc["_id"]},
-                        {
-                            "$set": {
-                                "ratings": horse.ratings.model_dump()
-                                if horse.ratings
-                                else {}
-                            }
-                        },
-                    )
-                )
-                updated_count += 1
-            except Exception as e:
-                logger.warning(f"Failed to add ratings to {horse.name}: {e}")
-                skipped_count += 1
-
-            if bulk_operations and len(bulk_operations) >= bulk_threshold:
-                db.horses.bulk_write(bulk_operations)
-                logger.debug(f"Processed {len(bulk_operations)} bulk horse operations")
+            horses.append((yield))
+
+            # Resolve horses a batch at a time, with a few queries per batch
+            if len(horses) >= batch_size:
+                updates, horse_ids = resolve_ratings(horses, logger)
+                updated_count += len(updates)
+                skipped_count += len(horses) - len(updates)
+                bulk_operations.extend(updates)
+                bulk_horse_ids.extend(horse_ids)
+                horses = []
+
+            if len(bulk_operations) >= bulk_threshold:
+                write_ratings_updates(bulk_operations, bulk_horse_ids, logger)
                 bulk_operations = []
+                bulk_horse_ids = []
 
     except GeneratorExit:
-        # Process any remaining bulk operations
+        if horses:
+            updates, horse_ids = resolve_ratings(horses, logger)
+            updated_count += len(updates)
+            skipped_count += len(horses) - len(updates)
+            bulk_operations.extend(updates)
+            bulk_horse_ids.extend(horse_ids)
+
         if bulk_operations:
-            db.horses.bulk_write(bulk_operations)
-            logger.debug(f"Processed {len(bulk_operations)} remaining bulk operations")
+            write_ratings_updates(bulk_operations, bulk_horse_ids, logger)
 
         logger.info(
             f"Finished processing ratings. Updated {updated_count}, skipped {skipped_count}"
         )
+        logger.info(horse_cache.describe())
@@ -1,66 +1,172 @@
-from concurrent.futures import ThreadPoolExecutor
-from threading import Lock
+from collections import deque
+from collections.abc import Callable, Generator
+from concurrent.futures import (
+    BrokenExecutor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from multiprocessing import get_context, parent_process
+from typing import Any
 
 from prefect import get_run_logger
 
+from helpers.metrics import instrument_processor, metrics
+from models import PreMongoRace
 from processors.race_processor import race_processor
 
+type TransformJob = tuple[Any, Callable[[Any], list[PreMongoRace]], str, str]
+type TransformResult = tuple[list[PreMongoRace] | None, str | None]
+# A chunk's results, with any stage timings taken in a worker process
+type ChunkResult = tuple[list[TransformResult], dict[str, dict[str, float]] | None]
+
+
+def transform_records(
+    jobs: list[tuple[Any, Callable[[Any], list[PreMongoRace]]]],
+) -> list[TransformResult]:
+    """Transform a chunk of records, returning the races or an error for each"""
+    results: list[TransformResult] = []
+    for record, transformer in jobs:
+        try:
+            results.append((transformer(record), None))
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
+
+def transform_chunk(
+    jobs: list[tuple[Any, Callable[[Any], list[PreMongoRace]]]],
+) -> ChunkResult:
+    """Transform a chunk in an executor, sending back timings a worker process takes"""
+    results = transform_records(jobs)
+    # The parent's metrics never see what is recorded in a worker process
+    return results, metrics.take_stages() if parent_process() else None
+
+
+def submit_transforms(
+    executor: ThreadPoolExecutor | ProcessPoolExecutor, jobs: list[TransformJob]
+) -> Future:
+    chunk = [(record, transformer) for record, transformer, _, _ in jobs]
+    try:
+        return executor.submit(transform_chunk, chunk)
+    except BrokenExecutor as e:
+        # Reported for each of the chunk's records when it is forwarded
+        future: Future = Future()
+        future.set_exception(e)
+        return future
+
+
+def forward_races(
+    future: Future,
+    jobs: list[TransformJob],
+    race_gen: Generator[None, tuple[PreMongoRace, str], None],
+    logger: Any,
+    transform_count: int,
+) -> tuple[int, int]:
+    """Send a finished chunk's flat races on, returning updated transform and reject counts"""
+    reject_count = 0
 
-def transform_single_record(record, transformer, filename, logger):
     try:
-        return transformer(record)
+        chunk_results, stages = future.result()
     except Exception as e:
-        logger.error(f"Error transforming {filename}: {e}")
-        return None
+        # e.g. a worker process died or a record could not be pickled
+        for _, _, filename, _ in jobs:
+            logger.error(f"Error transforming {filename}: {type(e).__name__}: {e}")
+        return transform_count, len(jobs)
+
+    if stages:
+        metrics.merge_stages(stages)
+
+    for (_, _, filename, source), (results, error) in zip(
+        jobs, chunk_results, strict=True
+    ):
+        if error:
+            logger.error(f"Error transforming {filename}: {error}")
+
+        if not results:
+            reject_count += 1
+            continue
 
+        for race in results:
+            try:
+                if race.code == "Flat":
+                    race_gen.send((race, source))
+                    transform_count += 1
+                    if transform_count % 25 == 0:
+                        logger.info(
+                            f"Read {transform_count} races. Current: {race.datetime} at {race.course}"
+                        )
+            except Exception as e:
+                logger.error(f"Error during processing of race in {filename}: {e}")
+                reject_count += 1
+
+    return transform_count, reject_count
 
-def record_processor():
+
+@instrument_processor("record_processor")
+def record_processor(
+    *,
+    max_workers: int = 2,
+    max_in_flight: int = 8,
+    processes: bool = False,
+    chunksize: int = 1,
+):
+    """Transform records in threads, or worker processes when CPU bound, passing races on in order"""
     logger = get_run_logger()
     logger.info("Starting record processor")
-    reject_count_lock = Lock()
-    transform_count_lock = Lock()
     reject_count = 0
     transform_count = 0
 
     r = race_processor()
     next(r)
 
-    with ThreadPoolExecutor(max_workers=2) as executor:
+    executor = (
+        # Spawn rather than fork, as the parent has Prefect and Mongo threads running
+        ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context("spawn"))
+        if processes
+        else ThreadPoolExecutor(max_workers=max_workers)
+    )
+
+    jobs: list[TransformJob] = []
+    in_flight: deque[tuple[Future, list[TransformJob]]] = deque()
+
+    with executor:
         try:
             while True:
-                record, transformer, filename, source = yield
+                jobs.append((yield))
 
-                # Submit transformation to thread pool
-                future = executor.submit(
-                    transform_single_record, record, transformer, filename, logger
-                )
-                results = future.result()
-
-                if not results:
-                    with reject_count_lock:
-                        reject_count += 1
-                    continue
-
-                for race in results:
-                    try:
-                        if race.code == "Flat":
-                            r.send((race, source))
-                            with transform_count_lock:
-                                transform_count += 1
-                                if transform_count % 25 == 0:
-                                    logger.info(
-                                        f"Read {transform_count} races. Current: {race.datetime} at {race.course}"
-                                    )
-                    except Exception as e:  # noqa: PERF203
-                        logger.error(
-                            f"Error during processing of race in {filename}: {e}"
-                        )
-                        with reject_count_lock:
-                            reject_count += 1
-                        continue
+                if len(jobs) >= chunksize:
+                    in_flight.append((submit_transforms(executor, jobs), jobs))
+                    jobs = []
+
+                # Backpressure: wait on the oldest transforms once the window is full
+                if len(in_flight) >= max_in_flight:
+                    transform_count, rejected = forward_races(
+                        *in_flight.popleft(), r, logger, transform_count
+                    )
+                    reject_count += rejected
 
         except GeneratorExit:
+            if jobs:
+                in_flight.append((submit_transforms(executor, jobs), jobs))
+
+            while in_flight:
+                transform_count, rejected = forward_races(
+                    *in_flight.popleft(), r, logger, transform_count
+                )
+                reject_count += rejected
+
             logger.info(
                 f"Finished transforming {transform_count} races, rejected {reject_count}"
             )
             r.close()
+
+
+def make_record_processor(transform_processes: int = 0, chunksize: int = 20):
+    """A record processor that uses worker processes if any are requested"""
+    if transform_processes:
+        return record_processor(
+            max_workers=transform_processes, processes=True, chunksize=chunksize
+        )
+
+    return record_processor()
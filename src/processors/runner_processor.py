@@ -1,27 +1,47 @@
 from collections.abc import Generator
 from typing import Any
 
+from bson import ObjectId
 from peak_utility.listish import compact
 from prefect import get_run_logger
 from pymongo import UpdateOne
-from pymongo.errors import DuplicateKeyError
 
-from clients.mongo_client import get_horse, mongo_client
+from clients.mongo_client import (
+    get_horses,
+    horse_cache,
+    horse_lookup_counts,
+    mongo_client,
+)
+from helpers.metrics import instrument_processor
 from models import PreMongoPerson, PreMongoRunner, PyObjectId, Role
-from processors.horse_processor import (
-    make_horse_insert_dictionary,
-    make_horse_update_dictionary,
+from processors.horse_processor import HorseStaging
+from processors.person_processor import (
+    PersonCache,
+    person_processor,
+    preload_person_cache,
 )
-from processors.person_processor import person_processor
 
 db = mongo_client.handykapp
 
+RUNNER_ROLES: tuple[Role, ...] = ("trainer", "jockey")
+
+# A runner with the stored horse its window lookup found, if any
+type ResolvedRunner = tuple[PreMongoRunner, PyObjectId, str, Any]
+
 
-def make_runner_dict(horse: PreMongoRunner, horse_id: PyObjectId) -> dict:
+def make_runner_dict(
+    horse: PreMongoRunner,
+    horse_id: ObjectId,
+    *,
+    jockey: PyObjectId | None = None,
+    trainer: PyObjectId | None = None,
+) -> dict:
     return compact(
         {
             "horse": horse_id,
             "owner": horse.owner,
+            "trainer": trainer,
+            "jockey": jockey,
             "allowance": horse.allowance,
             "saddlecloth": horse.saddlecloth,
             "draw": horse.draw,
@@ -36,118 +56,177 @@ def make_runner_dict(horse: PreMongoRunner, horse_id: PyObjectId) -> dict:
     )
 
 
-def collect_people(
-    horse: PreMongoRunner, race_id: PyObjectId, horse_id: PyObjectId, source: str
-) -> list:
-    roles: tuple[Role, ...] = ("trainer", "jockey")
-    return [
-        (
-            PreMongoPerson(
-                name=person_name,
-                role=role,
-                race_id=race_id,
-                runner_id=horse_id,
-            ),
-            source,
-        )
-        for role in roles
+def resolve_people(
+    horse: PreMongoRunner,
+    source: str,
+    person_gen: Generator[PyObjectId | None, tuple[PreMongoPerson, str], None],
+) -> dict[Role, PyObjectId | None]:
+    return {
+        role: person_gen.send((PreMongoPerson(name=person_name, role=role), source))
+        for role in RUNNER_ROLES
         if (person_name := getattr(horse, role, None))
-    ]
+    }
 
 
-def flush_races_and_people(
-    race_updates: dict,
-    pending_people: list,
-    person_gen: Generator[None, tuple[PreMongoPerson, str], None],
-    logger: Any,
-):
-    for rid, runners in race_updates.items():
-        db.races.update_one({"_id": rid}, {"$push": {"runners": {"$each": runners}}})
+def flush_races(race_updates: dict, logger: Any):
+    db.races.bulk_write(
+        [
+            UpdateOne({"_id": rid}, {"$push": {"runners": {"$each": runners}}})
+            for rid, runners in race_updates.items()
+        ],
+        ordered=False,
+    )
     logger.debug(f"Updated {len(race_updates)} races with runners")
 
-    for person_data in pending_people:
-        person_gen.send(person_data)
+
+def flush_runners(
+    staging: HorseStaging, race_updates: dict[PyObjectId, list[dict]], logger: Any
+):
+    """Write staged horses, then the races whose runners refer to them"""
+    staging.flush(logger)
+
+    if race_updates:
+        # Including horses staged by horse_processor that were found to be duplicates
+        relink_runners(staging.replacements, race_updates)
+        flush_races(race_updates, logger)
+
+
+def relink_runners(
+    replacements: dict[ObjectId, ObjectId | None],
+    race_updates: dict[PyObjectId, list[dict]],
+):
+    """Point pending runners at the ids their horses were actually stored under"""
+    if not replacements:
+        return
+
+    for race_id, runners in race_updates.items():
+        race_updates[race_id] = [
+            runner | {"horse": horse_id}
+            for runner in runners
+            if (horse_id := replacements.get(runner["horse"], runner["horse"]))
+        ]
+
+
+def preload_window_people(
+    window: list[tuple[PreMongoRunner, PyObjectId, str]], person_cache: PersonCache
+):
+    uncached_names: dict[str, set[str]] = {}
+    for horse, _, source in window:
+        for role in RUNNER_ROLES:
+            name = getattr(horse, role, None)
+            if name and (name, source) not in person_cache:
+                uncached_names.setdefault(source, set()).add(name)
+
+    for source, names in uncached_names.items():
+        person_cache.update(preload_person_cache(names, source))
+
+
+def flush_runner_window(
+    window: list[tuple[PreMongoRunner, PyObjectId, str]],
+    resolved_gen: Generator[None, list[ResolvedRunner], None],
+    person_cache: PersonCache,
+):
+    # Look ahead so that every person in the window is cached before any is resolved
+    preload_window_people(window, person_cache)
+
+    db_horses = get_horses([horse for horse, _, _ in window])
+    resolved_gen.send(
+        [
+            (horse, race_id, source, db_horse)
+            for (horse, race_id, source), db_horse in zip(
+                window, db_horses, strict=True
+            )
+        ]
+    )
 
 
-def runner_processor() -> Generator[None, tuple[PreMongoRunner, PyObjectId, str], None]:
+def resolved_runner_processor(
+    person_cache: PersonCache, staging: HorseStaging
+) -> Generator[None, list[ResolvedRunner], None]:
     logger = get_run_logger()
-    logger.info("Starting runner processor")
     added_count = 0
     updated_count = 0
     skipped_count = 0
 
-    p = person_processor()
+    p = person_processor(person_cache)
     next(p)
 
-    horse_updates = []
-    horse_update_threshold = 500
-
     race_updates: dict[PyObjectId, list[dict]] = {}
     race_update_threshold = 20
 
-    pending_people = []
-
     try:
         while True:
-            horse, race_id, source = yield
-
-            db_horse = get_horse(horse)
-
-            if db_horse:
-                horse_updates.append(
-                    UpdateOne(
-                        {"_id": db_horse["_id"]},
-                        {"$set": make_horse_update_dictionary(horse, db_horse)},
+            window = yield
+
+            for horse, race_id, source, db_horse in window:
+                if db_horse and not staging.is_staged(horse, exact=True):
+                    horse_id = staging.stage_update(horse, db_horse)
+                    logger.debug(f"{horse.name} updated")
+                    updated_count += 1
+                else:
+                    is_staged = staging.is_staged(horse)
+                    try:
+                        horse_id = staging.stage_insert(horse)
+                        if not is_staged:
+                            logger.debug(f"{horse.name} staged for insert")
+                            added_count += 1
+                    except ValueError as e:
+                        logger.warning(e)
+                        skipped_count += 1
+                        continue
+
+                if race_id:
+                    race_updates.setdefault(race_id, []).append(
+                        make_runner_dict(
+                            horse, horse_id, **resolve_people(horse, source, p)
+                        )
                     )
-                )
-                horse_id = db_horse["_id"]
-                logger.debug(f"{horse.name} updated")
-                updated_count += 1
-            else:
-                try:
-                    horse_id = db.horses.insert_one(
-                        make_horse_insert_dictionary(horse)
-                    ).inserted_id
-                    logger.debug(f"{horse.name} added to db")
-                    added_count += 1
-                except DuplicateKeyError:
-                    logger.warning(f"Duplicate horse: {horse}) in race {race_id}")
-                    skipped_count += 1
-                    continue
-                except ValueError as e:
-                    logger.warning(e)
-                    skipped_count += 1
-                    continue
-
-            # Process horse updates when threshold reached
-            if horse_updates and len(horse_updates) >= horse_update_threshold:
-                db.horses.bulk_write(horse_updates)
-                logger.debug(f"Processed {len(horse_updates)} bulk horse operations")
-                horse_updates = []
-
-            if not race_id:
-                continue
-
-            if race_id not in race_updates:
-                race_updates[race_id] = []
-
-            race_updates[race_id].append(make_runner_dict(horse, horse_id))
-            pending_people.extend(collect_people(horse, race_id, horse_id, source))
 
+            # Only flush between windows, as a horse written part way through one
+            # would no longer match the lookup made for the rest of it
             if len(race_updates) >= race_update_threshold:
-                flush_races_and_people(race_updates, pending_people, p, logger)
+                flush_runners(staging, race_updates, logger)
                 race_updates = {}
-                pending_people = []
+            elif len(staging) >= staging.threshold:
+                staging.flush(logger)
 
     except GeneratorExit:
-        if horse_updates:
-            db.horses.bulk_write(horse_updates)
-            logger.debug(f"Processed {len(horse_updates)} remaining bulk operations")
-
-        if race_updates:
-            flush_races_and_people(race_updates, pending_people, p, logger)
+        flush_runners(staging, race_updates, logger)
 
         logger.info(
             f"Finished processing runners. Updated {updated_count}, added {added_count}, skipped {skipped_count}"
         )
         p.close()
+
+
+@instrument_processor("runner_processor")
+def runner_processor(
+    staging: HorseStaging,
+) -> Generator[None, tuple[PreMongoRunner, PyObjectId, str], None]:
+    logger = get_run_logger()
+    logger.info("Starting runner processor")
+
+    person_cache: PersonCache = {}
+
+    r = resolved_runner_processor(person_cache, staging)
+    next(r)
+
+    window: list[tuple[PreMongoRunner, PyObjectId, str]] = []
+    window_size = 100
+
+    try:
+        while True:
+            window.append((yield))
+
+            # Resolve horses a window at a time rather than one lookup per runner
+            if len(window) >= window_size:
+                flush_runner_window(window, r, person_cache)
+                window = []
+
+    except GeneratorExit:
+        if window:
+            flush_runner_window(window, r, person_cache)
+
+        logger.info(f"Horse lookups resolved by strategy: {dict(horse_lookup_counts)}")
+        logger.info(horse_cache.describe())
+        r.close()
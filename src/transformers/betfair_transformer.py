@@ -1,5 +1,7 @@
 import pathlib
 import re
+from collections.abc import Iterable
+from typing import Any
 
 import pendulum
 import petl
@@ -52,6 +54,23 @@ def get_places_from_place_detail(place_detail: str) -> int | None:
     return None
 
 
+def fill_race_descriptions(records: Iterable[dict]) -> list[dict]:
+    """Give place markets the description of the win market on the same race"""
+    # Reading the records once, as iterating a petl view again re-runs its pipeline
+    records = list(records)
+
+    descriptions: dict[Any, str] = {}
+    for rec in records:
+        if rec["race_description"]:
+            descriptions.setdefault(rec["race_datetime"], rec["race_description"])
+
+    for rec in records:
+        if not rec["race_description"]:
+            rec["race_description"] = descriptions.get(rec["race_datetime"])
+
+    return records
+
+
 @task(tags=["Betfair"])
 def transform_betfair_bet_history(
     data: petl.Table,
@@ -61,6 +80,7 @@ def transform_betfair_bet_history(
             data,
             {
                 MARKET: "market",
+                START_TIME: "race_datetime",
                 SELECTION: "horse",
                 BID_TYPE: "bet_type",
                 AVG_ODDS: "odds",
@@ -99,6 +119,10 @@ def transform_betfair_bet_history(
             "race_description",
             lambda rec: rec["place_detail"] if not rec["is_place_market"] else None,
         )
+        .convert(
+            "race_datetime",
+            lambda x: pendulum.from_format(x, "DD-MMM-YY HH:mm", tz="UTC"),
+        )
         .cutout(
             "market",
             "market_detail",
@@ -109,22 +133,10 @@ def transform_betfair_bet_history(
         .dicts()
     )
 
-    filled_out_data = []
-    for rec in transformed_data:
-        if not rec["race_description"]:
-            matching_description = next(
-                (
-                    other_rec["race_description"]
-                    for other_rec in transformed_data
-                    if other_rec["race_datetime"] == rec["race_datetime"]
-                    and other_rec["race_description"]
-                ),
-                None,
-            )
-            rec["race_description"] = matching_description
-        filled_out_data.append(rec)
-
-    return [MongoBetfairHorseraceBetHistory(**rec) for rec in filled_out_data]
+    return [
+        MongoBetfairHorseraceBetHistory(**rec)
+        for rec in fill_race_descriptions(transformed_data)
+    ]
 
 
 @task(tags=["Betfair"])
@@ -217,22 +229,10 @@ def transform_betfair_pnl_data(data: petl.Table) -> list[MongoBetfairHorseracePn
         .dicts()
     )
 
-    filled_out_data = []
-    for rec in transformed_data:
-        if not rec["race_description"]:
-            matching_description = next(
-                (
-                    other_rec["race_description"]
-                    for other_rec in transformed_data
-                    if other_rec["race_datetime"] == rec["race_datetime"]
-                    and other_rec["race_description"]
-                ),
-                None,
-            )
-            rec["race_description"] = matching_description
-        filled_out_data.append(rec)
-
-    return [MongoBetfairHorseracePnl(**rec) for rec in filled_out_data]
+    return [
+        MongoBetfairHorseracePnl(**rec)
+        for rec in fill_race_descriptions(transformed_data)
+    ]
 
 
 @task(tags=["Betfair"])
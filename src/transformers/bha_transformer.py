@@ -13,7 +13,8 @@ from horsetalk import Gender, Horse  # type: ignore
 from peak_utility.listish import compact
 from pydantic_extra_types.pendulum_dt import Date
 
-from helpers import horse_name_to_pre_mongo_horse
+from helpers import convert_fields, horse_name_to_pre_mongo_horse
+from helpers.metrics import metrics
 from models import (
     BHAPerfFigsRecord,
     BHARatingsRecord,
@@ -53,98 +54,127 @@ def transform_historic_rating(
     )
 
 
+PERF_FIG_FIELDS = (
+    "latest",
+    "two_runs_ago",
+    "three_runs_ago",
+    "four_runs_ago",
+    "five_runs_ago",
+    "six_runs_ago",
+)
+
+RATING_TYPES = ("flat", "aw", "chase", "hurdle")
+
+
 def transform_perf_figs(record: BHAPerfFigsRecord) -> PreMongoHorseWithHistoricRatings:
-    data = petl.fromdicts([record.model_dump()])
-
-    used_fields = (
-        "date",
-        "racehorse",
-        "yof",
-        "sex",
-        "latest",
-        "two_runs_ago",
-        "three_runs_ago",
-        "four_runs_ago",
-        "five_runs_ago",
-        "six_runs_ago",
+    date = record.date
+    transformed_record = {
+        "date": date,
+        "name": record.racehorse,
+        "year": record.yof,
+        "sex": record.sex,
+        "country": x.name if (x := Horse(record.racehorse).country) else None,
+        "historic_ratings": compact(
+            [
+                transform_historic_rating(getattr(record, field), races_ago, date)
+                for races_ago, field in enumerate(PERF_FIG_FIELDS)
+            ]
+        ),
+    }
+    convert_fields(
+        transformed_record,
+        {
+            "sex": lambda x: Gender[x].sex.name[0],  # type: ignore[misc]
+            "name": lambda x: Horse(x).name,
+        },
     )
-    transformed_record = (
-        petl.cut(data, used_fields)
-        .rename({"yof": "year", "racehorse": "name"})
-        .addfield(
-            "country", lambda rec: x.name if (x := Horse(rec["name"]).country) else None
+    return PreMongoHorseWithHistoricRatings(**transformed_record)
+
+
+RATINGS_FIELDS = {
+    "flat_rating": "flat",
+    "awt_rating": "aw",
+    "chase_rating": "chase",
+    "hurdle_rating": "hurdle",
+}
+
+# Conversions of the raw horse, sire and dam names, applied after the country and
+# gelded date have been taken from the record
+RATINGS_CONVERTERS = {
+    "sex": lambda x: Gender[x].sex.name[0],  # type: ignore[misc]
+    "name": lambda x: Horse(x).name,
+    "sire": lambda x: horse_name_to_pre_mongo_horse(x, sex="M", default_country="GB"),
+    "dam": lambda x: horse_name_to_pre_mongo_horse(x, sex="F", default_country="GB"),
+}
+
+
+def get_country(name: str) -> str | None:
+    # An unparseable name is left for the name conversion to reject
+    try:
+        horse = Horse(name)
+    except ValueError:
+        return None
+    return horse.country.name if horse.country else None
+
+
+def transform_ratings_records(table):
+    """Transform a whole table of validated ratings records, a column at a time"""
+    return (
+        petl.addfield(
+            table,
+            "ratings",
+            lambda rec: {rtg: rec[field] for field, rtg in RATINGS_FIELDS.items()},
         )
+        .addfield("country", lambda rec: get_country(rec["name"]))
         .addfield(
-            "historic_ratings",
-            lambda rec: compact(
-                [
-                    transform_historic_rating(rec["latest"], 0, rec["date"]),
-                    transform_historic_rating(rec["two_runs_ago"], 1, rec["date"]),
-                    transform_historic_rating(rec["three_runs_ago"], 2, rec["date"]),
-                    transform_historic_rating(rec["four_runs_ago"], 3, rec["date"]),
-                    transform_historic_rating(rec["five_runs_ago"], 4, rec["date"]),
-                    transform_historic_rating(rec["six_runs_ago"], 5, rec["date"]),
-                ]
+            "gelded_from",
+            lambda rec: (
+                pendulum.instance(rec["date"]) if rec["sex"] == "GELDING" else None
             ),
         )
-        .convert(
-            {
-                "sex": lambda x: Gender[x].sex.name[0],  # type: ignore[misc]
-                "name": lambda x: Horse(x).name,
-            }
-        )  # type: ignore
-        .dicts()[0]
+        .cut(
+            "name",
+            "country",
+            "year",
+            "sex",
+            "sire",
+            "dam",
+            "trainer",
+            "gelded_from",
+            "ratings",
+        )
+        .convert(RATINGS_CONVERTERS)
     )
-    return PreMongoHorseWithHistoricRatings(**transformed_record)
 
 
+@metrics.timed("transform.bha")
 def transform_ratings(record: BHARatingsRecord) -> PreMongoHorse:
-    data = petl.fromdicts([record.model_dump()])
-
-    used_fields = (
-        "date",
-        "name",
-        "year",
-        "sex",
-        "sire",
-        "dam",
-        "trainer",
-        "flat_rating",
-        "awt_rating",
-        "chase_rating",
-        "hurdle_rating",
-    )
-    rating_types = ["flat", "aw", "chase", "hurdle"]
-    transformed_record = (
-        petl.cut(data, used_fields)
-        .rename({x: x.replace("_rating", "").lower() for x in used_fields})
-        .rename({"awt": "aw"})
-        .convert({"year": int, "flat": int, "aw": int, "chase": int, "hurdle": int})
-        .addfield(
-            "country", lambda rec: x.name if (x := Horse(rec["name"]).country) else None
-        )
-        .addfield(
-            "gelded_from",
-            lambda rec: pendulum.instance(rec["date"])
-            if rec["sex"] == "GELDING"
-            else None,
-        )
-        .convert(
-            {
-                "sex": lambda x: Gender[x].sex.name[0],  # type: ignore[misc]
-                "name": lambda x: Horse(x).name,
-                "sire": lambda x: horse_name_to_pre_mongo_horse(
-                    x, sex="M", default_country="GB"
-                ),
-                "dam": lambda x: horse_name_to_pre_mongo_horse(
-                    x, sex="F", default_country="GB"
-                ),
-            }
-        )  # type: ignore
-        .addfield("ratings", lambda rec: {rtg: rec[rtg] for rtg in rating_types})
-        .cutout(*rating_types)
-        .dicts()[0]
+    transformed_record = convert_fields(
+        {
+            "date": record.date,
+            "name": record.name,
+            "year": record.year,
+            "sex": record.sex,
+            "sire": record.sire,
+            "dam": record.dam,
+            "trainer": record.trainer,
+            "flat": record.flat_rating,
+            "aw": record.awt_rating,
+            "chase": record.chase_rating,
+            "hurdle": record.hurdle_rating,
+        },
+        {"year": int, "flat": int, "aw": int, "chase": int, "hurdle": int},
     )
+    transformed_record |= {
+        "country": get_country(record.name),
+        "gelded_from": pendulum.instance(record.date)
+        if record.sex == "GELDING"
+        else None,
+    }
+    convert_fields(transformed_record, RATINGS_CONVERTERS)
+    transformed_record["ratings"] = {
+        rtg: transformed_record.pop(rtg) for rtg in RATING_TYPES
+    }
     return PreMongoHorse(**transformed_record)
 
 
@@ -2,6 +2,7 @@
 import sys
 from functools import cache
 from pathlib import Path
+from typing import Any, NamedTuple
 
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
@@ -29,6 +30,8 @@ from peak_utility.text.case import normal  # type: ignore
 from prefect import get_run_logger
 
 from clients import SpacesClient
+from helpers import convert_fields
+from helpers.metrics import metrics
 from models import (
     FormdataHorse,
     FormdataRecord,
@@ -57,8 +60,10 @@ def adjust_rr_name(name):
     return f"{name} ({country})" if country else name
 
 
-def create_horse(words: list[str], year: int) -> FormdataHorse | None:
-    logger = get_run_logger()
+def create_horse(
+    words: list[str], year: int, logger: Any = None
+) -> FormdataHorse | None:
+    logger = logger or get_run_logger()
     words = [w for w in words if w]  # Occasional lines have empty strings at end
 
     name = words[0].split("(")[0].strip()
@@ -110,96 +115,155 @@ def create_horse(words: list[str], year: int) -> FormdataHorse | None:
     return horse
 
 
-def create_run(words: list[str]) -> FormdataRun | None:
-    logger = get_run_logger()
-    try:
-        # Handle extra empty string at end of some lines
-        words = words if words[-1] != "" else words[:-1]
+class RunLine(NamedTuple):
+    date: str
+    race_type: str
+    win_prize: str
+    course: str
+    number_of_runners: str
+    weight: str
+    middle: str
+    beaten_distance: str
+    time_rating: str
+    dist_going: str
+    form_rating: str
+
+
+# Lines whose source data is wrong, matched on token count and tokens at given
+# positions, with the slice of tokens to replace
+RUN_LINE_FIXUPS: list[tuple[int, dict[int, str], slice, list[str]]] = [
+    # Phoenix Dawn (missing data)
+    (
+        10,
+        {6: "b", 7: "RHavlin", 8: "p", 9: "p12"},
+        slice(9, 10),
+        ["", "p12", "16d", "p12"],
+    ),
+    # Arctic Mountain (incorrect data - says placed when dsq)
+    (12, {7: "14p940.0"}, slice(7, 8), ["14d", "40.0"]),
+]
+
+NON_FINISHER_JUMP_PREFIXES = ("-", "n", "o")
+NON_FINISHER_JUMP_SUFFIXES = ("b", "c", "h")
+
+
+def is_conjoined_weight(token: str) -> bool:
+    return (len(token) > 5 and token[0].isdigit() and "-" in token[:3]) or (
+        len(token) == 5 and not token[-1].isdigit()
+    )
 
-        # Handle cases where words are insufficiently split
-        words = " ".join(words).split(" ")
 
-        # Handle odd case of Phoenix Dawn (missing data)
-        if len(words) == 10 and words[6:] == ["b", "RHavlin", "p", "p12"]:
-            words = [*words[:9], "", "p12", "16d", "p12"]
+def is_conjoined_finish(token: str) -> bool:
+    return "p" in token and ("*" in token or "." in token)
 
-        # Handle odd case of Arctic Mountain (incorrect data - says placed when dsq)
-        if len(words) == 12 and words[7] == "14p940.0":
-            words = [*words[:7], "14d", "40.0", *words[8:]]
 
-        # Split overlong prize money
-        if len(words[1]) > 5:
-            racetype, prize = extract_prize(words[1]) or ("", "")
-            words[1] = racetype
-            words.insert(2, prize)
+def tokenize_run_line(words: list[str]) -> RunLine:
+    """Split the words of a Formdata run line into its fields in a single pass"""
+    # Handle extra empty string at end of some lines, and words insufficiently split
+    tokens = " ".join(words[:-1] if words[-1] == "" else words).split(" ")
 
-        # Split conjoined weight
-        if (len(words[5]) > 5 and words[5][0].isdigit() and "-" in words[5][:3]) or (
-            len(words[5]) == 5 and not words[5][-1].isdigit()
+    for length, expected, replace, replacement in RUN_LINE_FIXUPS:
+        if len(tokens) == length and all(
+            tokens[i] == token for i, token in expected.items()
         ):
-            weight, jockey = extract_weight(words[5]) or ("", "")
-            words[5] = weight
-            words.insert(6, jockey)
-
-        # Split conjoined finishing distance
-        for i, word in enumerate(words[7:10]):
-            if "p" in word and ("*" in word or "." in word):
-                position, beaten_distance = (
-                    word.split("*") if "*" in word else (word[:3], word[3:])
-                )
-                words[7 + i] = position
-                words.insert(8 + i, f"-{beaten_distance}")
-
-        # Join non-finishing jump_details
-        indices_to_join = []
-        for i, word in enumerate(words[-5:-1]):
-            if word in ["-", "n", "o"] and words[-5 + i + 1] in ["b", "c", "h"]:
-                indices_to_join.append(-5 + i)
-
-        for index in indices_to_join:
-            words = (
-                words[:index]
-                + ["".join(words[index : index + 2])]
-                + (words[index + 2 :] if index < -3 else [])
+            tokens[replace] = replacement
+
+    # Race type may be conjoined with prize money
+    if len(tokens[1]) > 5:
+        race_type, win_prize = extract_prize(tokens[1]) or ("", "")
+        i = 2
+    else:
+        race_type, win_prize = tokens[1], tokens[2]
+        i = 3
+
+    course, number_of_runners, weight = tokens[i : i + 3]
+    rest = tokens[i + 3 :]
+
+    # Weight may be conjoined with the start of the jockey details
+    if is_conjoined_weight(weight):
+        weight, jockey = extract_weight(weight) or ("", "")
+        rest.insert(0, jockey)
+
+    # Finishing position may be conjoined with distance beaten
+    for j, token in enumerate(rest[1:4], start=1):
+        if is_conjoined_finish(token):
+            position, beaten = (
+                token.split("*") if "*" in token else (token[:3], token[3:])
             )
+            rest[j : j + 1] = [position, f"-{beaten}"]
+
+    # Jump non-finishers may have their details split, e.g. "n" "b", anywhere in
+    # the last five tokens, joined from the right so earlier positions still hold
+    for j in reversed(range(max(len(rest) - 5, 0), len(rest) - 1)):
+        if (
+            rest[j] in NON_FINISHER_JUMP_PREFIXES
+            and rest[j + 1] in NON_FINISHER_JUMP_SUFFIXES
+        ):
+            rest[j : j + 2] = [rest[j] + rest[j + 1]]
+
+    *middle, beaten_distance, time_rating, dist_going, form_rating = rest
+
+    # Flat non-finishers have their position where the distance beaten would be
+    flat_non_finisher = any(letter in beaten_distance for letter in "bfnpu")
+    if flat_non_finisher and beaten_distance != "alone":
+        middle.append(beaten_distance)
+
+    return RunLine(
+        tokens[0],
+        race_type,
+        win_prize,
+        course,
+        number_of_runners,
+        weight,
+        "".join(middle),
+        beaten_distance,
+        time_rating,
+        dist_going,
+        form_rating,
+    )
 
-        # Join jockey details to be processed separately
-        flat_non_finisher = any(
-            letter in words[-4] for letter in ["b", "f", "n", "p", "u"]
-        )
-        joined_middle = "".join(
-            words[6:-3] if flat_non_finisher and words[-4] != "alone" else words[6:-4]
-        )
-        middle_details = extract_middle_details(joined_middle)
+
+@cache
+def parse_run_date(date: str) -> str:
+    return pendulum.from_format(date, "DDMMMYY").date().format("YYYY-MM-DD")
+
+
+def create_run(words: list[str], logger: Any = None) -> FormdataRun | None:
+    logger = logger or get_run_logger()
+    try:
+        line = tokenize_run_line(words)
+
+        middle_details = extract_middle_details(line.middle)
 
         if not middle_details:
             raise ValueError(f"Insufficient detail in middle of run: {middle_details}")
 
-        (dist, going) = extract_dist_going(words[-2]) or (None, None)
+        (dist, going) = extract_dist_going(line.dist_going) or (None, None)
 
         if not dist or not going:
             raise ValueError("Insufficient detail in distance or going")
 
+        beaten = line.beaten_distance
         run = FormdataRun(
-            date=pendulum.from_format(words[0], "DDMMMYY").date().format("YYYY-MM-DD"),
-            race_type=words[1],
-            win_prize=words[2],
-            course=words[3],
-            number_of_runners=int(words[4]),
-            weight=words[5],
+            date=parse_run_date(line.date),
+            race_type=line.race_type,
+            win_prize=line.win_prize,
+            course=line.course,
+            number_of_runners=int(line.number_of_runners),
+            weight=line.weight,
             headgear=middle_details["headgear"],
             allowance=middle_details["allowance"],
             jockey=middle_details["jockey"],
             position=middle_details["position"],
-            beaten_distance=float(words[-4].replace("*", "-"))
-            if "*" in words[-4]
-            else float(words[-4])
-            if "." in words[-4] and words[-4] != "w.o."
+            beaten_distance=float(beaten.replace("*", "-"))
+            if "*" in beaten
+            else float(beaten)
+            if "." in beaten and beaten != "w.o."
             else None,
-            time_rating=extract_rating(words[-3]),
+            time_rating=extract_rating(line.time_rating),
             distance=dist,
             going=going,
-            form_rating=extract_rating(words[-1]),
+            form_rating=extract_rating(line.form_rating),
         )
     except Exception as e:
         logger.error(f"Error creating run from {words}: {e}")
@@ -395,34 +459,24 @@ def is_race_date(string: str) -> bool:
 
 
 def transform_horse(runner: FormdataRunner) -> PreMongoRunner:
-    data = petl.fromdicts([runner.model_dump()])
-    transformed_horse = (
-        petl.convert(
-            data,
-            {
-                "weight": lambda x: RaceWeight(x).lb,
-                "beaten_distance": lambda x: float(Horselength(x)) if x else None,
-                "jockey": lambda x: adjust_rr_name(x),
-            },
-        )
-        .rename(
-            {
-                "weight": "lbs_carried",
-            }
-        )
-        .addfield("finishing_position", lambda rec: rec["position"].split("p")[0])
-        .addfield(
-            "official_position",
-            lambda rec: rec["position"].split("p")[1]
-            if "p" in rec["position"]
-            else rec["finishing_position"],
-        )
-        .cutout("position", "time_rating", "form_rating")
-        .dicts()[0]
+    horse = convert_fields(
+        runner.model_dump(exclude={"time_rating", "form_rating"}),
+        {
+            "weight": lambda x: RaceWeight(x).lb,
+            "beaten_distance": lambda x: float(Horselength(x)) if x else None,
+            "jockey": lambda x: adjust_rr_name(x),
+        },
+    )
+    horse["lbs_carried"] = horse.pop("weight")
+    position = horse.pop("position")
+    horse["finishing_position"] = position.split("p")[0]
+    horse["official_position"] = (
+        position.split("p")[1] if "p" in position else horse["finishing_position"]
     )
-    return PreMongoRunner(**transformed_horse)
+    return PreMongoRunner(**horse)
 
 
+@metrics.timed("transform.formdata")
 def transform_races(record: FormdataRecord) -> list[PreMongoRace]:
     data = petl.fromdicts([record.model_dump()])
     transformed_races = (
@@ -2,12 +2,11 @@
 import sys
 from pathlib import Path
 
-from helpers import horse_name_to_pre_mongo_horse
+from helpers import convert_fields, horse_name_to_pre_mongo_horse
+from helpers.metrics import metrics
 
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
-import operator
-
 import pendulum
 import petl  # type: ignore
 from horsetalk import (
@@ -37,67 +36,64 @@ def standardise_name(name: str) -> str:
     return eirify(scotify(name))
 
 
+RUNNER_RENAMES = {
+    "id_horse": "rapid_id",
+    "weight": "lbs_carried",
+    "last_ran_days_ago": "days_since_prev_run",
+    "number": "saddlecloth",
+    "OR": "official_rating",
+    "distance_beaten": "beaten_distance",
+    "position": "finishing_position",
+}
+
+
 def transform_horse(
     runner: RapidRunner,
     race_date: pendulum.DateTime = pendulum.now(),
     finishing_time: str | None = None,
 ) -> PreMongoRunner:
-    data = petl.fromdicts([runner.model_dump()])
-    transformed_horse = (
-        petl.rename(
-            data,
-            {
-                "id_horse": "rapid_id",
-                "weight": "lbs_carried",
-                "last_ran_days_ago": "days_since_prev_run",
-                "number": "saddlecloth",
-                "OR": "official_rating",
-                "distance_beaten": "beaten_distance",
-                "position": "finishing_position",
-            },
-        )
-        .convert(
-            {
-                "age": int,
-                "days_since_prev_run": int,
-                "official_rating": int,
-                "non_runner": lambda x: bool(int(x)),
-                "lbs_carried": lambda x: RaceWeight(x).lb,
-                "sp": lambda x: x or None,
-                "sire": lambda x: horse_name_to_pre_mongo_horse(
-                    x, sex="M", default_country="GB"
-                ),
-                "dam": lambda x: horse_name_to_pre_mongo_horse(
-                    x, sex="F", default_country="GB"
-                ),
-                "beaten_distance": lambda x: float(Horselength(x)) if x else None,
-                "jockey": lambda x: standardise_name(x),
-                "trainer": lambda x: standardise_name(x),
-            }
-        )
-        .addfield(
-            "country", lambda rec: (Horse(rec["horse"]).country or Country.GB).name
-        )
-        .addfield("name", lambda rec: Horse(rec["horse"]).name.upper())
-        .addfield(
-            "year",
-            lambda rec: HorseAge(
-                rec["age"],
-                context_date=race_date,
-                hemisphere=Country[rec["country"]].hemisphere,  # type: ignore[attr-defined]
-            )._official_dob.year,
-        )
-        .addfield(
-            "finishing_time",
-            lambda rec: finishing_time if rec["finishing_position"] == 1 else None,
-        )
-        .addfield("official_position", operator.itemgetter("finishing_position"))
-        .cutout("horse", "age")
-        .dicts()[0]
+    runner_dict = {RUNNER_RENAMES.get(k, k): v for k, v in runner.model_dump().items()}
+    transformed_horse = convert_fields(
+        runner_dict,
+        {
+            "age": int,
+            "days_since_prev_run": int,
+            "official_rating": int,
+            "non_runner": lambda x: bool(int(x)),
+            "lbs_carried": lambda x: RaceWeight(x).lb,
+            "sp": lambda x: x or None,
+            "sire": lambda x: horse_name_to_pre_mongo_horse(
+                x, sex="M", default_country="GB"
+            ),
+            "dam": lambda x: horse_name_to_pre_mongo_horse(
+                x, sex="F", default_country="GB"
+            ),
+            "beaten_distance": lambda x: float(Horselength(x)) if x else None,
+            "jockey": lambda x: standardise_name(x),
+            "trainer": lambda x: standardise_name(x),
+        },
     )
+
+    horse = Horse(transformed_horse.pop("horse"))
+    age = transformed_horse.pop("age")
+    country = (horse.country or Country.GB).name
+    transformed_horse |= {
+        "country": country,
+        "name": horse.name.upper(),
+        "year": HorseAge(
+            age,
+            context_date=race_date,
+            hemisphere=Country[country].hemisphere,  # type: ignore[attr-defined]
+        )._official_dob.year,
+        "finishing_time": finishing_time
+        if transformed_horse["finishing_position"] == 1
+        else None,
+        "official_position": transformed_horse["finishing_position"],
+    }
     return PreMongoRunner(**transformed_horse)
 
 
+@metrics.timed("transform.rapid")
 def transform_results(record: RapidRecord) -> list[PreMongoRace]:
     data = petl.fromdicts([record.model_dump()])
     transformed_races = (
@@ -159,6 +155,7 @@ def transform_results(record: RapidRecord) -> list[PreMongoRace]:
     return [PreMongoRace(**race) for race in transformed_races]
 
 
+@metrics.timed("transform.rapid_entries")
 def transform_results_as_entries(record: RapidRecord) -> list[PreMongoRace]:
     base = transform_results(record)
 
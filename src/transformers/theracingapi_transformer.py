@@ -2,7 +2,8 @@
 import sys
 from pathlib import Path
 
-from helpers import horse_name_to_pre_mongo_horse
+from helpers import convert_fields, horse_name_to_pre_mongo_horse
+from helpers.metrics import metrics
 
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
@@ -37,73 +38,65 @@ def build_datetime(date_str: str, time_str: str) -> str:
     ).isoformat()
 
 
+RUNNER_RENAMES = {
+    "horse": "name",
+    "region": "country",
+    "number": "saddlecloth",
+    "lbs": "lbs_carried",
+    "ofr": "official_rating",
+}
+
+
 def transform_horse(
     runner: TheRacingApiRunner, race_date: pendulum.DateTime = pendulum.now()
 ) -> PreMongoRunner:
-    data = petl.fromdicts([runner.model_dump()])
+    runner_dict = runner.model_dump(exclude={"sex_code", "last_run", "form"})
+    transformed_horse = {RUNNER_RENAMES.get(k, k): v for k, v in runner_dict.items()}
 
-    transformed_horse = (
-        petl.rename(
-            data,
-            {
-                "horse": "name",
-                "region": "country",
-                "number": "saddlecloth",
-                "lbs": "lbs_carried",
-                "ofr": "official_rating",
-            },
-        )
-        .addfield(
-            "year",
-            lambda rec: HorseAge(
-                rec["age"],
-                context_date=race_date,
-                hemisphere=Country[rec["country"]].hemisphere,  # type: ignore[attr-defined]
-            )._official_dob.year,
-            index=3,
-        )
-        .addfield(
-            "allowance",
-            lambda rec: int(rec["jockey"].split("(")[1].split(")")[0])
-            if "(" in rec["jockey"]
-            else 0,
-        )
-        .addfield(
-            "gelded_from",
-            lambda rec: (race_date - pendulum.duration(days=1)).date
-            if (x := Gender[rec["sex"]]) == Sex.MALE and x.has_testes  # type: ignore[misc]
-            else None,
-        )
-        .convert(
-            {
-                "name": lambda x: x.upper(),
-                "sex": lambda x: Gender[x].sex.name[0],  # type: ignore
-                "age": int,
-                "colour": lambda x: CoatColour[x].name.title(),  # type: ignore
-                "sire": lambda x: horse_name_to_pre_mongo_horse(x, sex="M"),
-                "damsire": lambda x: horse_name_to_pre_mongo_horse(x, sex="M"),
-                "saddlecloth": int,
-                "draw": int,
-                "lbs_carried": int,
-                "headgear": lambda x: Headgear[x].name.title() if x else None,  # type: ignore
-                "official_rating": int,
-                "jockey": lambda x: x.split("(")[0].strip(),
-                "trainer": lambda x: x.split(", ")[0].strip(),
-            }
-        )
-        .convert(
-            "dam",
-            lambda x, rec: horse_name_to_pre_mongo_horse(
-                x, sex="F", sire=rec["damsire"]
-            ),
-            pass_row=True,
-        )
-        .cutout("sex_code", "last_run", "form", "age")
-        .dicts()[0]
+    gender = Gender[transformed_horse["sex"]]  # type: ignore
+    transformed_horse |= {
+        "year": HorseAge(
+            transformed_horse.pop("age"),
+            context_date=race_date,
+            hemisphere=Country[transformed_horse["country"]].hemisphere,  # type: ignore[attr-defined]
+        )._official_dob.year,
+        "allowance": int(transformed_horse["jockey"].split("(")[1].split(")")[0])
+        if "(" in transformed_horse["jockey"]
+        else 0,
+        "gelded_from": (race_date - pendulum.duration(days=1)).date
+        if gender == Sex.MALE and gender.has_testes  # type: ignore
+        else None,
+    }
+
+    convert_fields(
+        transformed_horse,
+        {
+            "name": lambda x: x.upper(),
+            "sex": lambda x: Gender[x].sex.name[0],  # type: ignore
+            "colour": lambda x: CoatColour[x].name.title(),  # type: ignore
+            "sire": lambda x: horse_name_to_pre_mongo_horse(x, sex="M"),
+            "damsire": lambda x: horse_name_to_pre_mongo_horse(x, sex="M"),
+            "saddlecloth": int,
+            "draw": int,
+            "lbs_carried": int,
+            "headgear": lambda x: Headgear[x].name.title() if x else None,  # type: ignore
+            "official_rating": int,
+            "jockey": lambda x: x.split("(")[0].strip(),
+            "trainer": lambda x: x.split(", ")[0].strip(),
+        },
+    )
+    convert_fields(
+        transformed_horse,
+        {
+            "dam": lambda x: horse_name_to_pre_mongo_horse(
+                x, sex="F", sire=transformed_horse["damsire"]
+            )
+        },
     )
     return PreMongoRunner(**transformed_horse)
 
 
+@metrics.timed("transform.theracingapi")
 def transform_races(record: TheRacingApiRacecard) -> list[PreMongoRace]:
     data = petl.fromdicts([record.model_dump()])
     transformed_races = (
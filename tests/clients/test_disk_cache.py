@@ -0,0 +1,81 @@
+import os
+from datetime import UTC, datetime
+
+from src.clients.disk_cache import DiskCache
+
+
+def test_get_returns_none_when_not_cached(tmp_path):
+    cache = DiskCache(tmp_path, 1000)
+    assert cache.get("dir/foo.json", '"abc"') is None
+
+
+def test_get_returns_cached_version(tmp_path):
+    cache = DiskCache(tmp_path, 1000)
+    cache.put("dir/foo.json", '"abc"', b"foo")
+    assert cache.get("dir/foo.json", '"abc"') == b"foo"
+    assert cache.get("dir/foo.json", '"def"') is None
+
+
+def test_get_without_version_only_when_offline(tmp_path):
+    DiskCache(tmp_path, 1000).put("dir/foo.json", '"abc"', b"foo")
+    assert DiskCache(tmp_path, 1000).get("dir/foo.json", None) is None
+    assert DiskCache(tmp_path, 1000, offline=True).get("dir/foo.json", None) == b"foo"
+
+
+def test_put_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(tmp_path, 9)
+    cache.put("dir/foo.json", "1", b"foo")
+    cache.put("dir/bar.json", "1", b"bar")
+    for path in tmp_path.rglob("*"):
+        os.utime(path, (0, 0))
+    cache.get("dir/foo.json", "1")
+
+    cache.put("dir/baz.json", "1", b"baz!")
+
+    assert cache.get("dir/bar.json", "1") is None
+    assert cache.get("dir/foo.json", "1") == b"foo"
+    assert cache.size == 7
+
+
+def test_keys(tmp_path):
+    cache = DiskCache(tmp_path, 1000)
+    cache.put("dir/foo.json", "1", b"foo")
+    cache.put("dir/foo.json", "2", b"foo")
+    cache.put("dir/bar.json", "1", b"bar")
+    cache.put("other/baz.json", "1", b"baz")
+    assert cache.keys("dir/") == ["dir/bar.json", "dir/foo.json"]
+
+
+def test_get_treats_file_removed_meanwhile_as_miss(tmp_path):
+    cache = DiskCache(tmp_path, 1000)
+    cache.put("dir/foo.json", "1", b"foo")
+    for path in tmp_path.rglob("*"):
+        if path.is_file():
+            path.unlink()
+
+    assert cache.get("dir/foo.json", "1") is None
+
+
+def test_put_only_walks_directory_once(tmp_path, mocker):
+    cache = DiskCache(tmp_path, 6)
+    files = mocker.spy(cache, "_files")
+    for i in range(5):
+        cache.put(f"dir/{i}.json", "1", b"foo")
+
+    assert files.call_count == 1
+    assert cache.keys("dir/") == ["dir/3.json", "dir/4.json"]
+    assert cache.size == 6
+
+
+def test_put_records_last_modified_beside_version(tmp_path):
+    modified = datetime(2020, 1, 1, tzinfo=UTC)
+    cache = DiskCache(tmp_path, 3)
+    cache.put("dir/foo.json", "1", b"foo", modified)
+
+    assert cache.get_last_modified("dir/foo.json") == modified
+    assert cache.get_last_modified("dir/bar.json") is None
+    assert cache.size == 3
+    assert DiskCache(tmp_path, 1000, offline=True).get("dir/foo.json", None) == b"foo"
+
+    cache.put("dir/bar.json", "1", b"bar")
+    assert not (tmp_path / "dir/foo.json").exists()
@@ -1,6 +1,22 @@
+from collections import Counter
+from datetime import datetime
+
+import mongomock
+import pytest
 from pendulum import parse
 
-from clients.mongo_client import apply_newmarket_workaround
+from clients.mongo_client import (
+    HorseCache,
+    apply_newmarket_workaround,
+    get_horse,
+    get_horses,
+    get_latest_race_datetime,
+    get_racecourse_id,
+    get_watermark,
+    refresh_racecourses,
+    update_watermark,
+)
+from models import PreMongoHorse, PreMongoRaceCourseDetails
 
 
 def test_apply_newmarket_workaround_for_early_rowley():
@@ -17,3 +33,272 @@ def test_apply_newmarket_workaround_for_late_july():
 
 def test_apply_newmarket_workaround_for_late_rowley():
     assert apply_newmarket_workaround(parse("2023-09-01")) == "Newmarket Rowley"
+
+
+@pytest.fixture
+def mock_db(mocker):
+    db = mongomock.MongoClient().handykapp
+    mocker.patch("clients.mongo_client.db", db)
+    mocker.patch("clients.mongo_client.horse_cache", HorseCache())
+    return db
+
+
+def test_get_horses_returns_results_in_order(mock_db):
+    mock_db.horses.insert_many(
+        [
+            {"name": "DOBBIN", "country": "IRE", "year": 2020},
+            {"name": "MUDDY", "country": "GB", "year": 2019},
+        ]
+    )
+    actual = get_horses(
+        [
+            PreMongoHorse(name="MUDDY", country="GB", year=2019),
+            PreMongoHorse(name="UNKNOWN", country="GB", year=2019),
+            PreMongoHorse(name="DOBBIN", country="IRE", year=2020),
+        ]
+    )
+    assert [horse["name"] if horse else None for horse in actual] == [
+        "MUDDY",
+        None,
+        "DOBBIN",
+    ]
+
+
+def test_get_horses_falls_back_to_sex_search(mock_db):
+    mock_db.horses.insert_one(
+        {"name": "DOBBIN", "country": "IRE", "year": 2020, "sex": "M"}
+    )
+    actual = get_horses([PreMongoHorse(name="DOBBIN", country="IRE", sex="M")])
+    assert actual[0]["name"] == "DOBBIN"
+
+
+def test_get_horses_falls_back_to_apostrophe_search(mock_db):
+    mock_db.horses.insert_one({"name": "DOBBINS DREAM", "country": "IRE", "year": 2020})
+    actual = get_horses(
+        [PreMongoHorse(name="DOBBIN'S DREAM", country="IRE", year=2020)]
+    )
+    assert actual[0]["name"] == "DOBBIN'S DREAM"
+    assert mock_db.horses.find_one()["name"] == "DOBBIN'S DREAM"
+
+
+def test_get_horses_counts_lookups_by_strategy(mock_db, mocker):
+    counts = mocker.patch("clients.mongo_client.horse_lookup_counts", Counter())
+    mock_db.horses.insert_one({"name": "DOBBIN", "country": "IRE", "year": 2020})
+    get_horses(
+        [
+            PreMongoHorse(name="DOBBIN", country="IRE", year=2020),
+            PreMongoHorse(name="UNKNOWN", country="GB", year=2019),
+        ]
+    )
+    assert counts == {"exact": 1, "unresolved": 1}
+
+
+@pytest.fixture
+def mock_racecourses(mock_db):
+    mock_db.racecourses.insert_many(
+        [
+            {
+                "_id": "rowley",
+                "name": "Newmarket Rowley",
+                "formal_name": "Newmarket (Rowley Mile)",
+                "surface": "Turf",
+                "code": "Flat",
+            },
+            {
+                "_id": "july",
+                "name": "Newmarket July",
+                "formal_name": "Newmarket (July)",
+                "surface": "Turf",
+                "code": "Flat",
+            },
+            {
+                "_id": "kempton_aw",
+                "name": "Kempton",
+                "formal_name": "Kempton Park",
+                "surface": "Polytrack",
+                "code": "Flat",
+            },
+            {
+                "_id": "kempton_chase",
+                "name": "Kempton",
+                "formal_name": "Kempton Park",
+                "surface": "Turf",
+                "code": "National Hunt",
+                "obstacle": "Chase",
+            },
+        ]
+    )
+    refresh_racecourses()
+    yield mock_db
+    refresh_racecourses()
+
+
+def test_get_racecourse_id_matches_formal_name(mock_racecourses):
+    race = PreMongoRaceCourseDetails(course="Kempton Park", surface="AW", code="Flat")
+    assert get_racecourse_id(race, parse("2023-05-01"), "bha") == "kempton_aw"
+
+
+def test_get_racecourse_id_matches_obstacle(mock_racecourses):
+    race = PreMongoRaceCourseDetails(
+        course="kempton", code="National Hunt", obstacle="Chase"
+    )
+    assert get_racecourse_id(race, parse("2023-05-01"), "bha") == "kempton_chase"
+
+
+def test_get_racecourse_id_returns_none_when_unmatched(mock_racecourses):
+    race = PreMongoRaceCourseDetails(course="Kempton", code="National Hunt")
+    assert get_racecourse_id(race, parse("2023-05-01"), "bha") is None
+
+
+def test_get_racecourse_id_applies_newmarket_workaround(mock_racecourses):
+    race = PreMongoRaceCourseDetails(course="Newmarket", code="Flat")
+    assert get_racecourse_id(race, parse("2023-07-01"), "bha") == "july"
+    assert get_racecourse_id(race, parse("2023-10-01"), "bha") == "rowley"
+
+
+def test_refresh_racecourses_picks_up_reloaded_collection(mock_racecourses):
+    race = PreMongoRaceCourseDetails(course="Kempton", surface="AW", code="Flat")
+    assert get_racecourse_id(race, parse("2023-05-01"), "bha") == "kempton_aw"
+
+    mock_racecourses.racecourses.update_one(
+        {"_id": "kempton_aw"}, {"$set": {"surface": "Turf"}}
+    )
+    mock_racecourses.racecourses.insert_one(
+        {
+            "_id": "kempton_new",
+            "name": "Kempton",
+            "formal_name": "Kempton Park",
+            "surface": "Polytrack",
+            "code": "Flat",
+        }
+    )
+    refresh_racecourses()
+
+    assert get_racecourse_id(race, parse("2023-05-01"), "bha") == "kempton_new"
+
+
+def test_horse_cache_keys_on_normalised_name():
+    cache = HorseCache()
+    cache.put(PreMongoHorse(name="Dobbin ", country="IRE", year=2020), {"_id": 1})
+    assert cache.get(PreMongoHorse(name="DOBBIN", country="IRE", year=2020)) == {
+        "_id": 1
+    }
+    assert cache.get(PreMongoHorse(name="DOBBIN", country="GB", year=2020)) is None
+    assert cache.stats == Counter({"hits": 1, "misses": 1})
+
+
+def test_horse_cache_evicts_least_recently_used():
+    cache = HorseCache(maxsize=2)
+    dobbin = PreMongoHorse(name="DOBBIN", country="IRE", year=2020)
+    muddy = PreMongoHorse(name="MUDDY", country="GB", year=2019)
+    neddy = PreMongoHorse(name="NEDDY", country="GB", year=2018)
+    cache.put(dobbin, {"_id": 1})
+    cache.put(muddy, {"_id": 2})
+    cache.get(dobbin)
+    cache.put(neddy, {"_id": 3})
+
+    assert cache.get(muddy) is None
+    assert cache.get(dobbin) == {"_id": 1}
+    assert len(cache) == 2
+    assert cache.stats["evictions"] == 1
+
+
+def test_horse_cache_expires_entries(mocker):
+    mock_monotonic = mocker.patch("clients.mongo_client.monotonic", return_value=0)
+    cache = HorseCache(ttl=60)
+    dobbin = PreMongoHorse(name="DOBBIN", country="IRE", year=2020)
+    cache.put(dobbin, {"_id": 1})
+
+    mock_monotonic.return_value = 61
+    assert cache.get(dobbin) is None
+    assert cache.stats["expirations"] == 1
+    assert len(cache) == 0
+
+
+def test_horse_cache_invalidates_every_key_for_a_horse():
+    cache = HorseCache()
+    cache.put(PreMongoHorse(name="DOBBIN", country="IRE", year=2020), {"_id": 1})
+    cache.put(PreMongoHorse(name="DOBBIN", country="IRE", sex="M"), {"_id": 1})
+    cache.put(PreMongoHorse(name="MUDDY", country="GB", year=2019), {"_id": 2})
+
+    cache.invalidate([1])
+
+    assert len(cache) == 1
+    assert cache.stats["invalidations"] == 2
+
+
+def test_get_horse_caches_found_horses_only(mock_db):
+    mock_db.horses.insert_one({"name": "DOBBIN", "country": "IRE", "year": 2020})
+    dobbin = PreMongoHorse(name="DOBBIN", country="IRE", year=2020)
+    unknown = PreMongoHorse(name="UNKNOWN", country="GB", year=2019)
+
+    assert get_horse(dobbin)["name"] == "DOBBIN"
+    assert get_horse(unknown) is None
+    mock_db.horses.delete_many({})
+
+    assert get_horse(dobbin)["name"] == "DOBBIN"
+    assert get_horse(unknown) is None
+
+
+def test_watermarks_are_kept_per_source(mock_db):
+    assert get_watermark("rapid") == {}
+    update_watermark("rapid", last_key="foo.json")
+    update_watermark("theracingapi", last_key="bar.json")
+    update_watermark("rapid", last_key="baz.json")
+    assert get_watermark("rapid") == {"_id": "rapid", "last_key": "baz.json"}
+
+
+def test_get_latest_race_datetime(mock_db):
+    assert get_latest_race_datetime() is None
+    mock_db.races.insert_many(
+        [
+            {"datetime": datetime(2024, 1, 1, 14, 0)},
+            {"datetime": datetime(2024, 1, 2, 13, 0)},
+            {"datetime": datetime(2023, 12, 31, 15, 0)},
+        ]
+    )
+    assert get_latest_race_datetime() == datetime(2024, 1, 2, 13, 0)
+
+
+def test_get_horses_splits_name_queries_into_chunks(mock_db, mocker):
+    mocker.patch("clients.mongo_client.HORSE_NAMES_PER_QUERY", 2)
+    spy = mocker.spy(mock_db.horses, "find")
+    mock_db.horses.insert_many(
+        [
+            {"name": name, "country": "GB", "year": 2020}
+            for name in ("ALPHA", "BRAVO", "CHARLIE")
+        ]
+    )
+    actual = get_horses(
+        [
+            PreMongoHorse(name=name, country="GB", year=2020)
+            for name in ("ALPHA", "BRAVO", "CHARLIE")
+        ]
+    )
+    assert [horse["name"] for horse in actual] == ["ALPHA", "BRAVO", "CHARLIE"]
+    assert spy.call_count == 2
+
+
+def test_get_horses_regex_fallback_matches_country_and_year(mock_db):
+    mock_db.horses.insert_many(
+        [
+            {"name": "DOBBINS DREAM", "country": "GB", "year": 2020},
+            {"name": "DOBBINS DREAM", "country": "IRE", "year": 2019},
+        ]
+    )
+    actual = get_horses(
+        [PreMongoHorse(name="DOBBIN'S DREAM", country="IRE", year=2019)]
+    )
+    assert actual[0]["country"] == "IRE"
+
+
+def test_get_horses_looks_up_leftovers_by_regex_one_at_a_time(mock_db, mocker):
+    spy = mocker.spy(mock_db.horses, "find_one")
+    mock_db.horses.insert_one({"name": "DOBBINS DREAM", "country": "IRE", "year": 2020})
+    get_horses(
+        [
+            PreMongoHorse(name="DOBBIN'S DREAM", country="IRE", year=2020),
+            PreMongoHorse(name="UNKNOWN", country="GB", year=2019),
+        ]
+    )
+    assert [call.args[0]["country"] for call in spy.call_args_list] == ["IRE", "GB"]
@@ -1,9 +1,13 @@
+from collections import OrderedDict
+from time import sleep
 from unittest.mock import MagicMock
 
 import pendulum
 import pytest
 
+from src.clients.disk_cache import DiskCache
 from src.clients.spaces_client import SpacesClient
+from src.clients.storage_backends import LocalBackend
 
 
 @pytest.fixture
@@ -33,6 +37,19 @@ def test_get_files_modified_after(mock_spaces_client):
     ]
 
 
+def test_get_files_modified_since_includes_same_time(mock_spaces_client):
+    mock_spaces_client.list_objects_v2.return_value = {
+        "Contents": [
+            {"Key": "foo.csv", "LastModified": pendulum.parse("2019-01-01 00:00")},
+            {"Key": "bar.csv", "LastModified": pendulum.parse("2020-01-01 00:00")},
+        ],
+    }
+    actual = SpacesClient.get_files(
+        "dir", modified_since=pendulum.parse("2020-01-01 00:00")
+    )
+    assert list(actual) == ["bar.csv"]
+
+
 def test_read_file_for_csv(mock_spaces_client):
     mock_spaces_client.get_object.return_value = {
         "Body": MagicMock(read=lambda: bytes("foo,bar,baz", "utf-8"))
@@ -59,3 +76,148 @@ def test_stream_file(mock_spaces_client):
 def test_write_file(mock_spaces_client):
     SpacesClient.write_file("foobar", "foo.csv")
     assert mock_spaces_client.put_object.called
+
+
+def test_iter_files_yields_contents_in_listing_order(mock_spaces_client):
+    mock_spaces_client.list_objects_v2.return_value = {
+        "Contents": [{"Key": f"{i}.json"} for i in range(10)],
+    }
+
+    def get_object(**kwargs):
+        key = kwargs["Key"]
+        sleep(0.01 * (10 - int(key.split(".")[0])))
+        return {"Body": MagicMock(read=lambda: bytes(f'{{"key": "{key}"}}', "utf-8"))}
+
+    mock_spaces_client.get_object.side_effect = get_object
+    actual = list(SpacesClient.iter_files("dir", concurrency=4))
+    assert actual == [(f"{i}.json", {"key": f"{i}.json"}) for i in range(10)]
+
+
+def test_iter_files_without_decoding(mock_spaces_client):
+    mock_spaces_client.list_objects_v2.return_value = {
+        "Contents": [{"Key": "foo.csv"}],
+    }
+    mock_spaces_client.get_object.return_value = {
+        "Body": MagicMock(read=lambda: bytes("foo,bar", "utf-8"))
+    }
+    assert list(SpacesClient.iter_files("dir", decode=False)) == [
+        ("foo.csv", b"foo,bar")
+    ]
+
+
+def test_iter_files_skips_filtered_keys(mock_spaces_client):
+    mock_spaces_client.list_objects_v2.return_value = {
+        "Contents": [{"Key": "foo.json"}, {"Key": "to_do_list.json"}],
+    }
+    mock_spaces_client.get_object.return_value = {
+        "Body": MagicMock(read=lambda: bytes("{}", "utf-8"))
+    }
+    actual = SpacesClient.iter_files("dir", key_filter=lambda x: "to_do" not in x)
+    assert list(actual) == [("foo.json", {})]
+    mock_spaces_client.get_object.assert_called_once_with(
+        Bucket="peaky76", Key="foo.json"
+    )
+
+
+@pytest.fixture
+def spaces_cache(mocker, tmp_path):
+    cache = DiskCache(tmp_path, 1000)
+    mocker.patch.object(SpacesClient, "_cache", cache)
+    mocker.patch.object(SpacesClient, "_listed", OrderedDict())
+    return cache
+
+
+def test_stream_file_uses_cache_for_listed_version(mock_spaces_client, spaces_cache):
+    mock_spaces_client.list_objects_v2.return_value = {
+        "Contents": [{"Key": "foo.csv", "ETag": '"abc"'}],
+    }
+    mock_spaces_client.get_object.return_value = {
+        "Body": MagicMock(read=lambda: bytes("foobar", "utf-8"))
+    }
+    list(SpacesClient.get_files("dir"))
+
+    assert SpacesClient.stream_file("foo.csv") == b"foobar"
+    assert SpacesClient.stream_file("foo.csv") == b"foobar"
+    assert mock_spaces_client.get_object.call_count == 1
+    assert spaces_cache.get("foo.csv", '"abc"') == b"foobar"
+
+
+def test_stream_file_refetches_changed_version(mock_spaces_client, spaces_cache):
+    spaces_cache.put("foo.csv", '"abc"', b"old")
+    mock_spaces_client.list_objects_v2.return_value = {
+        "Contents": [{"Key": "foo.csv", "ETag": '"def"'}],
+    }
+    mock_spaces_client.get_object.return_value = {
+        "Body": MagicMock(read=lambda: bytes("new", "utf-8"))
+    }
+    list(SpacesClient.get_files("dir"))
+
+    assert SpacesClient.stream_file("foo.csv") == b"new"
+
+
+def test_cache_only_mode_lists_and_reads_from_cache(mock_spaces_client, spaces_cache):
+    spaces_cache.offline = True
+    spaces_cache.put("dir/foo.json", '"abc"', b'{"foo": "bar"}')
+
+    assert list(SpacesClient.get_files("dir")) == ["dir/foo.json"]
+    assert SpacesClient.read_file("dir/foo.json") == {"foo": "bar"}
+    with pytest.raises(FileNotFoundError):
+        SpacesClient.stream_file("dir/bar.json")
+    assert not mock_spaces_client.list_objects_v2.called
+    assert not mock_spaces_client.get_object.called
+
+
+def test_cache_only_mode_filters_like_a_listing(mock_spaces_client, spaces_cache):
+    spaces_cache.put("dir/old.json", "1", b"{}", pendulum.parse("2019-01-01"))
+    spaces_cache.put("dir/new.json", "1", b"{}", pendulum.parse("2020-01-01"))
+    spaces_cache.put("dir/unknown.json", "1", b"{}")
+    spaces_cache.put("dir/sub", "1", b"{}")
+    spaces_cache.offline = True
+
+    actual = SpacesClient.get_files("dir/", pendulum.parse("2019-07-01"))
+
+    assert list(actual) == ["dir/new.json", "dir/unknown.json"]
+    assert SpacesClient.get_last_modified("dir/new.json") == pendulum.parse(
+        "2020-01-01"
+    )
+    assert SpacesClient.read_file("dir/new.json") == {}
+
+
+def test_stream_file_caches_listed_last_modified(mock_spaces_client, spaces_cache):
+    modified = pendulum.parse("2020-01-01")
+    mock_spaces_client.list_objects_v2.return_value = {
+        "Contents": [{"Key": "foo.csv", "ETag": '"abc"', "LastModified": modified}],
+    }
+    mock_spaces_client.get_object.return_value = {
+        "Body": MagicMock(read=lambda: bytes("foobar", "utf-8"))
+    }
+    list(SpacesClient.get_files("dir"))
+    SpacesClient.stream_file("foo.csv")
+
+    assert spaces_cache.get_last_modified("foo.csv") == modified
+
+
+def test_listed_keys_are_bounded(mock_spaces_client, mocker):
+    mocker.patch.object(SpacesClient, "_listed", OrderedDict())
+    mocker.patch("src.clients.spaces_client.LISTED_MAX", 2)
+    mock_spaces_client.list_objects_v2.return_value = {
+        "Contents": [{"Key": f"{i}.json", "ETag": str(i)} for i in range(3)],
+    }
+
+    list(SpacesClient.get_files("dir"))
+
+    assert list(SpacesClient._listed) == ["1.json", "2.json"]
+    assert SpacesClient.get_version("0.json") is None
+
+
+def test_spaces_client_with_local_backend(mocker, tmp_path):
+    mocker.patch.object(SpacesClient, "_backend", LocalBackend(tmp_path))
+    mocker.patch.object(SpacesClient, "_cache", None)
+    get = mocker.patch("src.clients.spaces_client.SpacesClient.get")
+
+    SpacesClient.write_file('{"foo": "bar"}', "dir/foo.json")
+
+    assert list(SpacesClient.get_files("dir")) == ["dir/foo.json"]
+    assert SpacesClient.read_file("dir/foo.json") == {"foo": "bar"}
+    assert list(SpacesClient.iter_files("dir")) == [("dir/foo.json", {"foo": "bar"})]
+    assert not get.called
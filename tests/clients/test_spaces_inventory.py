@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from src.clients.spaces_client import SpacesClient
+from src.clients.spaces_inventory import SpacesInventory
+from src.clients.storage_backends import LocalBackend
+
+MANIFEST = "dir/manifest.json"
+
+
+def get_id(key):
+    return key.split(".")[0].split("_")[-1]
+
+
+@pytest.fixture
+def local_spaces(mocker, tmp_path):
+    mocker.patch.object(SpacesClient, "_backend", LocalBackend(tmp_path))
+    mocker.patch.object(SpacesClient, "_cache", None)
+    for race_id in ("1", "2", "4"):
+        SpacesClient.write_file("{}", f"dir/results/result_{race_id}.json")
+    return tmp_path
+
+
+def test_load_lists_prefix_without_manifest(local_spaces):
+    inventory = SpacesInventory.load("dir/results/", MANIFEST, get_id)
+    assert inventory.items == {"1", "2", "4"}
+    assert inventory.last_key == "dir/results/result_4.json"
+    # Seeding the manifest, so none of the keys count as added
+    assert inventory.seeded
+    assert inventory.added == []
+    assert inventory.changed
+
+
+def test_missing_keeps_order_of_wanted(local_spaces):
+    inventory = SpacesInventory.load("dir/results/", MANIFEST, get_id)
+    assert inventory.missing(["5", "4", "3", "1"]) == ["5", "3"]
+
+
+def test_save_writes_manifest_only_when_changed(local_spaces, mocker):
+    inventory = SpacesInventory.load("dir/results/", MANIFEST, get_id)
+    inventory.save()
+    write_file = mocker.spy(SpacesClient, "write_file")
+    inventory.save()
+
+    assert not write_file.called
+    assert SpacesClient.read_file(MANIFEST) == {
+        "prefix": "dir/results/",
+        "last_key": "dir/results/result_4.json",
+        "keys": [
+            "dir/results/result_1.json",
+            "dir/results/result_2.json",
+            "dir/results/result_4.json",
+        ],
+    }
+
+
+def test_load_from_manifest_lists_only_later_keys(local_spaces, mocker):
+    SpacesInventory.load("dir/results/", MANIFEST, get_id).save()
+    SpacesClient.write_file("{}", "dir/results/result_5.json")
+    get_files = mocker.spy(SpacesClient, "get_files")
+
+    inventory = SpacesInventory.load("dir/results/", MANIFEST, get_id)
+
+    assert inventory.items == {"1", "2", "4", "5"}
+    assert get_files.call_args == mocker.call(
+        "dir/results/", start_after="dir/results/result_4.json"
+    )
+    assert inventory.changed
+
+
+def test_add_records_keys_written_out_of_order(local_spaces):
+    inventory = SpacesInventory.load("dir/results/", MANIFEST, get_id)
+    SpacesClient.write_file("{}", "dir/results/result_3.json")
+    inventory.add("dir/results/result_3.json")
+    inventory.save()
+
+    inventory = SpacesInventory.load("dir/results/", MANIFEST, get_id)
+
+    assert inventory.missing(["1", "2", "3", "4"]) == []
+
+
+def test_load_ignores_manifest_for_another_prefix(local_spaces):
+    SpacesClient.write_file(
+        json.dumps({"prefix": "other/", "last_key": "other/x_9.json", "keys": []}),
+        MANIFEST,
+    )
+    inventory = SpacesInventory.load("dir/results/", MANIFEST, get_id)
+    assert inventory.items == {"1", "2", "4"}
+
+
+def test_added_holds_keys_new_since_manifest_saved(local_spaces):
+    SpacesInventory.load("dir/results/", MANIFEST, get_id).save()
+    SpacesClient.write_file("{}", "dir/results/result_5.json")
+
+    inventory = SpacesInventory.load("dir/results/", MANIFEST, get_id)
+    inventory.add("dir/results/result_3.json")
+
+    assert not inventory.seeded
+    assert inventory.added == [
+        "dir/results/result_5.json",
+        "dir/results/result_3.json",
+    ]
+    inventory.save()
+    assert inventory.added == []
@@ -0,0 +1,73 @@
+import pendulum
+
+from src.clients.storage_backends import LocalBackend, S3Backend
+
+
+def test_local_backend_lists_objects_in_key_order(tmp_path):
+    (tmp_path / "dir/results").mkdir(parents=True)
+    (tmp_path / "dir/results/b.json").write_text("{}")
+    (tmp_path / "dir/results/a.json").write_text("{}")
+    (tmp_path / "dir/racecards.json").write_text("{}")
+    (tmp_path / "other.json").write_text("{}")
+
+    actual = LocalBackend(tmp_path).list_objects("dir/results")
+    assert [obj["Key"] for obj in actual] == [
+        "dir/results/a.json",
+        "dir/results/b.json",
+    ]
+
+
+def test_local_backend_only_walks_entries_under_prefix(tmp_path, mocker):
+    (tmp_path / "dir/results").mkdir(parents=True)
+    (tmp_path / "dir/results/a.json").write_text("{}")
+    (tmp_path / "dir/racecards").mkdir()
+    (tmp_path / "dir/racecards/a.json").write_text("{}")
+    rglob = mocker.spy(type(tmp_path), "rglob")
+
+    actual = LocalBackend(tmp_path).list_objects("dir/res")
+
+    assert [obj["Key"] for obj in actual] == ["dir/results/a.json"]
+    assert [call.args[0] for call in rglob.call_args_list] == [tmp_path / "dir/results"]
+
+
+def test_local_backend_lists_objects_for_missing_prefix(tmp_path):
+    assert list(LocalBackend(tmp_path).list_objects("dir/results/")) == []
+
+
+def test_local_backend_lists_last_modified(tmp_path):
+    (tmp_path / "foo.json").write_text("{}")
+    [obj] = LocalBackend(tmp_path).list_objects("")
+    assert obj["LastModified"] > pendulum.parse("2020-01-01")
+
+
+def test_local_backend_reads_small_objects(tmp_path):
+    (tmp_path / "foo.csv").write_text("foo,bar")
+    assert LocalBackend(tmp_path).get_object("foo.csv") == b"foo,bar"
+
+
+def test_local_backend_maps_large_objects(tmp_path, mocker):
+    mocker.patch("src.clients.storage_backends.MMAP_THRESHOLD", 4)
+    (tmp_path / "foo.csv").write_text("foo,bar")
+    actual = LocalBackend(tmp_path).get_object("foo.csv")
+    assert isinstance(actual, memoryview)
+    assert str(actual, "utf-8") == "foo,bar"
+
+
+def test_local_backend_puts_objects(tmp_path):
+    LocalBackend(tmp_path).put_object("dir/foo.csv", b"foo,bar")
+    assert (tmp_path / "dir/foo.csv").read_bytes() == b"foo,bar"
+
+
+def test_local_backend_lists_objects_after_key(tmp_path):
+    for name in ("20240101", "20240102", "20240103"):
+        (tmp_path / f"cards_{name}.json").write_text("{}")
+    actual = LocalBackend(tmp_path).list_objects("cards", "cards_20240102.json")
+    assert [obj["Key"] for obj in actual] == ["cards_20240103.json"]
+
+
+def test_s3_backend_passes_start_after(mocker):
+    client = mocker.MagicMock()
+    client.list_objects_v2.return_value = {"Contents": [{"Key": "b.json"}]}
+    actual = list(S3Backend(lambda: client, "bucket").list_objects("", "a.json"))
+    assert actual == [{"Key": "b.json"}]
+    assert client.list_objects_v2.call_args.kwargs["StartAfter"] == "a.json"
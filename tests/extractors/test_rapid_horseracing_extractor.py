@@ -1,17 +1,67 @@
+import asyncio
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 import pendulum
+import pytest
+from prefect.logging import disable_run_logger
 
+from src.clients.spaces_inventory import SpacesInventory
+from src.clients.storage_backends import LocalBackend
 from src.extractors.rapid_horseracing_extractor import (
     LIMITS,
     RACECARDS_DESTINATION,
+    RACECARDS_MANIFEST,
+    REQUESTS_USED,
     RESULTS_DESTINATION,
+    RESULTS_MANIFEST,
     SOURCE,
+    TO_DO_LIST,
+    SpacesClient,
     extract_racecards,
-    extract_result,
+    extract_results,
     get_file_date,
     get_headers,
     get_next_racecard_date,
+    get_racecards_filename,
+    get_result_filename,
     get_unfetched_race_ids,
+    load_results_inventory,
+    mark_results_done,
+    rapid_horseracing_extractor,
+    update_results_to_do_list,
 )
+from src.helpers.rate_limiter import RateLimiter
+
+
+class StubRapidHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        race_id = self.path.split("/")[-1]
+        if race_id == "404":
+            self.send_error(404)
+            return
+
+        body = json.dumps({"id_race": race_id}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubRapidHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+    server.server_close()
 
 
 def test_rapid_horseracing_source():
@@ -51,17 +101,18 @@ def test_get_headers(mocker):
 
 
 def test_get_unfetched_race_ids(mocker):
-    mocker.patch(
+    get_files = mocker.patch(
         "src.extractors.rapid_horseracing_extractor.SpacesClient.get_files"
-    ).return_value = ["file1", "file2"]
+    )
     mocker.patch(
         "src.extractors.rapid_horseracing_extractor.SpacesClient.read_file"
     ).return_value = [{"id_race": 999}]
     expected = [999, 999]
-    assert expected == get_unfetched_race_ids.fn("2020-01-01")
+    assert expected == get_unfetched_race_ids.fn(["file1", "file2"])
+    assert not get_files.called
 
 
-def test_extract_result(mocker):
+def test_extract_racecards(mocker):
     write_file = mocker.patch(
         "src.extractors.rapid_horseracing_extractor.SpacesClient.write_file"
     )
@@ -75,45 +126,217 @@ def test_extract_result(mocker):
         "src.extractors.rapid_horseracing_extractor.fetch_content"
     ).return_value = "foobar"
     mocker.patch(
-        "src.extractors.rapid_horseracing_extractor.RESULTS_DESTINATION", "results/"
+        "src.extractors.rapid_horseracing_extractor.RACECARDS_DESTINATION",
+        "racecards/",
     )
 
-    extract_result.fn("12345")
+    extract_racecards.fn("2020-01-01")
 
     assert write_file.call_count == 1
     assert (
-        mocker.call("foobar", "results/rapid_api_result_12345.json")
+        mocker.call("foobar", "racecards/rapid_api_racecards_20200101.json")
         == write_file.call_args
     )
 
 
-def test_extract_racecards(mocker):
+def test_extract_results_uploads_each_result_from_source(mocker, stub_server):
     write_file = mocker.patch(
         "src.extractors.rapid_horseracing_extractor.SpacesClient.write_file"
     )
     mocker.patch(
-        "src.extractors.rapid_horseracing_extractor.get_headers"
+        "src.extractors.rapid_horseracing_extractor.Secret.load"
+    ).return_value.get.return_value = "<key>"
+    mocker.patch(
+        "src.extractors.rapid_horseracing_extractor.RESULTS_DESTINATION", "results/"
+    )
+    fetched = []
+
+    with disable_run_logger():
+        asyncio.run(
+            extract_results(
+                ["1", "404", "2"], RateLimiter(LIMITS), fetched, stub_server
+            )
+        )
+
+    assert sorted(fetched) == ["1", "2"]
+    assert [
+        mocker.call(b'{"id_race": "1"}', "results/rapid_api_result_1.json"),
+        mocker.call(b'{"id_race": "2"}', "results/rapid_api_result_2.json"),
+    ] == sorted(write_file.call_args_list)
+
+
+def test_extract_results_waits_for_the_limiter(mocker, stub_server):
+    mocker.patch("src.extractors.rapid_horseracing_extractor.SpacesClient.write_file")
+    mocker.patch(
+        "src.extractors.rapid_horseracing_extractor.Secret.load"
+    ).return_value.get.return_value = "<key>"
+    now = [0.0]
+    sleeps = []
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    limiter = RateLimiter({"minute": 10}, used=9, clock=lambda: now[0], sleep=sleep)
+    fetched = []
+
+    with disable_run_logger():
+        asyncio.run(extract_results(["1", "2"], limiter, fetched, stub_server))
+
+    assert sorted(fetched) == ["1", "2"]
+    assert sleeps == [60]
+
+
+def test_mark_results_done(mocker):
+    mocker.patch(
+        "src.extractors.rapid_horseracing_extractor.SpacesClient.get_files"
+    ).return_value = []
+    mocker.patch(
+        "src.extractors.rapid_horseracing_extractor.SpacesClient.read_file"
     ).return_value = {
-        "x-rapidapi-host": "rapidapi.com",
-        "x-rapidapi-key": "mock_key",
+        "last_checked": "2020-01-01",
+        "results_to_do": ["1", "2", "3"],
+        "results_done": ["0"],
     }
+    write_file = mocker.patch(
+        "src.extractors.rapid_horseracing_extractor.SpacesClient.write_file"
+    )
     mocker.patch(
-        "src.extractors.rapid_horseracing_extractor.fetch_content"
-    ).return_value = "foobar"
+        "src.extractors.rapid_horseracing_extractor.RESULTS_DESTINATION", "results/"
+    )
+
+    mark_results_done(["3", "1"])
+
+    (to_do_list, _), (manifest, _) = [call.args for call in write_file.call_args_list]
+    assert json.loads(to_do_list) == {
+        "last_checked": "2020-01-01",
+        "results_to_do": ["2"],
+        "results_done": ["0", "3", "1"],
+    }
+    assert json.loads(manifest)["keys"] == [
+        "results/rapid_api_result_1.json",
+        "results/rapid_api_result_3.json",
+    ]
+
+
+def test_update_results_to_do_list_reads_only_new_racecards(mocker, tmp_path):
+    mocker.patch.object(SpacesClient, "_backend", LocalBackend(tmp_path))
+    mocker.patch.object(SpacesClient, "_cache", None)
+    SpacesClient.write_file(
+        json.dumps({"last_checked": None, "results_to_do": ["1"], "results_done": []}),
+        TO_DO_LIST,
+    )
+    SpacesClient.write_file("{}", get_result_filename("2"))
+    old, new = (
+        get_racecards_filename("2020-01-01"),
+        get_racecards_filename("2020-01-02"),
+    )
+    SpacesClient.write_file(json.dumps([{"id_race": "9"}]), old)
+    SpacesClient.write_file(
+        json.dumps([{"id_race": "1"}, {"id_race": "2"}, {"id_race": "3"}]), new
+    )
+
     mocker.patch(
-        "src.extractors.rapid_horseracing_extractor.RACECARDS_DESTINATION",
-        "racecards/",
+        "src.extractors.rapid_horseracing_extractor.get_unfetched_race_ids",
+        get_unfetched_race_ids.fn,
     )
 
-    extract_racecards.fn("2020-01-01")
+    update_results_to_do_list.fn([new])
 
-    assert write_file.call_count == 1
-    assert (
-        mocker.call("foobar", "racecards/rapid_api_racecards_20200101.json")
-        == write_file.call_args
+    to_do_list = SpacesClient.read_file(TO_DO_LIST)
+    assert to_do_list["results_to_do"] == ["1", "3"]
+    assert to_do_list["results_done"] == ["2"]
+
+
+def test_results_manifest_is_not_listed_with_results(mocker, tmp_path):
+    mocker.patch.object(SpacesClient, "_backend", LocalBackend(tmp_path))
+    mocker.patch.object(SpacesClient, "_cache", None)
+    SpacesClient.write_file("{}", f"{RESULTS_DESTINATION}rapid_api_result_1.json")
+
+    load_results_inventory().save()
+
+    assert SpacesClient.read_file(RESULTS_MANIFEST)["keys"] == [
+        f"{RESULTS_DESTINATION}rapid_api_result_1.json"
+    ]
+    # As the loaders list them, with or without the trailing slash
+    assert RESULTS_MANIFEST not in SpacesClient.get_files(RESULTS_DESTINATION)
+    assert RESULTS_MANIFEST not in SpacesClient.get_files(
+        RESULTS_DESTINATION.rstrip("/")
     )
 
 
+@pytest.fixture
+def local_extractor(mocker, tmp_path):
+    mocker.patch.object(SpacesClient, "_backend", LocalBackend(tmp_path))
+    mocker.patch.object(SpacesClient, "_cache", None)
+    module = "src.extractors.rapid_horseracing_extractor"
+    mocker.patch(f"{module}.LIMITS", {"day": 10, "minute": 100})
+    mocker.patch(f"{module}.update_results_to_do_list")
+    mocker.patch(f"{module}.mark_results_done")
+    mocker.patch(f"{module}.get_next_racecard_date", return_value=None)
+    requested = []
+
+    async def extract_results(race_ids, limiter, fetched):
+        for race_id in race_ids:
+            await limiter.acquire()
+            requested.append(race_id)
+
+    mocker.patch(f"{module}.extract_results", extract_results)
+    mocker.patch("helpers.metrics.metrics.emit")
+    SpacesClient.write_file(
+        json.dumps({"last_checked": None, "results_to_do": [str(i) for i in range(9)]}),
+        TO_DO_LIST,
+    )
+    return requested
+
+
+def test_extractor_shares_daily_limit_with_earlier_runs(local_extractor):
+    today = pendulum.today("UTC").to_date_string()
+    SpacesClient.write_file(json.dumps({"date": today, "count": 6}), REQUESTS_USED)
+
+    rapid_horseracing_extractor.fn()
+
+    # Keeping one of the four left today in reserve
+    assert local_extractor == ["0", "1", "2"]
+    assert SpacesClient.read_file(REQUESTS_USED) == {"date": today, "count": 9}
+
+
+def test_extractor_ignores_requests_used_on_earlier_days(local_extractor):
+    SpacesClient.write_file(
+        json.dumps({"date": "2020-01-01", "count": 6}), REQUESTS_USED
+    )
+
+    rapid_horseracing_extractor.fn()
+
+    # No racecards were requested, so only the reserve is kept
+    assert len(local_extractor) == 9
+    assert SpacesClient.read_file(REQUESTS_USED)["count"] == 9
+
+
+def test_extractor_without_manifest_takes_racecards_since_last_check(
+    local_extractor, mocker, tmp_path
+):
+    update_results = mocker.patch(
+        "src.extractors.rapid_horseracing_extractor.update_results_to_do_list"
+    )
+    old, new = (
+        get_racecards_filename("2020-01-01"),
+        get_racecards_filename("2020-01-02"),
+    )
+    for filename, modified in ((old, 1_600_000_000), (new, 1_700_000_000)):
+        SpacesClient.write_file("[]", filename)
+        os.utime(tmp_path / filename, (modified, modified))
+    SpacesClient.write_file(
+        json.dumps({"last_checked": "2021-01-01T00:00:00+00:00", "results_to_do": []}),
+        TO_DO_LIST,
+    )
+
+    rapid_horseracing_extractor.fn()
+
+    update_results.assert_called_once_with([new])
+    assert SpacesClient.read_file(RACECARDS_MANIFEST)["keys"] == [old, new]
+
+
 def test_get_next_racecard_date_when_date_available(mocker):
     mocker.patch(
         "src.extractors.rapid_horseracing_extractor.SpacesClient.get_files"
@@ -138,3 +361,12 @@ def test_get_next_racecard_date_when_no_dates_left(mocker):
     mocker.patch("pendulum.now").return_value = pendulum.parse("2020-01-03")
 
     assert None is get_next_racecard_date.fn()
+
+
+def test_get_next_racecard_date_from_inventory(mocker):
+    racecards = SpacesInventory("racecards/", "manifest.json", get_file_date)
+    for date in ("20200101", "20200103"):
+        racecards.add(f"racecards/rapid_api_racecards_{date}.json")
+    mocker.patch("pendulum.now").return_value = pendulum.parse("2020-01-05")
+
+    assert get_next_racecard_date.fn(racecards) == "2020-01-02"
@@ -0,0 +1,190 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from helpers.metrics import (
+    Metrics,
+    MongoCommandListener,
+    instrument_processor,
+    summary_to_markdown,
+)
+
+MODULE = "helpers.metrics"
+
+
+@pytest.fixture
+def metrics(mocker):
+    metrics = Metrics()
+    mocker.patch(f"{MODULE}.metrics", metrics)
+    return metrics
+
+
+def command_event(command_name, command, request_id=1, **kwargs):
+    return SimpleNamespace(
+        command_name=command_name,
+        command=command,
+        connection_id=("localhost", 27017),
+        request_id=request_id,
+        database_name="handykapp",
+        **kwargs,
+    )
+
+
+def test_time_records_calls_items_and_seconds(metrics):
+    with metrics.time("transform", items=3):
+        pass
+    with metrics.time("transform", items=2):
+        pass
+
+    stage = metrics.summary("test")["stages"]["transform"]
+    assert stage["calls"] == 2
+    assert stage["items"] == 5
+    assert stage["seconds"] >= 0
+
+
+def test_time_excludes_nested_stages_from_self_time(metrics, mocker):
+    clock = iter([0.0, 1.0, 4.0, 5.0])
+    mocker.patch(f"{MODULE}.perf_counter", side_effect=lambda: next(clock))
+
+    with metrics.time("outer"), metrics.time("inner"):
+        pass
+
+    stages = metrics.summary("test")["stages"]
+    assert stages["outer"]["seconds"] == 5.0
+    assert stages["outer"]["self_seconds"] == 2.0
+    assert stages["inner"]["self_seconds"] == 3.0
+
+
+def test_timed_times_each_call(metrics):
+    @metrics.timed("double")
+    def double(x):
+        return x * 2
+
+    assert double(2) == 4
+    assert double.__name__ == "double"
+    assert metrics.summary("test")["stages"]["double"]["calls"] == 1
+
+
+def test_take_stages_hands_timings_over_to_merge_stages(metrics):
+    worker = Metrics()
+    with worker.time("transform", items=3):
+        pass
+    with metrics.time("transform", items=2):
+        pass
+
+    metrics.merge_stages(worker.take_stages())
+
+    assert worker.stages == {}
+    assert metrics.summary("test")["stages"]["transform"]["items"] == 5
+
+
+def test_instrument_processor_counts_items_and_passes_values_through(metrics):
+    received = []
+
+    @instrument_processor("echo_processor")
+    def echo_processor():
+        value = None
+        try:
+            while True:
+                value = yield value
+                received.append(value)
+        except GeneratorExit:
+            received.append("closed")
+
+    p = echo_processor()
+    next(p)
+    assert p.send("foo") == "foo"
+    assert p.send("bar") == "bar"
+    p.close()
+
+    assert received == ["foo", "bar", "closed"]
+    stage = metrics.summary("test")["stages"]["echo_processor"]
+    assert stage["items"] == 2
+    assert stage["calls"] == 4
+
+
+def test_mongo_listener_records_round_trips_by_collection(metrics):
+    listener = MongoCommandListener(metrics)
+
+    listener.started(command_event("find", {"find": "horses"}))
+    listener.succeeded(command_event("find", {}, duration_micros=2000))
+    listener.started(
+        command_event("getMore", {"getMore": 1, "collection": "horses"}, 2)
+    )
+    listener.failed(command_event("getMore", {}, 2, duration_micros=4000))
+
+    mongo = metrics.summary("test")["mongo"]
+    assert mongo["horses.find"] == {
+        "count": 1,
+        "failures": 0,
+        "seconds": 0.002,
+        "mean_ms": 2.0,
+    }
+    assert mongo["horses.getMore"]["failures"] == 1
+
+
+def test_summary_gives_cache_hit_rates(metrics):
+    metrics.record_cache("spaces_disk", hit=True)
+    metrics.record_cache("spaces_disk", hit=True)
+    metrics.record_cache("spaces_disk", hit=False)
+    metrics.register_cache("horses", lambda: {"hits": 1, "misses": 3})
+
+    caches = metrics.summary("test")["caches"]
+    assert caches["spaces_disk"] == {"hits": 2, "misses": 1, "hit_rate": 0.667}
+    assert caches["horses"]["hit_rate"] == 0.25
+
+
+def test_summary_only_counts_registered_cache_lookups_since_reset(metrics):
+    stats = {"hits": 5, "misses": 5}
+    metrics.register_cache("horses", lambda: stats)
+    metrics.reset()
+    stats["hits"] += 2
+
+    assert metrics.summary("test")["caches"]["horses"] == {
+        "hits": 2,
+        "misses": 0,
+        "hit_rate": 1.0,
+    }
+
+
+def test_collect_emits_once_for_nested_runs(metrics, mocker):
+    emit = mocker.patch.object(metrics, "emit")
+
+    with metrics.collect("outer"):
+        with metrics.collect("inner"):
+            pass
+        emit.assert_not_called()
+
+    emit.assert_called_once_with("outer")
+
+
+def test_collect_does_not_fail_run_when_emit_fails(metrics, mocker):
+    mocker.patch.object(metrics, "emit", side_effect=OSError("read-only"))
+
+    with metrics.collect("test"):
+        pass
+
+
+def test_emit_writes_json_and_artifact(metrics, mocker, monkeypatch, tmp_path):
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path))
+    mocker.patch(f"{MODULE}.get_run_logger")
+    artifact = mocker.patch(f"{MODULE}.create_markdown_artifact")
+
+    with metrics.time("transform"):
+        pass
+    metrics.emit("load_data")
+
+    [path] = tmp_path.glob("load_data_*.json")
+    assert json.loads(path.read_text())["stages"]["transform"]["calls"] == 1
+    assert artifact.call_args.kwargs["key"] == "load-data-metrics"
+
+
+def test_summary_to_markdown_tabulates_sections(metrics):
+    with metrics.time("transform"):
+        pass
+
+    markdown = summary_to_markdown(metrics.summary("test"))
+    assert "## Stages" in markdown
+    assert "| transform | 1 | 1 |" in markdown
+    assert "## Mongo" not in markdown
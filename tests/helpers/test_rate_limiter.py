@@ -0,0 +1,62 @@
+import asyncio
+
+from helpers.rate_limiter import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def acquire_times(limiter, clock, count):
+    async def acquire_all():
+        times = []
+        for _ in range(count):
+            await limiter.acquire()
+            times.append(clock.now)
+        return times
+
+    return asyncio.run(acquire_all())
+
+
+def test_rate_limiter_keeps_every_window_within_limit():
+    clock = FakeClock()
+    limiter = RateLimiter({"minute": 3}, clock=clock, sleep=clock.sleep)
+    times = acquire_times(limiter, clock, 10)
+
+    assert all(later - earlier >= 60 for earlier, later in zip(times, times[3:]))
+    assert times[-1] == 180
+
+
+def test_rate_limiter_applies_the_strictest_limit():
+    clock = FakeClock()
+    limiter = RateLimiter({"day": 2, "second": 2}, clock=clock, sleep=clock.sleep)
+    assert acquire_times(limiter, clock, 3) == [0, 0, 86400]
+
+
+def test_rate_limiter_counts_requests_already_used():
+    clock = FakeClock()
+    limiter = RateLimiter({"minute": 3}, used=2, clock=clock, sleep=clock.sleep)
+    assert acquire_times(limiter, clock, 2) == [0, 60]
+
+
+def test_rate_limiter_does_not_wait_while_under_limit():
+    clock = FakeClock()
+    limiter = RateLimiter({"minute": 3}, clock=clock, sleep=clock.sleep)
+    acquire_times(limiter, clock, 3)
+    assert clock.sleeps == []
+
+
+def test_rate_limiter_counts_requests_acquired():
+    clock = FakeClock()
+    limiter = RateLimiter({"minute": 3}, used=2, clock=clock, sleep=clock.sleep)
+    acquire_times(limiter, clock, 2)
+    assert limiter.acquired == 2
@@ -1,8 +1,15 @@
+import datetime
+
+import petl
+
 from loaders.bha_loader import (
     convert_header_to_field_name,
-    csv_row_to_dict,
     get_csv,
+    transform_ratings_table,
 )
+from models import PreMongoHorse
+
+RATINGS_HEADER = "Name,Year,Sex,Sire,Dam,Trainer,Flat rating,Diff Flat,Flat Clltrl,AWT rating,Diff AWT,AWT Clltrl,Chase rating,Diff Chase,Chase Clltrl,Hurdle rating,Diff Hurdle,Hurdle Clltrl"
 
 
 def test_convert_header_to_field_name():
@@ -12,14 +19,6 @@ def test_convert_header_to_field_name():
     assert convert_header_to_field_name("2 runs ago") == "two_runs_ago"
 
 
-def test_csv_row_to_dict():
-    header = ["name", "year", "sex"]
-    data_row = ["HORSE (IRE)", "2020", "GELDING"]
-    result = csv_row_to_dict(header, data_row)
-    expected = {"name": "HORSE (IRE)", "year": "2020", "sex": "GELDING"}
-    assert result == expected
-
-
 def test_get_csv_returns_latest_ratings_by_default(mocker):
     mocker.patch(
         "loaders.bha_loader.SpacesClient.get_files",
@@ -30,3 +29,48 @@ def test_get_csv_returns_latest_ratings_by_default(mocker):
         ],
     )
     assert get_csv.fn() == "handykapp/bha/bha_ratings_20200201.csv"
+
+
+def test_transform_ratings_table_transforms_every_valid_row(mocker):
+    mocker.patch("loaders.bha_loader.get_run_logger")
+    rows = [
+        RATINGS_HEADER,
+        "A DAY TO DREAM (IRE),2020,GELDING,ADAAY (IRE),TARA TOO (IRE),Ollie Pears,49,,,,,,,,,,,",
+        "NO COUNTRY,2020,GELDING,ADAAY (IRE),TARA TOO (IRE),Ollie Pears,49,,,,,,,,,,,",
+        "DOBBIN (GB),2019,FILLY,ADAAY (IRE),TARA TOO (IRE),A Trainer,,,,61,,,,,,,,",
+    ]
+    data = petl.fromcsv(petl.MemorySource("\n".join(rows).encode()))
+
+    actual = list(transform_ratings_table(data, datetime.date(2024, 1, 1)))
+
+    assert [(horse.name, horse.country, horse.sex) for horse in actual] == [
+        ("A DAY TO DREAM", "IRE", "M"),
+        ("DOBBIN", "GB", "F"),
+    ]
+    assert actual[1].ratings.aw == 61
+
+
+def test_transform_ratings_table_maps_each_column_to_its_field(mocker):
+    mocker.patch("loaders.bha_loader.get_run_logger")
+    rows = [
+        RATINGS_HEADER,
+        "A DAY TO DREAM (IRE),2020,GELDING,ADAAY (IRE),TARA TOO (IRE),Ollie Pears,49,,,62,,,,,,,,",
+    ]
+    data = petl.fromcsv(petl.MemorySource("\n".join(rows).encode()))
+
+    [actual] = transform_ratings_table(data, datetime.date(2024, 1, 1))
+
+    assert actual.model_dump() == {
+        "name": "A DAY TO DREAM",
+        "country": "IRE",
+        "year": 2020,
+        "sex": "M",
+        "colour": None,
+        "owner": None,
+        "trainer": "Ollie Pears",
+        "sire": PreMongoHorse(name="ADAAY", country="IRE", sex="M").model_dump(),
+        "dam": PreMongoHorse(name="TARA TOO", country="IRE", sex="F").model_dump(),
+        "damsire": None,
+        "gelded_from": datetime.date(2024, 1, 1),
+        "ratings": {"flat": 49, "aw": 62, "chase": None, "hurdle": None},
+    }
@@ -0,0 +1,96 @@
+import json
+import os
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from clients import SpacesClient
+from clients.storage_backends import LocalBackend
+from helpers.metrics import metrics
+from loaders.rapid_horseracing_loader import load_rapid_horseracing_data
+
+MODULE = "loaders.rapid_horseracing_loader"
+
+RECORD = {
+    "id_race": "2",
+    "course": "Ascot",
+    "date": "2024-01-01 14:00:00",
+    "title": "ASCOT HANDICAP (5)",
+    "distance": "1m",
+    "age": "3",
+    "going": "Good",
+    "finished": True,
+    "canceled": False,
+    "horses": [],
+}
+
+
+@pytest.fixture
+def local_results(mocker, tmp_path):
+    backend = LocalBackend(tmp_path)
+    mocker.patch.object(SpacesClient, "_backend", backend)
+    mocker.patch.object(SpacesClient, "_cache", None)
+    mocker.patch(f"{MODULE}.SOURCE", "rapid/")
+    mocker.patch(f"{MODULE}.get_run_logger")
+    mocker.patch.object(metrics, "emit")
+    backend.put_object("rapid/results_to_do_list.json", b'{"results_to_do": []}')
+    backend.put_object("rapid/results/rapid_api_result_1.json", b"{}")
+    backend.put_object(
+        "rapid/results/rapid_api_result_2.json", json.dumps(RECORD).encode()
+    )
+
+
+def test_load_rapid_horseracing_data_skips_bad_records(local_results, mocker):
+    sent = []
+
+    def record_processor():
+        while True:
+            sent.append((yield))
+
+    mocker.patch(f"{MODULE}.make_record_processor", return_value=record_processor())
+    mocker.patch(f"{MODULE}.get_latest_race_datetime")
+    update_watermark = mocker.patch(f"{MODULE}.update_watermark")
+
+    load_rapid_horseracing_data.fn()
+
+    assert [file for _, _, file, _ in sent] == ["rapid/results/rapid_api_result_2.json"]
+    assert (
+        update_watermark.call_args.kwargs["last_key"]
+        == "rapid/results/rapid_api_result_2.json"
+    )
+
+
+def test_load_rapid_horseracing_data_loads_same_second_uploads_once(
+    local_results, mocker, tmp_path
+):
+    sent = []
+
+    def record_processor():
+        while True:
+            sent.append((yield))
+
+    mocker.patch(f"{MODULE}.make_record_processor", return_value=record_processor())
+    mocker.patch(f"{MODULE}.get_latest_race_datetime")
+    update_watermark = mocker.patch(f"{MODULE}.update_watermark")
+    (tmp_path / "rapid/results/rapid_api_result_3.json").write_text(json.dumps(RECORD))
+    watermark = datetime(2024, 1, 1, tzinfo=UTC)
+    # Result 2 was loaded last time, result 3 was uploaded in the same second
+    for i, modified in (
+        (1, watermark - timedelta(seconds=1)),
+        (2, watermark),
+        (3, watermark),
+    ):
+        path = tmp_path / f"rapid/results/rapid_api_result_{i}.json"
+        os.utime(path, (modified.timestamp(), modified.timestamp()))
+
+    load_rapid_horseracing_data.fn(
+        modified_since=watermark,
+        loaded_keys=["rapid/results/rapid_api_result_2.json"],
+    )
+
+    assert [file for _, _, file, _ in sent] == ["rapid/results/rapid_api_result_3.json"]
+    assert update_watermark.call_args.kwargs["last_modified"] == watermark
+    assert update_watermark.call_args.kwargs["last_modified_keys"] == [
+        "rapid/results/rapid_api_result_2.json",
+        "rapid/results/rapid_api_result_3.json",
+    ]
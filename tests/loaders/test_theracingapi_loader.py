@@ -0,0 +1,101 @@
+import os
+from datetime import UTC, datetime
+
+import pendulum
+import pytest
+
+from clients import SpacesClient
+from clients.storage_backends import LocalBackend
+from helpers.metrics import metrics
+from loaders.theracingapi_loader import (
+    increment_theracingapi_data,
+    load_theracingapi_data,
+)
+
+MODULE = "loaders.theracingapi_loader"
+
+
+LAST_MODIFIED = datetime(2024, 1, 2, tzinfo=UTC)
+
+
+@pytest.fixture
+def local_racecards(mocker, tmp_path):
+    backend = LocalBackend(tmp_path)
+    mocker.patch.object(SpacesClient, "_backend", backend)
+    mocker.patch.object(SpacesClient, "_cache", None)
+    mocker.patch(f"{MODULE}.SOURCE", "theracingapi/")
+    mocker.patch(f"{MODULE}.get_run_logger")
+    mocker.patch(f"{MODULE}.get_latest_race_datetime")
+    mocker.patch(f"{MODULE}.make_record_processor")
+    mocker.patch.object(metrics, "emit")
+    for date in ("20240101", "20240102"):
+        path = tmp_path / f"theracingapi/racecards/racecards_{date}.json"
+        backend.put_object(path.relative_to(tmp_path).as_posix(), b'{"racecards": []}')
+        os.utime(path, (LAST_MODIFIED.timestamp(), LAST_MODIFIED.timestamp()))
+    return tmp_path
+
+
+def test_increment_theracingapi_data_starts_from_watermark(mocker):
+    mocker.patch(f"{MODULE}.get_run_logger")
+    mocker.patch(
+        f"{MODULE}.get_watermark",
+        return_value={
+            "last_key": "racecards/theracingapi_racecards_20240101.json",
+            "last_modified": datetime(2024, 1, 1, 18, 0),
+        },
+    )
+    load = mocker.patch(f"{MODULE}.load_theracingapi_data")
+    increment_theracingapi_data.fn()
+    load.assert_called_once_with(
+        start_after="racecards/theracingapi_racecards_20240101",
+        last_key="racecards/theracingapi_racecards_20240101.json",
+        last_modified=pendulum.datetime(2024, 1, 1, 18, 0),
+    )
+
+
+def test_load_theracingapi_data_reloads_last_key_when_refetched(
+    local_racecards, mocker
+):
+    update_watermark = mocker.patch(f"{MODULE}.update_watermark")
+    last_key = "theracingapi/racecards/racecards_20240102.json"
+
+    load_theracingapi_data.fn(
+        start_after=last_key.rsplit(".", 1)[0],
+        last_key=last_key,
+        last_modified=datetime(2024, 1, 1, tzinfo=UTC),
+    )
+
+    assert update_watermark.call_args.kwargs["last_key"] == last_key
+
+
+def test_load_theracingapi_data_skips_last_key_when_unchanged(local_racecards, mocker):
+    update_watermark = mocker.patch(f"{MODULE}.update_watermark")
+    last_key = "theracingapi/racecards/racecards_20240102.json"
+
+    load_theracingapi_data.fn(
+        start_after=last_key.rsplit(".", 1)[0],
+        last_key=last_key,
+        last_modified=LAST_MODIFIED,
+    )
+
+    assert not update_watermark.called
+
+
+def test_increment_theracingapi_data_falls_back_to_latest_race(mocker):
+    mocker.patch(f"{MODULE}.get_run_logger")
+    mocker.patch(f"{MODULE}.get_watermark", return_value={})
+    mocker.patch(
+        f"{MODULE}.get_latest_race_datetime", return_value=datetime(2024, 1, 1, 14, 0)
+    )
+    load = mocker.patch(f"{MODULE}.load_theracingapi_data")
+    increment_theracingapi_data.fn()
+    load.assert_called_once_with(from_date=pendulum.date(2024, 1, 1))
+
+
+def test_increment_theracingapi_data_loads_everything_into_empty_db(mocker):
+    mocker.patch(f"{MODULE}.get_run_logger")
+    mocker.patch(f"{MODULE}.get_watermark", return_value={})
+    mocker.patch(f"{MODULE}.get_latest_race_datetime", return_value=None)
+    load = mocker.patch(f"{MODULE}.load_theracingapi_data")
+    increment_theracingapi_data.fn()
+    load.assert_called_once_with()
@@ -0,0 +1,96 @@
+import pendulum
+import pytest
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from models.mongo_betfair_horserace_pnl import MongoBetfairHorseracePnl
+from processors.betfair_processor import betfair_processor, make_pnl_upsert
+
+MODULE = "processors.betfair_processor"
+
+
+@pytest.fixture
+def pnl_line():
+    return MongoBetfairHorseracePnl(
+        racecourse="Brighton",
+        race_datetime=pendulum.datetime(2024, 4, 30, 16, 10),
+        race_description="1m2f Hcap",
+        profit_loss=78.6,
+        places=1,
+    )
+
+
+def bulk_result(upserted=0, matched=0, modified=0, write_errors=()):
+    return {
+        "nUpserted": upserted,
+        "nMatched": matched,
+        "nModified": modified,
+        "writeErrors": list(write_errors),
+    }
+
+
+def test_make_pnl_upsert_matches_on_natural_key(pnl_line):
+    assert make_pnl_upsert(pnl_line) == UpdateOne(
+        {
+            "racecourse": "Brighton",
+            "race_datetime": pendulum.datetime(2024, 4, 30, 16, 10),
+            "places": 1,
+            "race_description": "1m2f Hcap",
+        },
+        {"$set": {"profit_loss": 78.6}},
+        upsert=True,
+    )
+
+
+def test_betfair_processor_writes_in_batches_and_counts_outcomes(mocker, pnl_line):
+    logger = mocker.patch(f"{MODULE}.get_run_logger").return_value
+    bulk_write = mocker.patch(f"{MODULE}.db").betfair.bulk_write
+    bulk_write.return_value.bulk_api_result = bulk_result(
+        upserted=1, matched=1, modified=1
+    )
+
+    p = betfair_processor(bulk_threshold=2)
+    next(p)
+    for _ in range(3):
+        p.send(pnl_line)
+    p.close()
+
+    assert [len(call.args[0]) for call in bulk_write.call_args_list] == [2, 1]
+    logger.info.assert_called_with(
+        "Finished processing Betfair P&L. Added 2, updated 2, unchanged 0, skipped 0"
+    )
+
+
+def test_betfair_processor_counts_reloaded_lines_as_unchanged(mocker, pnl_line):
+    logger = mocker.patch(f"{MODULE}.get_run_logger").return_value
+    bulk_write = mocker.patch(f"{MODULE}.db").betfair.bulk_write
+    bulk_write.return_value.bulk_api_result = bulk_result(matched=2)
+
+    p = betfair_processor()
+    next(p)
+    p.send(pnl_line)
+    p.send(pnl_line)
+    p.close()
+
+    logger.info.assert_called_with(
+        "Finished processing Betfair P&L. Added 0, updated 0, unchanged 2, skipped 0"
+    )
+
+
+def test_betfair_processor_skips_lines_that_fail_to_write(mocker, pnl_line):
+    logger = mocker.patch(f"{MODULE}.get_run_logger").return_value
+    error = {"index": 1, "code": 11000, "errmsg": "E11000 duplicate key", "op": {}}
+    mocker.patch(f"{MODULE}.db").betfair.bulk_write.side_effect = BulkWriteError(
+        bulk_result(upserted=1, write_errors=[error])
+    )
+
+    p = betfair_processor()
+    next(p)
+    p.send(pnl_line)
+    p.send(pnl_line)
+    p.close()
+
+    logger.warning.assert_called_once()
+    logger.info.assert_called_with(
+        "Finished processing Betfair P&L. Added 1, updated 0, unchanged 0, skipped 1"
+    )
@@ -0,0 +1,118 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import fitz  # type: ignore
+import pytest
+
+from processors.formdata_processors.file_processor import (
+    extract_page_texts,
+    forward_horses,
+    parse_file_in_parallel,
+    parse_pages,
+)
+from processors.formdata_processors.page_processor import split_page_text
+from processors.formdata_processors.word_processor import ErrorLog, FormdataParser
+
+MODULE = "processors.formdata_processors.file_processor"
+
+HEADER = ["FORMDATA FLAT 2024", "Horse", "Trainer", "Prize"]
+RUN = ["10Jun23", "2CG1156", "Asc", "8", "9-13t3RyanSexton", "3", "1.5", "115", "6G", "120"]  # fmt: skip
+
+
+def horse_lines(name):
+    return [f"{name} (IRE)", "3", "JSmith", "F1", "£100"]
+
+
+# Bravo's second run is on the next page, and Delta has no runs on its first page
+PAGES = [
+    [*HEADER, *horse_lines("ALPHA"), *RUN, *horse_lines("BRAVO"), *RUN],
+    [*HEADER, *RUN, *horse_lines("CHARLIE"), *RUN, *horse_lines("DELTA")],
+    [*HEADER, *RUN, *RUN],
+    [*HEADER, *horse_lines("ECHO"), *RUN, *horse_lines("FOXTROT"), *RUN],
+]
+
+
+def make_pdf(path, pages):
+    doc = fitz.open()
+    for lines in pages:
+        doc.new_page().insert_text((72, 72), "\n".join(lines), fontsize=6)
+    doc.save(path)
+    return path
+
+
+class Collector:
+    def __init__(self):
+        self.horses = []
+
+    def send(self, horse):
+        self.horses.append(horse)
+
+
+def parse_serially(path, year):
+    parser = FormdataParser(ErrorLog())
+    with fitz.open(path) as doc:
+        words = [word for page in doc for word in split_page_text(page.get_text())]
+    return [horse for word in words if (horse := parser.feed(word, year))]
+
+
+def test_extract_page_texts(tmp_path):
+    path = make_pdf(tmp_path / "formdata.pdf", [[f"Page {i}"] for i in range(3)])
+    actual = extract_page_texts(str(path), 1, 3)
+    assert [text.strip() for text in actual] == ["Page 1", "Page 2"]
+
+
+def test_parse_pages_leaves_horses_running_over_range_ends(tmp_path):
+    path = make_pdf(tmp_path / "formdata.pdf", PAGES)
+
+    head, horses, tail, errors = parse_pages(str(path), 1, 2, 2024)
+
+    assert head == [*HEADER, *RUN]
+    assert [horse.name for horse in horses] == ["CHARLIE"]
+    assert tail[0] == "DELTA (IRE)"
+    assert errors == []
+
+
+def test_parse_pages_without_a_horse_starting(tmp_path):
+    path = make_pdf(tmp_path / "formdata.pdf", PAGES)
+
+    head, horses, tail, _ = parse_pages(str(path), 2, 3, 2024)
+
+    assert (head[: len(HEADER)], horses, tail) == (HEADER, [], None)
+
+
+@pytest.mark.parametrize("pages_per_task", [1, 2, 3])
+def test_forward_horses_matches_parsing_serially(tmp_path, mocker, pages_per_task):
+    path = make_pdf(tmp_path / "formdata.pdf", PAGES)
+    entries = Collector()
+
+    parser = FormdataParser(mocker.Mock())
+    for start in range(0, len(PAGES), pages_per_task):
+        parsed = parse_pages(
+            str(path), start, min(start + pages_per_task, len(PAGES)), 2024
+        )
+        parser = forward_horses(parsed, parser, 2024, entries, mocker.Mock())
+
+    expected = parse_serially(path, 2024)
+    assert [horse.name for horse in expected] == ["ALPHA", "BRAVO", "CHARLIE", "DELTA", "ECHO"]  # fmt: skip
+    assert entries.horses == expected
+    assert [len(horse.runs) for horse in entries.horses] == [1, 2, 1, 2, 1]
+
+
+def test_parse_file_in_parallel_keeps_horse_order(tmp_path, mocker):
+    path = make_pdf(tmp_path / "formdata_240101.pdf", PAGES)
+    mocker.patch(f"{MODULE}.SpacesClient.stream_file", return_value=path.read_bytes())
+    entries = Collector()
+
+    with ProcessPoolExecutor(max_workers=2, mp_context=get_context("spawn")) as pool:
+        _, page_count = parse_file_in_parallel(
+            "formdata_240101.pdf",
+            FormdataParser(mocker.Mock()),
+            pool,
+            entries,
+            mocker.Mock(),
+            pages_per_task=1,
+            max_in_flight=2,
+        )
+
+    assert page_count == len(PAGES)
+    assert entries.horses == parse_serially(path, 2024)
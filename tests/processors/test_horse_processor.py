@@ -0,0 +1,209 @@
+import mongomock
+import pytest
+
+from clients.mongo_client import HorseCache
+from models import PreMongoHorse
+from processors.horse_processor import HorseStaging, horse_processor
+
+MODULE = "processors.horse_processor"
+
+
+@pytest.fixture
+def mock_horses(mocker):
+    db = mongomock.MongoClient().handykapp
+    db.horses.create_index([("name", 1), ("country", 1), ("year", 1)], unique=True)
+    mocker.patch("clients.mongo_client.db", db)
+    mocker.patch("clients.mongo_client.horse_cache", HorseCache())
+    mocker.patch(f"{MODULE}.db", db)
+    mocker.patch(f"{MODULE}.horse_cache", HorseCache())
+    mocker.patch(f"{MODULE}.get_run_logger")
+    db.horses.insert_one(
+        {"_id": 1, "name": "DOBBIN", "country": "IRE", "year": 2020, "sex": "M"}
+    )
+    return db
+
+
+def test_stage_insert_assigns_id_for_later_references(mock_horses, mocker):
+    staging = HorseStaging()
+    horse = PreMongoHorse(name="NEDDY", country="GB", year=2019, sex="F")
+
+    horse_id = staging.stage_insert(horse)
+
+    assert staging.get_horse_id(horse) == horse_id
+    assert mock_horses.horses.count_documents({}) == 1
+
+    staging.flush(mocker.Mock())
+    assert mock_horses.horses.find_one({"_id": horse_id})["name"] == "NEDDY"
+    assert len(staging) == 0
+
+
+def test_stage_insert_merges_details_into_staged_insert(mock_horses, mocker):
+    staging = HorseStaging()
+    horse_id = staging.stage_insert(
+        PreMongoHorse(name="NEDDY", country="GB", year=2019)
+    )
+
+    assert (
+        staging.stage_insert(
+            PreMongoHorse(name="NEDDY", country="GB", year=2019, colour="b")
+        )
+        == horse_id
+    )
+    staging.flush(mocker.Mock())
+
+    assert mock_horses.horses.find_one({"_id": horse_id})["colour"] == "b"
+
+
+def test_stage_insert_merges_only_what_an_update_would_set(mock_horses, mocker):
+    staging = HorseStaging()
+    horse_id = staging.stage_insert(
+        PreMongoHorse(name="NEDDY", country="GB", year=2019, sex="F")
+    )
+
+    staging.stage_insert(
+        PreMongoHorse(name="NEDDY", country="GB", year=2019, sex="M", colour="b")
+    )
+    staging.flush(mocker.Mock())
+
+    neddy = mock_horses.horses.find_one({"_id": horse_id})
+    assert (neddy["sex"], neddy["colour"]) == ("F", "b")
+
+
+def test_staged_horse_found_without_country_by_sex(mock_horses, mocker):
+    staging = HorseStaging()
+    dam_id = staging.stage_insert(
+        PreMongoHorse(name="JINROSKAHAR", country="FR", year=2012, sex="F")
+    )
+
+    foal_id = staging.stage_insert(
+        PreMongoHorse(
+            name="LORLORROS",
+            country="GB",
+            year=2020,
+            dam=PreMongoHorse(name="JINROSKAHAR", sex="F"),
+        )
+    )
+    staging.flush(mocker.Mock())
+
+    assert mock_horses.horses.count_documents({"name": "JINROSKAHAR"}) == 1
+    assert mock_horses.horses.find_one({"_id": foal_id})["dam"] == dam_id
+
+
+def test_staged_horse_found_by_apostrophe_regex(mock_horses):
+    staging = HorseStaging()
+    horse_id = staging.stage_insert(
+        PreMongoHorse(name="O'REILLY", country="IRE", year=2018)
+    )
+
+    assert (
+        staging.get_horse_id(PreMongoHorse(name="OREILLY", country="IRE", year=2018))
+        == horse_id
+    )
+    assert not staging.is_staged(
+        PreMongoHorse(name="OREILLY", country="IRE", year=2018), exact=True
+    )
+
+
+def test_stored_horse_beats_looser_staged_match(mock_horses):
+    staging = HorseStaging()
+    staging.stage_insert(PreMongoHorse(name="NEDDY", country="FR", year=2012, sex="F"))
+    mock_horses.horses.insert_one({"_id": 2, "name": "NEDDY", "sex": "F"})
+
+    assert staging.get_horse_id(PreMongoHorse(name="NEDDY", sex="F")) == 2
+
+
+def test_bulk_write_horses_replaces_duplicate_inserts(mock_horses, mocker):
+    staging = HorseStaging()
+    dobbin = PreMongoHorse(name="DOBBIN", country="IRE", year=2020, sex="M")
+    dobbin_id = staging.stage_insert(dobbin)
+    foal_id = staging.stage_insert(
+        PreMongoHorse(name="FOAL", country="GB", year=2023, sire=dobbin)
+    )
+
+    replacements = staging.flush(mocker.Mock())
+
+    assert replacements == {dobbin_id: 1}
+    assert staging.replacements == {dobbin_id: 1}
+    assert mock_horses.horses.find_one({"_id": foal_id})["sire"] == 1
+    assert mock_horses.horses.count_documents({"name": "DOBBIN"}) == 1
+
+
+def test_bulk_write_horses_relinks_in_one_round_trip(mock_horses, mocker):
+    staging = HorseStaging()
+    dobbin = PreMongoHorse(name="DOBBIN", country="IRE", year=2020, sex="M")
+    staging.stage_insert(dobbin)
+    staging.stage_insert(PreMongoHorse(name="FOAL", country="GB", year=2023))
+    staging.stage_insert(
+        PreMongoHorse(name="FILLY", country="GB", year=2023, sire=dobbin, dam=dobbin)
+    )
+    bulk_write = mocker.spy(mock_horses.horses, "bulk_write")
+    update_many = mocker.spy(mock_horses.horses, "update_many")
+
+    staging.flush(mocker.Mock())
+
+    # One write for the horses and one to relink them
+    assert bulk_write.call_count == 2
+    assert update_many.call_count == 0
+    filly = mock_horses.horses.find_one({"name": "FILLY"})
+    assert (filly["sire"], filly["dam"]) == (1, 1)
+
+
+def test_bulk_write_horses_relinks_only_horses_in_the_batch(mock_horses, mocker):
+    staging = HorseStaging()
+    dobbin = PreMongoHorse(name="DOBBIN", country="IRE", year=2020, sex="M")
+    dobbin_id = staging.stage_insert(dobbin)
+    staging.flush(mocker.Mock())
+    staging.stage_insert(PreMongoHorse(name="NEDDY", country="GB", year=2019))
+    bulk_write = mocker.spy(mock_horses.horses, "bulk_write")
+
+    staging.flush(mocker.Mock())
+
+    # The earlier duplicate is not relinked again
+    assert bulk_write.call_count == 1
+    assert staging.replacements == {dobbin_id: 1}
+
+
+def test_horse_processor_merges_updates_for_staged_horses(mock_horses):
+    staging = HorseStaging()
+
+    h = horse_processor(staging)
+    next(h)
+    h.send(PreMongoHorse(name="NEDDY", country="GB", year=2019, sex="F"))
+    h.send(PreMongoHorse(name="NEDDY", country="GB", year=2019, colour="ch"))
+    h.close()
+
+    [neddy] = mock_horses.horses.find({"name": "NEDDY"})
+    assert (neddy["sex"], neddy["colour"]) == ("F", "ch")
+
+
+def test_horse_processor_merges_countryless_sighting_into_staged_horse(
+    mock_horses,
+):
+    staging = HorseStaging()
+
+    valzen = PreMongoHorse(name="VALZEN", sex="M")
+
+    h = horse_processor(staging)
+    next(h)
+    h.send(PreMongoHorse(name="JINROSKAHAR", country="FR", year=2012, sex="F"))
+    h.send(valzen)
+    h.send(PreMongoHorse(name="JINROSKAHAR", sex="F", sire=valzen))
+    h.close()
+
+    [dam] = mock_horses.horses.find({"name": "JINROSKAHAR"})
+    [sire] = mock_horses.horses.find({"name": "VALZEN"})
+    assert (dam["country"], dam["sire"]) == ("FR", sire["_id"])
+
+
+def test_horse_processor_stages_horses_per_run(mock_horses):
+    first, second = HorseStaging(), HorseStaging()
+    neddy = PreMongoHorse(name="NEDDY", country="GB", year=2019, sex="F")
+    first.stage_insert(neddy)
+
+    h = horse_processor(second)
+    next(h)
+    h.send(neddy)
+    h.close()
+
+    assert mock_horses.horses.count_documents({"name": "NEDDY"}) == 1
+    assert first.is_staged(neddy)
@@ -0,0 +1,124 @@
+import mongomock
+import pytest
+
+from models import PreMongoPerson
+from processors.person_processor import (
+    PeopleIndex,
+    parse_name,
+    person_processor,
+    preload_person_cache,
+)
+
+MODULE = "processors.person_processor"
+
+
+def test_people_index_finds_by_first_name():
+    index = PeopleIndex()
+    index.add("1", "Smith", "John", "")
+    assert index.find(parse_name("John Smith")) == "1"
+
+
+def test_people_index_finds_by_initial_and_title():
+    index = PeopleIndex()
+    index.add("1", "Smith", "John", "Mr")
+    assert index.find(parse_name("Mr J Smith")) == "1"
+
+
+def test_people_index_does_not_match_initial_with_different_title():
+    index = PeopleIndex()
+    index.add("1", "Smith", "John", "Mr")
+    assert index.find(parse_name("Mrs J Smith")) is None
+
+
+def test_people_index_prefers_earliest_added_match():
+    index = PeopleIndex()
+    index.add("1", "Smith", "Jane", "")
+    index.add("2", "Smith", "J", "")
+    assert index.find(parse_name("J Smith")) == "1"
+
+
+def test_people_index_returns_none_for_unknown_last_name():
+    index = PeopleIndex()
+    index.add("1", "Smith", "John", "")
+    assert index.find(parse_name("John Jones")) is None
+
+
+def test_parse_name_is_memoised():
+    assert parse_name("John Smith") is parse_name("John Smith")
+
+
+@pytest.fixture
+def mock_people(mocker):
+    db = mongomock.MongoClient().handykapp
+    mocker.patch(f"{MODULE}.db", db)
+    mocker.patch(f"{MODULE}.get_run_logger")
+    db.people.insert_many(
+        [
+            {
+                "_id": 1,
+                "first": "John",
+                "last": "Smith",
+                "references": {"rapid": "J Smith"},
+            },
+            {
+                "_id": 2,
+                "first": "Jane",
+                "last": "Doe",
+                "references": {"rapid": "J Doe"},
+            },
+            {
+                "_id": 3,
+                "first": "Tom",
+                "last": "Jones",
+                "references": {"rr": "T Jones"},
+            },
+        ]
+    )
+    return db
+
+
+def test_preload_person_cache_caches_named_people_for_source(mock_people):
+    cache = preload_person_cache(["J Smith", "T Jones"], "rapid")
+    assert cache == {("J Smith", "rapid"): 1}
+
+
+def test_preload_person_cache_caches_all_of_source_without_names(mock_people):
+    cache = preload_person_cache(None, "rapid")
+    assert cache == {("J Smith", "rapid"): 1, ("J Doe", "rapid"): 2}
+
+
+def test_preload_person_cache_does_not_query_for_no_names(mock_people, mocker):
+    find = mocker.spy(mock_people.people, "find")
+    assert preload_person_cache([], "rapid") == {}
+    assert not find.called
+
+
+def test_person_processor_does_not_query_preloaded_people(mock_people, mocker):
+    find = mocker.spy(mock_people.people, "find")
+    find_one = mocker.spy(mock_people.people, "find_one")
+    insert_one = mocker.spy(mock_people.people, "insert_one")
+    p = person_processor(preload_source="rapid")
+    next(p)
+
+    found_ids = [
+        p.send((PreMongoPerson(name=name, role="jockey"), "rapid"))
+        for name in ("J Smith", "J Doe", "J Smith")
+    ]
+    p.close()
+
+    assert found_ids == [1, 2, 1]
+    # Once to preload the source and once to index everyone, before any is sent
+    assert find.call_count == 2
+    assert not find_one.called
+    assert not insert_one.called
+
+
+def test_person_processor_logs_cache_hit_rate(mock_people, mocker):
+    logger = mocker.patch(f"{MODULE}.get_run_logger").return_value
+    p = person_processor({("J Smith", "rapid"): 1})
+    next(p)
+    p.send((PreMongoPerson(name="J Smith", role="jockey"), "rapid"))
+    p.send((PreMongoPerson(name="Tom Jones", role="jockey"), "rapid"))
+    p.close()
+
+    logger.info.assert_called_with("Person cache hit rate 50.0% (1/2)")
@@ -0,0 +1,94 @@
+import mongomock
+import pytest
+from pymongo import UpdateOne
+
+from clients.mongo_client import HorseCache
+from models import PreMongoHorse
+from processors.ratings_processor import make_ratings_update, ratings_processor
+
+MODULE = "processors.ratings_processor"
+
+
+@pytest.fixture
+def mock_horses(mocker):
+    db = mongomock.MongoClient().handykapp
+    mocker.patch("clients.mongo_client.db", db)
+    mocker.patch("clients.mongo_client.horse_cache", HorseCache())
+    mocker.patch(f"{MODULE}.db", db)
+    mocker.patch(f"{MODULE}.horse_cache", HorseCache())
+    mocker.patch(f"{MODULE}.get_run_logger")
+    db.horses.insert_many(
+        [
+            {"_id": 1, "name": "DOBBIN", "country": "IRE", "year": 2020},
+            {"_id": 2, "name": "NEDDY", "country": "GB", "year": 2019},
+        ]
+    )
+    return db
+
+
+def make_horse(name, country, year, flat=None):
+    return PreMongoHorse(
+        name=name,
+        country=country,
+        year=year,
+        ratings={"flat": flat, "aw": None, "chase": None, "hurdle": None},
+    )
+
+
+def test_ratings_processor_resolves_horses_in_batches(mock_horses, mocker):
+    spy = mocker.spy(mock_horses.horses, "find")
+    mocker.patch.object(mock_horses.horses, "bulk_write")
+    r = ratings_processor(batch_size=3)
+    next(r)
+    r.send(make_horse("DOBBIN", "IRE", 2020, 80))
+    r.send(make_horse("NEDDY", "GB", 2019, 70))
+    r.send(make_horse("UNKNOWN", "GB", 2019, 60))
+    r.close()
+
+    # One query per lookup strategy, whatever the batch size
+    assert spy.call_count == 3
+
+
+def test_ratings_processor_writes_unordered_in_bulk(mock_horses, mocker):
+    bulk_write = mocker.patch.object(mock_horses.horses, "bulk_write")
+    dobbin = make_horse("DOBBIN", "IRE", 2020, 80)
+    neddy = make_horse("NEDDY", "GB", 2019, 70)
+    r = ratings_processor()
+    next(r)
+    r.send(dobbin)
+    r.send(make_horse("UNKNOWN", "GB", 2019, 60))
+    r.send(neddy)
+    r.close()
+
+    bulk_write.assert_called_once_with(
+        [make_ratings_update(1, dobbin), make_ratings_update(2, neddy)],
+        ordered=False,
+    )
+
+
+def test_make_ratings_update_sets_ratings():
+    actual = make_ratings_update(1, make_horse("DOBBIN", "IRE", 2020, 80))
+    assert actual == UpdateOne(
+        {"_id": 1},
+        {"$set": {"ratings": {"flat": 80, "aw": None, "chase": None, "hurdle": None}}},
+    )
+
+
+def test_ratings_processor_skips_horses_that_fail(mock_horses, mocker):
+    bulk_write = mocker.patch.object(mock_horses.horses, "bulk_write")
+    mocker.patch(f"{MODULE}.get_horses", side_effect=RuntimeError("timed out"))
+
+    def get_horse(horse):
+        if horse.name != "DOBBIN":
+            raise ValueError("bad row")
+        return {"_id": 1}
+
+    mocker.patch(f"{MODULE}.get_horse", side_effect=get_horse)
+    dobbin = make_horse("DOBBIN", "IRE", 2020, 80)
+    r = ratings_processor()
+    next(r)
+    r.send(make_horse("NEDDY", "GB", 2019, 70))
+    r.send(dobbin)
+    r.close()
+
+    bulk_write.assert_called_once_with([make_ratings_update(1, dobbin)], ordered=False)
@@ -0,0 +1,123 @@
+from time import sleep
+from types import SimpleNamespace
+
+import pytest
+
+from helpers.metrics import metrics
+from processors.record_processor import record_processor, transform_records
+
+
+@pytest.fixture
+def sent_races(mocker):
+    races = []
+
+    def mock_race_processor():
+        while True:
+            races.append((yield))
+
+    mocker.patch("processors.record_processor.get_run_logger")
+    mocker.patch(
+        "processors.record_processor.race_processor", side_effect=mock_race_processor
+    )
+    return races
+
+
+def make_race(title, code="Flat"):
+    return SimpleNamespace(title=title, code=code, datetime=None, course=None)
+
+
+def slow_transformer(record):
+    delay, titles = record
+    sleep(delay)
+    return [make_race(title) for title in titles]
+
+
+@metrics.timed("transform.test")
+def timed_transformer(record):
+    return [make_race(record)]
+
+
+def test_record_processor_forwards_races_in_submission_order(sent_races):
+    r = record_processor(max_workers=3, max_in_flight=3)
+    next(r)
+    r.send(((0.05, ["first"]), slow_transformer, "a.json", "rapid"))
+    r.send(((0.02, ["second", "third"]), slow_transformer, "b.json", "rapid"))
+    r.send(((0, ["fourth"]), slow_transformer, "c.json", "rapid"))
+    r.close()
+
+    assert [race.title for race, _ in sent_races] == [
+        "first",
+        "second",
+        "third",
+        "fourth",
+    ]
+
+
+def test_record_processor_waits_once_window_is_full(sent_races):
+    r = record_processor(max_workers=2, max_in_flight=2)
+    next(r)
+    r.send(((0, ["first"]), slow_transformer, "a.json", "rapid"))
+    assert sent_races == []
+
+    r.send(((0, ["second"]), slow_transformer, "b.json", "rapid"))
+    assert [race.title for race, _ in sent_races] == ["first"]
+    r.close()
+
+
+def test_record_processor_skips_failed_transforms_and_other_codes(sent_races):
+    def transformer(record):
+        if record == "bad":
+            raise ValueError(record)
+        return [make_race("flat"), make_race("jumps", code="National Hunt")]
+
+    r = record_processor()
+    next(r)
+    r.send(("bad", transformer, "a.json", "rapid"))
+    r.send(("good", transformer, "b.json", "rapid"))
+    r.close()
+
+    assert [(race.title, source) for race, source in sent_races] == [("flat", "rapid")]
+
+
+def test_record_processor_transforms_in_worker_processes(sent_races):
+    r = record_processor(max_workers=2, max_in_flight=2, processes=True, chunksize=2)
+    next(r)
+    for i in range(5):
+        r.send(((0.01 * (5 - i), [f"race {i}"]), slow_transformer, "a.json", "rapid"))
+    r.close()
+
+    assert [race.title for race, _ in sent_races] == [f"race {i}" for i in range(5)]
+
+
+def test_record_processor_rejects_chunks_that_fail_in_the_pool(sent_races):
+    r = record_processor(max_workers=1, processes=True)
+    next(r)
+    # Local functions cannot be pickled to send to a worker process
+    r.send(("bad", lambda record: [make_race(record)], "a.json", "rapid"))
+    r.send(((0, ["good"]), slow_transformer, "b.json", "rapid"))
+    r.close()
+
+    assert [race.title for race, _ in sent_races] == ["good"]
+
+
+def test_record_processor_keeps_timings_taken_in_worker_processes(sent_races):
+    metrics.reset()
+    r = record_processor(max_workers=2, processes=True, chunksize=2)
+    next(r)
+    for i in range(5):
+        r.send((f"race {i}", timed_transformer, "a.json", "rapid"))
+    r.close()
+
+    assert metrics.stages["transform.test"]["calls"] == 5
+
+
+def test_transform_records_returns_errors_in_place():
+    def transformer(record):
+        if record == "bad":
+            raise ValueError("Unreadable")
+        return [record]
+
+    assert transform_records([("good", transformer), ("bad", transformer)]) == [
+        (["good"], None),
+        (None, "Unreadable"),
+    ]
@@ -0,0 +1,133 @@
+from datetime import datetime
+
+import mongomock
+import pytest
+from pymongo import UpdateOne
+
+from models import FormdataRun
+from processors.formdata_processors.result_line_processor import (
+    make_day_range,
+    make_result_update,
+    result_line_processor,
+)
+
+MODULE = "processors.formdata_processors.result_line_processor"
+
+
+def test_make_day_range():
+    assert make_day_range("2023-05-01") == {
+        "$gte": datetime(2023, 5, 1),
+        "$lt": datetime(2023, 5, 2),
+    }
+
+
+def test_make_day_range_spans_month_end():
+    assert make_day_range("2023-12-31")["$lt"] == datetime(2024, 1, 1)
+
+
+def test_make_day_range_matches_races_on_that_day_only():
+    races = mongomock.MongoClient().handykapp.races
+    races.insert_many(
+        [
+            {"_id": 1, "datetime": datetime(2023, 4, 30, 23, 59)},
+            {"_id": 2, "datetime": datetime(2023, 5, 1)},
+            {"_id": 3, "datetime": datetime(2023, 5, 1, 20, 30)},
+            {"_id": 4, "datetime": datetime(2023, 5, 2)},
+        ]
+    )
+    actual = races.find({"datetime": make_day_range("2023-05-01")})
+    assert [race["_id"] for race in actual] == [2, 3]
+
+
+@pytest.fixture
+def mock_races(mocker):
+    db = mongomock.MongoClient().handykapp
+    mocker.patch(f"{MODULE}.db", db)
+    mocker.patch(f"{MODULE}.get_run_logger")
+    mocker.patch(
+        f"{MODULE}.rr_code_to_course_dict",
+        return_value={("Kem", "AW"): "kempton", ("Kem", "Turf"): "kempton_turf"},
+    )
+    db.races.insert_many(
+        [
+            {
+                "_id": "race_1",
+                "racecourse": "kempton",
+                "datetime": datetime(2023, 5, 1, 14, 0),
+                "runners": [{"horse": "dobbin"}, {"horse": "muddy"}],
+            },
+            {
+                "_id": "race_2",
+                "racecourse": "kempton",
+                "datetime": datetime(2023, 5, 1, 15, 0),
+                "runners": [{"horse": "neddy"}],
+            },
+        ]
+    )
+    return db
+
+
+def make_run(**kwargs):
+    return FormdataRun(
+        **{
+            "date": "2023-05-01",
+            "race_type": "H",
+            "win_prize": "5",
+            "course": "Kem",
+            "number_of_runners": 8,
+            "weight": "9-0",
+            "jockey": "Jockey",
+            "position": "1",
+            "distance": 8,
+            "going": "g",
+            "time_rating": 50,
+            "form_rating": 60,
+        }
+        | kwargs
+    )
+
+
+def test_result_line_processor_writes_results_in_bulk(mock_races, mocker):
+    spy = mocker.spy(mock_races.races, "find")
+    bulk_write = mocker.patch.object(mock_races.races, "bulk_write")
+    rl = result_line_processor(batch_size=10)
+    next(rl)
+    rl.send(({"_id": "dobbin"}, make_run()))
+    rl.send(({"_id": "neddy"}, make_run(position="2")))
+    rl.send(({"_id": "unknown"}, make_run()))
+    rl.close()
+
+    assert spy.call_count == 1
+    bulk_write.assert_called_once_with(
+        [
+            make_result_update("race_1", "dobbin", make_run()),
+            make_result_update("race_2", "neddy", make_run(position="2")),
+        ],
+        ordered=False,
+    )
+
+
+def test_make_result_update_sets_runner_result():
+    actual = make_result_update("race_1", "dobbin", make_run(going="G"))
+    assert actual == UpdateOne(
+        {"_id": "race_1", "runners.horse": "dobbin"},
+        {
+            "$set": {
+                "going_assessment": "Good",
+                "runners.$.finishing_position": "1",
+                "runners.$.beaten_distance": None,
+                "runners.$.ratings.rr_time": 50,
+                "runners.$.ratings.rr_form": 60,
+            }
+        },
+    )
+
+
+def test_result_line_processor_skips_unknown_racecourses(mock_races, mocker):
+    spy = mocker.spy(mock_races.races, "find")
+    rl = result_line_processor()
+    next(rl)
+    rl.send(({"_id": "dobbin"}, make_run(course="Xxx")))
+    rl.close()
+
+    assert spy.call_count == 0
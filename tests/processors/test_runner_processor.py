@@ -0,0 +1,179 @@
+import mongomock
+import pytest
+from bson import ObjectId
+
+from clients.mongo_client import HorseCache
+from models import PreMongoRunner
+from processors.horse_processor import HorseStaging, horse_processor
+from processors.runner_processor import (
+    preload_window_people,
+    relink_runners,
+    resolved_runner_processor,
+    runner_processor,
+)
+
+MODULE = "processors.runner_processor"
+
+
+@pytest.fixture
+def mock_stores(mocker):
+    db = mongomock.MongoClient().handykapp
+    mocker.patch("clients.mongo_client.db", db)
+    mocker.patch("clients.mongo_client.horse_cache", HorseCache())
+    mocker.patch("processors.horse_processor.db", db)
+    mocker.patch("processors.horse_processor.get_run_logger")
+    mocker.patch(f"{MODULE}.db", db)
+    mocker.patch(f"{MODULE}.get_run_logger")
+    return db
+
+
+@pytest.fixture
+def mock_db(mock_stores, mocker):
+    mocker.patch(f"{MODULE}.person_processor")
+    return mock_stores
+
+
+def test_relink_runners_replaces_and_drops_horses():
+    kept, replaced, dropped, new = ObjectId(), ObjectId(), ObjectId(), ObjectId()
+    race_updates = {1: [{"horse": kept}, {"horse": replaced}, {"horse": dropped}]}
+
+    relink_runners({replaced: new, dropped: None}, race_updates)
+
+    assert race_updates == {1: [{"horse": kept}, {"horse": new}]}
+
+
+def test_runner_writes_horse_staged_by_horse_processor_before_race(mock_db, mocker):
+    flush_races = mocker.patch(f"{MODULE}.flush_races")
+    flush_races.side_effect = lambda *_: stored.extend(mock_db.horses.find())
+    stored: list[dict] = []
+    runner = PreMongoRunner(name="NEDDY", country="GB", year=2019, saddlecloth=1)
+    staging = HorseStaging()
+
+    h = horse_processor(staging)
+    next(h)
+    h.send(PreMongoRunner(name="NEDDY", country="GB", year=2019))
+    r = resolved_runner_processor({}, staging)
+    next(r)
+    r.send([(runner, "race", "rapid", None)])
+    r.close()
+
+    [neddy] = stored
+    race_updates, _ = flush_races.call_args.args
+    assert race_updates == {"race": [{"horse": neddy["_id"], "saddlecloth": 1}]}
+    h.close()
+
+
+def test_runner_relinks_horse_horse_processor_found_was_duplicate(mock_db, mocker):
+    flush_races = mocker.patch(f"{MODULE}.flush_races")
+    mock_db.horses.create_index([("name", 1), ("country", 1), ("year", 1)], unique=True)
+    runner = PreMongoRunner(name="NEDDY", country="GB", year=2019)
+    staging = HorseStaging()
+    staging.stage_insert(runner)
+
+    r = resolved_runner_processor({}, staging)
+    next(r)
+    r.send([(runner, "race", "rapid", None)])
+    # Stored elsewhere before the staged horse was written
+    mock_db.horses.insert_one(
+        {"_id": 1, "name": "NEDDY", "country": "GB", "year": 2019}
+    )
+    r.close()
+
+    race_updates, _ = flush_races.call_args.args
+    assert race_updates == {"race": [{"horse": 1}]}
+
+
+def test_runner_seen_twice_in_a_window_is_not_flushed_between(mock_db, mocker):
+    mocker.patch(f"{MODULE}.flush_races")
+    mock_db.horses.create_index([("name", 1), ("country", 1), ("year", 1)], unique=True)
+    # Staging would be flushed after every horse, were it not for the window
+    staging = HorseStaging(threshold=1)
+
+    r = runner_processor(staging)
+    next(r)
+    r.send((PreMongoRunner(name="MARQUIN", country="GB", year=2015), "1", "rapid"))
+    r.send(
+        (
+            PreMongoRunner(name="MARQUIN", country="GB", year=2015, colour="Bay"),
+            "2",
+            "theracingapi",
+        )
+    )
+    r.close()
+
+    [marquin] = mock_db.horses.find()
+    assert marquin["colour"] == "Bay"
+
+
+def test_runner_embeds_ids_sent_back_by_person_processor(mock_db, mocker):
+    flush_races = mocker.patch(f"{MODULE}.flush_races")
+    person_ids = {"J Smith": ObjectId(), "T Jones": ObjectId()}
+    person_gen = mocker.patch(f"{MODULE}.person_processor").return_value
+    person_gen.send.side_effect = lambda item: person_ids[item[0].name]
+    runner = PreMongoRunner(name="NEDDY", jockey="J Smith", trainer="T Jones")
+
+    r = resolved_runner_processor({}, HorseStaging())
+    next(r)
+    r.send([(runner, "race", "rapid", None)])
+    r.close()
+
+    race_updates, _ = flush_races.call_args.args
+    [neddy] = mock_db.horses.find()
+    assert race_updates == {
+        "race": [
+            {
+                "horse": neddy["_id"],
+                "jockey": person_ids["J Smith"],
+                "trainer": person_ids["T Jones"],
+            }
+        ]
+    }
+
+
+def test_runner_embeds_people_cached_found_and_inserted(mock_stores, mocker):
+    flush_races = mocker.patch(f"{MODULE}.flush_races")
+    mocker.patch("processors.person_processor.db", mock_stores)
+    mocker.patch("processors.person_processor.get_run_logger")
+    mock_stores.people.insert_one(
+        {"_id": 1, "first": "Tom", "last": "Jones", "title": ""}
+    )
+    runners = [
+        PreMongoRunner(name="ALPHA", jockey="J Smith", trainer="T Jones"),
+        PreMongoRunner(name="BRAVO", jockey="J Doe", trainer="T Jones"),
+    ]
+
+    # J Smith is cached, T Jones is found in the db and J Doe is inserted
+    r = resolved_runner_processor({("J Smith", "rapid"): 2}, HorseStaging())
+    next(r)
+    for runner in runners:
+        r.send([(runner, "race", "rapid", None)])
+    r.close()
+
+    [alpha, bravo] = flush_races.call_args.args[0]["race"]
+    j_doe = mock_stores.people.find_one({"last": "Doe"})["_id"]
+    assert (alpha["jockey"], alpha["trainer"]) == (2, 1)
+    assert (bravo["jockey"], bravo["trainer"]) == (j_doe, 1)
+
+
+def test_preload_window_people_caches_only_uncached_people(mocker):
+    preload = mocker.patch(f"{MODULE}.preload_person_cache")
+    preload.side_effect = lambda names, source: {(name, source): 9 for name in names}
+    window = [
+        (PreMongoRunner(name="ALPHA", jockey="J Smith", trainer="T Jones"), 1, "rapid"),
+        (PreMongoRunner(name="BRAVO", jockey="J Doe", trainer="T Jones"), 1, "rapid"),
+        (PreMongoRunner(name="CHARLIE", jockey="J Smith"), 2, "theracingapi"),
+    ]
+    person_cache = {("T Jones", "rapid"): 1}
+
+    preload_window_people(window, person_cache)
+
+    assert preload.call_args_list == [
+        mocker.call({"J Smith", "J Doe"}, "rapid"),
+        mocker.call({"J Smith"}, "theracingapi"),
+    ]
+    assert person_cache == {
+        ("T Jones", "rapid"): 1,
+        ("J Smith", "rapid"): 9,
+        ("J Doe", "rapid"): 9,
+        ("J Smith", "theracingapi"): 9,
+    }
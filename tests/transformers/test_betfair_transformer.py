@@ -2,6 +2,7 @@ import pendulum
 import pytest
 
 from src.transformers.betfair_transformer import (
+    fill_race_descriptions,
     get_places_from_place_detail,
     transform_betfair_pnl_data,
     validate_betfair_pnl_data,
@@ -50,3 +51,35 @@ def test_validate_betfair_pnl_data_returns_problems_for_incorrect_data(mock_data
     problems = validate_betfair_pnl_data.fn(mock_data)
     assert len(problems.dicts()) == 1
     assert problems.dicts()[0]["field"] == "Profit/Loss (£)"
+
+
+def test_transform_betfair_pnl_data_fills_place_market_descriptions(mock_data):
+    market = "Horse Racing / Brighton 30th Apr"
+    mock_data.insert(
+        1, [f"{market} : 3 TBP", "30-Apr-24 16:10", "30-Apr-24 16:13", "-5.00"]
+    )
+    mock_data.append(
+        [f"{market} : 2 TBP", "30-Apr-24 16:40", "30-Apr-24 16:43", "2.00"]
+    )
+
+    actual = transform_betfair_pnl_data.fn(mock_data)
+
+    assert [(x.places, x.race_description) for x in actual] == [
+        (3, "1m2f Hcap"),
+        (1, "1m2f Hcap"),
+        (2, None),
+    ]
+
+
+def test_fill_race_descriptions_reads_records_once():
+    records = iter(
+        [
+            {"race_datetime": 1, "race_description": None},
+            {"race_datetime": 1, "race_description": "5f Mdn"},
+            {"race_datetime": 1, "race_description": "6f Hcap"},
+        ]
+    )
+
+    actual = fill_race_descriptions(records)
+
+    assert [x["race_description"] for x in actual] == ["5f Mdn", "5f Mdn", "6f Hcap"]
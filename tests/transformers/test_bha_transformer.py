@@ -9,7 +9,6 @@ from models import BHARatingsRecord, PreMongoHorse
 from models.bha_perf_figs_record import BHAPerfFigsRecord
 from src.loaders.bha_loader import (
     convert_header_to_field_name,
-    csv_row_to_dict,
     get_csv,
     read_csv,
 )
@@ -37,7 +36,7 @@ def mock_perf_figs_data(date):
         ]
     ]
     header = [convert_header_to_field_name(col) for col in rows[0]]
-    row_dict = csv_row_to_dict(header, rows[1])
+    row_dict = dict(zip(header, rows[1]))
     row_dict["date"] = date
     return BHAPerfFigsRecord(**row_dict)
 
@@ -52,7 +51,7 @@ def mock_ratings_data():
         ]
     ]
     header = [convert_header_to_field_name(col) for col in rows[0]]
-    row_dict = csv_row_to_dict(header, rows[1])
+    row_dict = dict(zip(header, rows[1]))
     now = pendulum.now()
     row_dict["date"] = datetime.date(now.year, now.month, now.day)
     return BHARatingsRecord(**row_dict)
@@ -0,0 +1,45 @@
+import petl
+import pytest
+
+from helpers import convert_fields
+
+
+def petl_convert(row: dict, converters: dict) -> dict:
+    [converted] = petl.dicts(petl.convert(petl.fromdicts([row]), converters))
+    return dict(converted)
+
+
+def test_convert_fields_converts_named_fields_in_place():
+    row = {"age": "3", "weight": "9-7", "name": "NEDDY"}
+
+    actual = convert_fields(row, {"age": int, "weight": lambda x: x.replace("-", "st")})
+
+    assert actual is row
+    assert row == {"age": 3, "weight": "9st7", "name": "NEDDY"}
+
+
+def test_convert_fields_does_not_raise_when_conversion_fails():
+    row = {"age": "three", "draw": "4"}
+
+    actual = convert_fields(row, {"age": int, "draw": int})
+
+    assert actual == {"age": None, "draw": 4}
+
+
+@pytest.mark.parametrize(
+    ("value", "converter"),
+    [
+        ("3", int),
+        ("three", int),
+        (None, int),
+        ("", float),
+        (None, lambda x: x.upper()),
+        ("9-7", lambda x: int(x.split("-")[2])),
+        ("1.5", float),
+    ],
+)
+def test_convert_fields_matches_petl_convert(value, converter):
+    row = {"field": value, "other": "unchanged"}
+    expected = petl_convert(row, {"field": converter})
+
+    assert convert_fields(dict(row), {"field": converter}) == expected
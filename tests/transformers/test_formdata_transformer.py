@@ -1,9 +1,18 @@
 import pendulum
+import pytest
 from horsetalk import RacingCode
 
-from models import FormdataRecord, FormdataRunner, PreMongoRace, PreMongoRunner
+from models import (
+    FormdataRecord,
+    FormdataRun,
+    FormdataRunner,
+    PreMongoRace,
+    PreMongoRunner,
+)
 from transformers.formdata_transformer import (
+    RunLine,
     adjust_rr_name,
+    create_run,
     extract_dist_going,
     extract_grade,
     extract_middle_details,
@@ -14,6 +23,7 @@ from transformers.formdata_transformer import (
     get_formdatas,
     is_horse,
     is_race_date,
+    tokenize_run_line,
     transform_horse,
     transform_races,
 )
@@ -66,6 +76,61 @@ def test_adjust_rr_name_when_scottish():
     assert adjust_rr_name("JMcSmith") == "J McSmith"
 
 
+def test_create_run_with_conjoined_prize_and_weight(mocker):
+    mocker.patch("transformers.formdata_transformer.get_run_logger")
+    words = ["10Jun23", "2CG1156", "Asc", "8", "9-13t3RyanSexton", "3", "1.5"]
+    expected = FormdataRun(
+        date="2023-06-10",
+        race_type="2CG",
+        win_prize="1156",
+        course="Asc",
+        number_of_runners=8,
+        weight="9-13",
+        headgear="t",
+        allowance=3,
+        jockey="RyanSexton",
+        position="3",
+        beaten_distance=1.5,
+        time_rating=115,
+        distance=6.0,
+        going="G",
+        form_rating=120,
+    )
+
+    assert create_run([*words, "115", "6G", "120", ""]) == expected
+
+
+def test_create_run_with_flat_non_finisher(mocker):
+    mocker.patch("transformers.formdata_transformer.get_run_logger")
+    words = ["10Jun23", "2CG", "1156", "Asc", "8", "9-13", "JFanning", "p"]
+    expected = FormdataRun(
+        date="2023-06-10",
+        race_type="2CG",
+        win_prize="1156",
+        course="Asc",
+        number_of_runners=8,
+        weight="9-13",
+        headgear=None,
+        allowance=0,
+        jockey="JFanning",
+        position="p",
+        beaten_distance=None,
+        time_rating=None,
+        distance=6.0,
+        going="G",
+        form_rating=None,
+    )
+
+    assert create_run([*words, "p19", "6G", "-"]) == expected
+
+
+def test_create_run_returns_none_when_dist_going_invalid(mocker):
+    mocker.patch("transformers.formdata_transformer.get_run_logger")
+    words = ["10Jun23", "2CG", "1156", "Asc", "8", "9-13", "JFanning", "3", "1.5"]
+
+    assert create_run([*words, "115", "X9", "120"]) is None
+
+
 def test_extract_dist_going_for_turf_going():
     assert extract_dist_going("5G") == (float("5"), "G")
 
@@ -321,6 +386,120 @@ def test_is_race_date_false_with_non_date():
     assert not is_race_date("JMitchell")
 
 
+def test_tokenize_run_line_when_words_insufficiently_split():
+    words = ["10Jun23", "2CG 1156 Asc 8", "9-13", "JFanning", "3", "1.5"]
+    expected = RunLine(
+        "10Jun23",
+        "2CG",
+        "1156",
+        "Asc",
+        "8",
+        "9-13",
+        "JFanning3",
+        "1.5",
+        "115",
+        "6G",
+        "120",
+    )
+
+    assert tokenize_run_line([*words, "115", "6G", "120"]) == expected
+
+
+def test_tokenize_run_line_when_finish_conjoined_with_asterisk():
+    words = ["10Jun23", "3H", "4500", "Asc", "8", "10-0", "JFanning", "2p3*1.5"]
+    expected = RunLine(
+        "10Jun23",
+        "3H",
+        "4500",
+        "Asc",
+        "8",
+        "10-0",
+        "JFanning2p3",
+        "-1.5",
+        "115",
+        "6G",
+        "120",
+    )
+
+    assert tokenize_run_line([*words, "115", "6G", "120"]) == expected
+
+
+def test_tokenize_run_line_when_finish_conjoined_with_distance():
+    words = ["10Jun23", "3H", "4500", "Asc", "8", "10-0", "JFanning", "2p31.5"]
+    expected = RunLine(
+        "10Jun23",
+        "3H",
+        "4500",
+        "Asc",
+        "8",
+        "10-0",
+        "JFanning2p3",
+        "-1.5",
+        "115",
+        "6G",
+        "120",
+    )
+
+    assert tokenize_run_line([*words, "115", "6G", "120"]) == expected
+
+
+def test_tokenize_run_line_when_jump_non_finisher_split():
+    words = ["10Jun23", "3H", "4500", "Asc", "8", "10-0", "JFanning", "n", "b"]
+    expected = RunLine(
+        "10Jun23", "3H", "4500", "Asc", "8", "10-0", "JFanningnb", "nb", "-", "6G", "-"
+    )
+
+    assert tokenize_run_line([*words, "-", "6G", "-"]) == expected
+
+
+@pytest.mark.parametrize(
+    ("details", "expected"),
+    [
+        (
+            ["n", "b", "-", "6G", "-"],
+            ("JFanningnb", "nb", "-", "6G", "-"),
+        ),
+        (
+            ["pu", "n", "b", "6G", "-"],
+            ("JFanningpu", "pu", "nb", "6G", "-"),
+        ),
+        (
+            ["pu", "-", "n", "b", "-"],
+            ("JFanningpu", "pu", "-", "nb", "-"),
+        ),
+        (
+            ["pu", "-", "6G", "n", "b"],
+            ("JFanningpu", "pu", "-", "6G", "nb"),
+        ),
+    ],
+)
+def test_tokenize_run_line_when_jump_non_finisher_split_at_each_position(
+    details, expected
+):
+    words = ["10Jun23", "3H", "4500", "Asc", "8", "10-0", "JFanning", *details]
+
+    assert tokenize_run_line(words)[6:] == expected
+
+
+def test_tokenize_run_line_applies_fixups():
+    words = ["10Jun23", "2CG 1156 Asc 8", "9-13", "b", "RHavlin", "p", "p12"]
+    expected = RunLine(
+        "10Jun23",
+        "2CG",
+        "1156",
+        "Asc",
+        "8",
+        "9-13",
+        "bRHavlinp",
+        "",
+        "p12",
+        "16d",
+        "p12",
+    )
+
+    assert tokenize_run_line(words) == expected
+
+
 def test_transform_horse_returns_correct_output():
     data = FormdataRunner(
         **{